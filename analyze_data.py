@@ -1,14 +1,15 @@
-import requests
 import sqlite3
 from urllib.parse import quote
 from datetime import datetime, timedelta
 import xml.etree.ElementTree as ET
-from dotenv import load_dotenv
 import os
 import time
+from module_database import record_ingest_batch
+from module_sketch import merge_batch_sketches, new_batch_entries, refresh_day_sketches
+from module_watchlist import ENTRY_COLUMNS, TABLE_KEYS, tag_log_entries
+from module_utility import configure_logging
 import re
-
-load_dotenv()
+import argparse
 
 def create_connection(db_file):
     """Create a database connection to a SQLite database specified by db_file"""
@@ -61,7 +62,111 @@ def insert_globalprotect_log(conn, log_entry):
     cur.execute(sql, log_entry)
     conn.commit()
 
+# Log type -> (table, insert columns, conflict key). Used by the bulk load path,
+# which stages rows into an unindexed side database and merges them in one go.
+LOG_TABLES = {
+    'traffic': ('TrafficLogs', ENTRY_COLUMNS['TrafficLogs'], TABLE_KEYS['TrafficLogs']),
+    'threat': ('ThreatLogs', ENTRY_COLUMNS['ThreatLogs'], TABLE_KEYS['ThreatLogs']),
+    'globalprotect': ('GlobalProtectLogs', ENTRY_COLUMNS['GlobalProtectLogs'], TABLE_KEYS['GlobalProtectLogs']),
+}
+
+DB_FILE = "panorama_logs.db"
+BULK_STAGING_DB = "panorama_bulk_staging.db"
+
+def attach_bulk_staging(conn, log_type, staging_db=BULK_STAGING_DB):
+    """Attach the staging database used by bulk loads and make sure its tables exist.
+
+    Staged rows and the BulkLoadState marker live in a separate file written with
+    synchronous=OFF, so relaxed durability can never damage the real log tables;
+    at worst an interrupted staging file is discarded and the load restarted.
+    """
+    table, columns, _ = LOG_TABLES[log_type]
+    conn.execute("ATTACH DATABASE ? AS staging", (staging_db,))
+    conn.execute("PRAGMA staging.synchronous = OFF")
+    conn.execute("PRAGMA staging.journal_mode = MEMORY")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS staging.{table} ({', '.join(columns)})")
+    conn.execute("""CREATE TABLE IF NOT EXISTS staging.BulkLoadState (
+                        log_type TEXT PRIMARY KEY,
+                        start_time TEXT NOT NULL,
+                        end_time TEXT NOT NULL,
+                        last_completed TEXT NOT NULL
+                    )""")
+    conn.commit()
+
+def get_bulk_load_state():
+    """Return (log_type, start_time, end_time, last_completed) of an unfinished bulk load, or None."""
+    if not os.path.exists(BULK_STAGING_DB):
+        return None
+    marker = sqlite3.connect(BULK_STAGING_DB)
+    try:
+        return marker.execute("SELECT log_type, start_time, end_time, last_completed FROM BulkLoadState").fetchone()
+    except sqlite3.Error:
+        return None
+    finally:
+        marker.close()
+
+def stage_log_entries(conn, log_type, log_entries, start_time, end_time, completed_through):
+    """Append a batch of prepared entries to the staging table and advance the marker in the same transaction."""
+    table, columns, _ = LOG_TABLES[log_type]
+    placeholders = ",".join("?" * len(columns))
+    conn.executemany(f"INSERT INTO staging.{table} VALUES({placeholders})", log_entries)
+    conn.execute("""INSERT INTO staging.BulkLoadState(log_type, start_time, end_time, last_completed)
+                    VALUES(?,?,?,?)
+                    ON CONFLICT(log_type) DO UPDATE SET last_completed=excluded.last_completed""",
+                 (log_type, start_time, end_time, completed_through))
+    conn.commit()
+
+def merge_bulk_load(conn, log_type):
+    """Merge staged rows into the real table, rebuilding its secondary indexes once.
+
+    Dropping the indexes, the merge and the index rebuild share one transaction,
+    so an interruption leaves the real table untouched and the merge can simply
+    be re-run from the still-present staging data.
+    """
+    table, columns, conflict_columns = LOG_TABLES[log_type]
+    column_list = ", ".join(columns)
+    updates = ", ".join(f"{column}=excluded.{column}" for column in columns if column not in conflict_columns)
+    indexes = conn.execute(
+        "SELECT name, sql FROM main.sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,)).fetchall()
+
+    conn.execute("BEGIN")
+    try:
+        for name, _ in indexes:
+            conn.execute(f"DROP INDEX main.{name}")
+        conn.execute(f"""INSERT INTO main.{table}({column_list})
+                         SELECT {column_list} FROM staging.{table}
+                         WHERE true
+                         ORDER BY {", ".join(conflict_columns)}
+                         ON CONFLICT({", ".join(conflict_columns)}) DO UPDATE SET {updates}""")
+        for _, sql in indexes:
+            conn.execute(sql)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+    span = conn.execute(f"SELECT MIN(Time_Generated), MAX(Time_Generated) FROM staging.{table}").fetchone()
+    if span[0] is not None:
+        record_ingest_batch(conn, table, span[0], span[1])
+        # A backfill rewrites whole days, so their sketches are rebuilt from the table
+        refresh_day_sketches(conn, table, span[0], span[1])
+        # A backfill can span months; rescore_table scores it one day at a time
+        from module_scoring import rescore_table
+        rescore_table(conn, DB_FILE, table, span[0], span[1])
+    conn.execute(f"DELETE FROM staging.{table}")
+    conn.execute("DELETE FROM staging.BulkLoadState WHERE log_type = ?", (log_type,))
+    conn.commit()
+    conn.execute("DETACH DATABASE staging")
+    os.remove(BULK_STAGING_DB)
+
+def discard_bulk_load():
+    """Throw away an unfinished bulk load."""
+    if os.path.exists(BULK_STAGING_DB):
+        os.remove(BULK_STAGING_DB)
+
 def initiate_log_query(conn, log_type, start_time, end_time):
+    import requests
     PANORAMA_HOST = os.getenv('PANORAMA_ENDPOINT')
     API_KEY = os.getenv('PANORAMA_API_KEY')
     query_url = f"https://{PANORAMA_HOST}/api/?type=log&log-type={log_type}&key={quote(API_KEY)}&query=(time_generated geq '{start_time}') and (time_generated leq '{end_time}')&nlogs=5000"
@@ -75,6 +180,7 @@ def initiate_log_query(conn, log_type, start_time, end_time):
         return None
 
 def check_job_status(conn, job_id):
+    import requests
     PANORAMA_HOST = os.getenv('PANORAMA_ENDPOINT')
     API_KEY = os.getenv('PANORAMA_API_KEY')
     status_url = f"https://{PANORAMA_HOST}/api/?type=log&action=get&job-id={job_id}&key={quote(API_KEY)}"
@@ -91,22 +197,42 @@ def check_job_status(conn, job_id):
             print("Failed to check job status:", response.text)
             return False
 
-def fetch_and_process_logs(conn, log_type, job_id):
+def fetch_log_entries(log_type, job_id):
+    """Fetch a finished job's entries and return them prepared for insertion."""
+    import requests
     logs_url = f"https://{os.getenv('PANORAMA_ENDPOINT')}/api/?type=log&action=get&job-id={job_id}&key={quote(os.getenv('PANORAMA_API_KEY'))}"
     response = requests.get(logs_url, verify=True)
-    if response.status_code == 200:
-        root = ET.fromstring(response.text)
-        entries = root.findall('.//entry')
-        for entry in entries:
-            if log_type == "traffic":
-                log_entry = prepare_traffic_log_entry(entry)
-                insert_traffic_log(conn, log_entry)
-            elif log_type == "threat":
-                log_entry = prepare_threat_log_entry(entry)
-                insert_threat_log(conn, log_entry)
-            elif log_type == "globalprotect":
-                log_entry = prepare_globalprotect_log_entry(entry)
-                insert_globalprotect_log(conn, log_entry)
+    if response.status_code != 200:
+        print(f"Failed to fetch logs: {response.status_code}, Response: {response.text}")
+        return None
+    prepare = {
+        'traffic': prepare_traffic_log_entry,
+        'threat': prepare_threat_log_entry,
+        'globalprotect': prepare_globalprotect_log_entry,
+    }[log_type]
+    # Tag watchlist hits while the rows are still in memory
+    return tag_log_entries(LOG_TABLES[log_type][0], [prepare(entry) for entry in ET.fromstring(response.text).findall('.//entry')])
+
+def fetch_and_process_logs(conn, log_type, job_id):
+    """Fetch a finished job's entries and insert them; returns False if the fetch failed."""
+    log_entries = fetch_log_entries(log_type, job_id)
+    if log_entries is None:
+        return False
+    table = LOG_TABLES[log_type][0]
+    fresh_entries = new_batch_entries(conn, table, log_entries)
+    times = []
+    for log_entry in log_entries:
+        if log_type == "traffic":
+            insert_traffic_log(conn, log_entry)
+        elif log_type == "threat":
+            insert_threat_log(conn, log_entry)
+        elif log_type == "globalprotect":
+            insert_globalprotect_log(conn, log_entry)
+        times.append(log_entry[0])
+    if times:
+        record_ingest_batch(conn, table, min(times), max(times))
+        merge_batch_sketches(conn, table, fresh_entries)
+    return True
 
 def prepare_traffic_log_entry(entry):
     return (
@@ -183,47 +309,76 @@ def get_valid_input(prompt, validation_function, error_message):
     return user_input
 
 if __name__ == '__main__':
-    conn = create_connection("panorama_logs.db")
+    configure_logging()
+    from dotenv import load_dotenv
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Fetch Panorama logs into panorama_logs.db.")
+    parser.add_argument('--bulk', action='store_true',
+                        help="Stage rows in an unindexed side database and merge them once at the end (for initial loads and backfills).")
+    args = parser.parse_args()
 
-    log_type = get_valid_input(
-        "Enter the log type (e.g., 'traffic', 'threat', 'globalprotect'): ",
-        validate_log_type,
-        "Expected one of 'traffic', 'threat', 'globalprotect'. Please try again."
-    )
+    conn = create_connection(DB_FILE)
 
-    specified_start_date = get_valid_input(
-        "Enter the start date you want to fetch logs for (YYYY-MM-DD) or press Enter for today's date: ",
-        lambda x: validate_date(x or datetime.now().strftime('%Y-%m-%d')),
-        "Date should be in YYYY-MM-DD format or press Enter for today's date."
-    )
-    specified_start_date = specified_start_date or datetime.now().strftime('%Y-%m-%d')
+    resume_state = get_bulk_load_state() if args.bulk else None
+    if resume_state:
+        log_type, start_time, end_time, last_completed = resume_state
+        answer = input(f"Found an unfinished bulk load of '{log_type}' logs ({start_time} to {end_time}, staged through {last_completed}). Resume it? (yes/no): ").strip().lower()
+        if answer not in ['yes', 'y']:
+            discard_bulk_load()
+            resume_state = None
 
-    start_time_input = get_valid_input(
-        "Enter the start time (HH:MM) or press Enter for one hour before now: ",
-        lambda x: validate_time(x or (datetime.now() - timedelta(hours=1)).strftime('%H:%M')),
-        "Time should be in HH:MM format or press Enter for one hour before now."
-    )
-    start_time_input = start_time_input or (datetime.now() - timedelta(hours=1)).strftime('%H:%M')
+    if not resume_state:
+        log_type = get_valid_input(
+            "Enter the log type (e.g., 'traffic', 'threat', 'globalprotect'): ",
+            validate_log_type,
+            "Expected one of 'traffic', 'threat', 'globalprotect'. Please try again."
+        )
 
-    specified_end_date = get_valid_input(
-        f"Enter the end date you want to fetch logs for (YYYY-MM-DD) or press Enter to use the start date {specified_start_date}: ",
-        lambda x: validate_date(x or specified_start_date),
-        "Date should be in YYYY-MM-DD format or press Enter to use the start date."
-    )
-    specified_end_date = specified_end_date or specified_start_date
+        specified_start_date = get_valid_input(
+            "Enter the start date you want to fetch logs for (YYYY-MM-DD) or press Enter for today's date: ",
+            lambda x: validate_date(x or datetime.now().strftime('%Y-%m-%d')),
+            "Date should be in YYYY-MM-DD format or press Enter for today's date."
+        )
+        specified_start_date = specified_start_date or datetime.now().strftime('%Y-%m-%d')
 
-    end_time_input = get_valid_input(
-        "Enter the end time (HH:MM) or press Enter for one hour after the start time: ",
-        lambda x: validate_time(x or (datetime.strptime(f"{specified_start_date} {start_time_input}", '%Y-%m-%d %H:%M') + timedelta(hours=1)).strftime('%H:%M')),
-        "Time should be in HH:MM format or press Enter for one hour after the start time."
-    )
-    if not end_time_input:
-        start_time = datetime.strptime(f"{specified_start_date} {start_time_input}", '%Y-%m-%d %H:%M')
-        end_time_input = (start_time + timedelta(hours=1)).strftime('%H:%M')
+        start_time_input = get_valid_input(
+            "Enter the start time (HH:MM) or press Enter for one hour before now: ",
+            lambda x: validate_time(x or (datetime.now() - timedelta(hours=1)).strftime('%H:%M')),
+            "Time should be in HH:MM format or press Enter for one hour before now."
+        )
+        start_time_input = start_time_input or (datetime.now() - timedelta(hours=1)).strftime('%H:%M')
+
+        specified_end_date = get_valid_input(
+            f"Enter the end date you want to fetch logs for (YYYY-MM-DD) or press Enter to use the start date {specified_start_date}: ",
+            lambda x: validate_date(x or specified_start_date),
+            "Date should be in YYYY-MM-DD format or press Enter to use the start date."
+        )
+        specified_end_date = specified_end_date or specified_start_date
+
+        end_time_input = get_valid_input(
+            "Enter the end time (HH:MM) or press Enter for one hour after the start time: ",
+            lambda x: validate_time(x or (datetime.strptime(f"{specified_start_date} {start_time_input}", '%Y-%m-%d %H:%M') + timedelta(hours=1)).strftime('%H:%M')),
+            "Time should be in HH:MM format or press Enter for one hour after the start time."
+        )
+        if not end_time_input:
+            start_time = datetime.strptime(f"{specified_start_date} {start_time_input}", '%Y-%m-%d %H:%M')
+            end_time_input = (start_time + timedelta(hours=1)).strftime('%H:%M')
+
+        start_datetime = datetime.strptime(f"{specified_start_date} {start_time_input}", '%Y-%m-%d %H:%M')
+        end_datetime = datetime.strptime(f"{specified_end_date} {end_time_input}", '%Y-%m-%d %H:%M')
+    else:
+        start_datetime = datetime.strptime(last_completed, '%Y/%m/%d %H:%M:%S')
+        end_datetime = datetime.strptime(end_time, '%Y/%m/%d %H:%M:%S')
 
-    start_datetime = datetime.strptime(f"{specified_start_date} {start_time_input}", '%Y-%m-%d %H:%M')
-    end_datetime = datetime.strptime(f"{specified_end_date} {end_time_input}", '%Y-%m-%d %H:%M')
+    if args.bulk:
+        attach_bulk_staging(conn, log_type)
+        bulk_start = start_time if resume_state else start_datetime.strftime('%Y/%m/%d %H:%M:%S')
+        bulk_end = end_datetime.strftime('%Y/%m/%d %H:%M:%S')
 
+    # An hour that fails stops the run rather than being skipped, so no later
+    # hour is fetched (or, in --bulk mode, marked as staged) past a gap
+    failure = None
+    run_start, fetched_through = start_datetime.strftime('%Y/%m/%d %H:%M:%S'), None
     while start_datetime < end_datetime:
         next_hour = start_datetime + timedelta(hours=1)
         formatted_start_time = start_datetime.strftime('%Y/%m/%d %H:%M:%S')
@@ -231,14 +386,39 @@ if __name__ == '__main__':
 
         print(f"Fetching logs from {formatted_start_time} to {formatted_end_time} for log type '{log_type}'...")
         job_id = initiate_log_query(conn, log_type, formatted_start_time, formatted_end_time)
-        if job_id:
-            if check_job_status(conn, job_id):
-                fetch_and_process_logs(conn, log_type, job_id)
-            else:
-                print("Failed to complete job within the expected time.")
+        if not job_id:
+            failure = "Failed to initiate job for the current hour."
+            break
+        if not check_job_status(conn, job_id):
+            failure = "Failed to complete job within the expected time."
+            break
+        if args.bulk:
+            log_entries = fetch_log_entries(log_type, job_id)
+            if log_entries is None:
+                failure = "Failed to fetch logs for the current hour."
+                break
+            stage_log_entries(conn, log_type, log_entries, bulk_start, bulk_end, formatted_end_time)
+        elif not fetch_and_process_logs(conn, log_type, job_id):
+            failure = "Failed to fetch logs for the current hour."
+            break
         else:
-            print("Failed to initiate job for the current hour.")
+            fetched_through = formatted_end_time
 
         start_datetime = next_hour
 
-    print("Completed fetching and processing logs.")
+    if fetched_through:
+        # Scored once for the whole run rather than after every hour
+        from module_scoring import score_ingest_run
+        score_ingest_run(conn, DB_FILE, LOG_TABLES[log_type][0], run_start, fetched_through)
+
+    if failure:
+        print(failure)
+        if args.bulk:
+            print("Stopping bulk load; re-run with --bulk to resume from the last staged hour.")
+        else:
+            print(f"Stopping; logs from {formatted_start_time} onwards were not fetched.")
+    else:
+        if args.bulk:
+            print("Merging staged rows and rebuilding indexes...")
+            merge_bulk_load(conn, log_type)
+        print("Completed fetching and processing logs.")
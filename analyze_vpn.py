@@ -3,7 +3,6 @@ import glob
 import datetime
 import matplotlib.pyplot as plt
 import numpy as np 
-from scipy.stats import entropy
 
 def is_file_in_date_range(filename, start_date, end_date):
     """Check if the file's date falls within the specified date range."""
@@ -89,9 +88,10 @@ for index, row in outlier_summary.iterrows():
 
 df['date'] = df['Generate Time'].dt.date
 
-daily_login_attempts = df.groupby(['date', 'IP Address']).size().unstack(fill_value=0)
-
-daily_entropy = daily_login_attempts.apply(entropy, axis=1)
+# Entropy per day straight from the non-zero (date, IP) counts, without a dense date x IP matrix
+daily_login_attempts = df.groupby(['date', 'IP Address']).size()
+login_share = daily_login_attempts / daily_login_attempts.groupby(level='date').transform('sum')
+daily_entropy = (-login_share * np.log(login_share)).groupby(level='date').sum()
 
 mean_entropy = daily_entropy.mean()
 std_entropy = daily_entropy.std()
@@ -0,0 +1,71 @@
+import argparse
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Entry point -> budget in seconds for importing it, as reported by
+# `python -X importtime` (module imports only, not interpreter startup)
+IMPORT_BUDGETS = {
+    'module_panorama_main': 0.3,
+    'query_file_database': 0.2,
+    'make_database': 0.2,
+    'database_cleanup': 0.2,
+    'count_analysis': 0.2,
+    'check_vpn_thresholds': 0.2,
+    'analyze_data': 0.2,
+    'panorama_database': 0.2,
+}
+
+# Packages the entry points above must not load at import time; they are
+# imported inside the functions that need them
+HEAVY_PACKAGES = ('numpy', 'pandas', 'matplotlib', 'seaborn', 'scipy', 'fpdf', 'dotenv', 'requests')
+
+def measure_imports(module: str) -> Tuple[float, List[Tuple[int, str, float]]]:
+    """(total seconds, [(depth, module, cumulative seconds)]) for one `import module` in a fresh interpreter."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    imports = []
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        seconds = int(cumulative) / 1e6
+        imports.append((depth, name.strip(), seconds))
+        if depth == 0 and name.strip() == module:
+            total = seconds
+    return total, imports
+
+def check_module(module: str, budget: float, repeat: int) -> bool:
+    # Best of several runs, so a cold disk cache or a busy machine does not fail the check
+    runs = [measure_imports(module) for _ in range(repeat)]
+    total, imports = min(runs, key=lambda run: run[0])
+    heavy = sorted({name for _, name, _ in imports if name.split('.')[0] in HEAVY_PACKAGES})
+    slowest = sorted(((seconds, name) for depth, name, seconds in imports if depth == 1), reverse=True)[:3]
+
+    ok = total <= budget and not heavy
+    print(f"{'ok  ' if ok else 'FAIL'} {module:<24} {total * 1000:7.1f} ms (budget {budget * 1000:.0f} ms)")
+    print("       slowest imports: " + ", ".join(f"{name} {seconds * 1000:.1f} ms" for seconds, name in slowest))
+    if heavy:
+        print("       heavy packages imported: " + ", ".join(sorted({name.split('.')[0] for name in heavy})))
+    return ok
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check that each entry point imports within its startup budget.")
+    parser.add_argument('modules', nargs='*', help="Entry points to check (default: all with a budget).")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per module; the fastest is compared to the budget.")
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiply every budget, e.g. 2 on a slow machine.")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    budgets: Dict[str, float] = {module: IMPORT_BUDGETS.get(module, 0.2) for module in args.modules or IMPORT_BUDGETS}
+    results = [check_module(module, budget * args.scale, args.repeat) for module, budget in budgets.items()]
+    if not all(results):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,8 @@
 import csv
 import glob
+import argparse
+from module_sketch import SpaceSaving, SKETCH_CAPACITY
+from module_utility import configure_logging
 
 # Define the thresholds
 IP_THRESHOLD = 50  # Threshold for IP checks
@@ -9,22 +12,30 @@ def find_csv_filenames(path_to_dir, suffix=".csv"):
     filenames = glob.glob(path_to_dir + "/*" + suffix)
     return [filename for filename in filenames if "VPNAuthentications" in filename]
 
+def parse_row(row):
+    ip = row['public_ip'].replace('\n', '').replace('\r', '')
+    user = row['Source User'].strip().replace('\n', '').replace('\r', '')
+    # Remove domain prefix if present and convert to lowercase
+    user = user.split('\\')[-1].lower()
+    country = row['srcregion'].strip().replace('\n', '').replace('\r', '')
+    return ip, user, country
+
+def open_reader(file):
+    reader = csv.DictReader(file)
+    # Dynamically remove BOM or other unexpected leading characters from column names
+    reader.fieldnames = [name.encode('utf-8').decode('utf-8-sig').strip() for name in reader.fieldnames]
+    return reader
+
 def analyze_csv(filename):
     ip_country_mapping = {}  # Store the most recent non-empty country code seen for an IP
     ip_details = {}  # Store counts and country codes for IPs
     user_ip_counts = {}  # Count occurrences by user and IP
 
     with open(filename, mode='r', encoding='utf-8-sig') as file:  # Note the encoding change here
-        reader = csv.DictReader(file)
-        # Dynamically remove BOM or other unexpected leading characters from column names
-        reader.fieldnames = [name.encode('utf-8').decode('utf-8-sig').strip() for name in reader.fieldnames]
+        reader = open_reader(file)
 
         for row in reader:
-            ip = row['public_ip'].replace('\n', '').replace('\r', '')
-            user = row['Source User'].strip().replace('\n', '').replace('\r', '')
-            # Remove domain prefix if present and convert to lowercase
-            user = user.split('\\')[-1].lower()
-            country = row['srcregion'].strip().replace('\n', '').replace('\r', '')
+            ip, user, country = parse_row(row)
 
             # If a country code is available, update the mapping for the IP
             if country:
@@ -57,6 +68,33 @@ def analyze_csv(filename):
 
     return ip_details, user_ip_counts, ip_country_mapping
 
+def analyze_csv_sketched(filename, capacity=SKETCH_CAPACITY):
+    """Like analyze_csv, but count IPs and user+IP pairs in fixed-size heavy-hitter sketches.
+
+    Memory stays bounded however many distinct IPs the file holds; every key
+    whose count exceeds the sketch's floor is still reported, with its count
+    overstated by at most its error, so the report errs toward extra keys
+    rather than missing ones.
+    """
+    ip_sketch = SpaceSaving(capacity)  # keys (ip,), label = last non-empty country
+    user_ip_sketch = SpaceSaving(capacity)  # keys (user, ip)
+
+    with open(filename, mode='r', encoding='utf-8-sig') as file:
+        reader = open_reader(file)
+
+        for row in reader:
+            ip, user, country = parse_row(row)
+            # Skip entries with blank usernames
+            if not user:
+                continue
+            ip_sketch.update((ip,), label=country or None)
+            if not country:
+                tracked = ip_sketch.counters.get((ip,))
+                country = tracked[2] if tracked else None
+            user_ip_sketch.update((user, ip), label=country or None)
+
+    return ip_sketch, user_ip_sketch
+
 def print_exceeds_threshold_ip(ip_details):
     sorted_ips = sorted(ip_details.items(), key=lambda item: item[1]['count'], reverse=True)
     for ip, details in sorted_ips:
@@ -75,10 +113,42 @@ def print_exceeds_threshold_user_ip(user_ip_counts, ip_country_mapping):
                 continue
             print(f"Username '{user}' - IP '{ip}' - country '{country}' - {count} attempts.")
 
+def format_estimate(count, error, threshold):
+    if not error:
+        return f"{count} attempts."
+    estimate = f"{count - error} to {count} attempts"
+    # The true count lies somewhere in the range, which may end up under the threshold
+    return f"{estimate} (may be under {threshold})." if count - error <= threshold else f"{estimate}."
+
+def print_exceeds_threshold_sketch(ip_sketch, user_ip_sketch):
+    # A sketch count never understates, so every key whose upper bound (count)
+    # clears the threshold is reported; those whose lower bound does not are marked
+    for (ip,), count, error, country in ip_sketch.top(len(ip_sketch.counters)):
+        if count > IP_THRESHOLD:
+            print(f"IP Address '{ip}' - country '{country or 'Unknown'}' - {format_estimate(count, error, IP_THRESHOLD)}")
+    for (user, ip), count, error, country in user_ip_sketch.top(len(user_ip_sketch.counters)):
+        if count > USER_IP_THRESHOLD:
+            print(f"Username '{user}' - IP '{ip}' - country '{country or 'Unknown'}' - {format_estimate(count, error, USER_IP_THRESHOLD)}")
+    if ip_sketch.floor > IP_THRESHOLD or user_ip_sketch.floor > USER_IP_THRESHOLD:
+        print("\nToo many distinct sources for the sketch to bound every count below the thresholds; "
+              "some sources over threshold may be missing (rerun without --approx).")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Report VPN authentication sources above the attempt thresholds.")
+    parser.add_argument('--approx', action='store_true',
+                        help="Count IPs and user+IP pairs in fixed-size sketches instead of exactly, "
+                             "bounding memory for very large exports at the cost of approximate counts.")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    configure_logging()
     csv_filenames = find_csv_filenames(".")
     for filename in csv_filenames:
         print(f"\nAnalyzing {filename}...\n")
+        if args.approx:
+            print_exceeds_threshold_sketch(*analyze_csv_sketched(filename))
+            continue
         ip_details, user_ip_counts, ip_country_mapping = analyze_csv(filename)
 
         # Check for IPs exceeding threshold including country code, sorted by count
@@ -1,6 +1,9 @@
 import sqlite3
 import calendar
+import argparse
 from datetime import datetime, timedelta
+from module_sketch import top_heavy_hitters, top_distinct_counts, fetch_latest_labels, DISTINCT_DIMENSIONS
+from module_utility import configure_logging
 
 def create_connection(db_file="panorama_logs.db"):
     try:
@@ -129,26 +132,44 @@ def analyze_event_sequences(events):
 
     return alerts
 
+def fetch_sequence_alerts(conn, start_datetime, end_datetime):
+    """Find failed portal-auth events immediately followed by a successful gateway-auth from the same IP.
+
+    Uses LAG() so only alert rows leave the database; falls back to walking
+    the full event sequence in Python on SQLite older than 3.25.
+    """
+    if sqlite3.sqlite_version_info < (3, 25, 0):
+        return analyze_event_sequences(fetch_event_sequence(conn, start_datetime, end_datetime))
+
+    conditions, params = build_conditions(start_datetime, end_datetime)
+    query = f"""
+    SELECT IP_Address, Previous_Time, Time_Generated
+    FROM (
+        SELECT IP_Address, Event_ID, Status, Time_Generated,
+               LAG(Event_ID) OVER w AS Previous_Event,
+               LAG(Status) OVER w AS Previous_Status,
+               LAG(Time_Generated) OVER w AS Previous_Time
+        FROM GlobalProtectLogs
+        WHERE Event_ID IN ('portal-auth', 'gateway-auth')
+        {'AND ' + conditions if conditions else ''}
+        WINDOW w AS (PARTITION BY IP_Address ORDER BY Time_Generated)
+    )
+    WHERE Previous_Event = 'portal-auth' AND Previous_Status = 'failure'
+      AND Event_ID = 'gateway-auth' AND Status = 'success'
+    ORDER BY IP_Address, Time_Generated ASC;
+    """
+    return execute_query(conn, query, params)
+
 def print_daily_status_summary(conn, start_datetime, end_datetime):
+    # Time_Generated is compared as stored, so the range is a search of its index
     query = """
-    SELECT strftime('%Y-%m-%d', datetime(substr(Time_Generated, 1, 4) || '-' || 
-                                          substr(Time_Generated, 6, 2) || '-' || 
-                                          substr(Time_Generated, 9, 2) || ' ' || 
-                                          substr(Time_Generated, 12))) AS Date, 
-           Status, COUNT(*) AS Count
+    SELECT replace(substr(Time_Generated, 1, 10), '/', '-') AS Date, Status, COUNT(*) AS Count
     FROM GlobalProtectLogs
-    WHERE datetime(substr(Time_Generated, 1, 4) || '-' || 
-                  substr(Time_Generated, 6, 2) || '-' || 
-                  substr(Time_Generated, 9, 2) || ' ' || 
-                  substr(Time_Generated, 12)) >= datetime(?)
-    AND datetime(substr(Time_Generated, 1, 4) || '-' || 
-                substr(Time_Generated, 6, 2) || '-' || 
-                substr(Time_Generated, 9, 2) || ' ' || 
-                substr(Time_Generated, 12)) <= datetime(?)
+    WHERE Time_Generated >= ? AND Time_Generated <= ?
     GROUP BY Date, Status
     ORDER BY Date, Status DESC;
     """
-    params = [start_datetime.strftime("%Y-%m-%d %H:%M:%S"), end_datetime.strftime("%Y-%m-%d %H:%M:%S")]
+    params = [start_datetime.strftime("%Y/%m/%d %H:%M:%S"), end_datetime.strftime("%Y/%m/%d %H:%M:%S")]
     results = execute_query(conn, query, params)
     print("\nDaily Status Summary:")
     if not results:
@@ -165,7 +186,40 @@ def print_daily_status_summary(conn, start_datetime, end_datetime):
             current_date = date
         print(f"  {status.capitalize()} count: {count}")
 
+def print_top_heavy_hitters(conn, name, start_datetime, end_datetime, headers, description):
+    """Print a top-10 IP table from the per-day heavy-hitter sketches."""
+    print(f"\n{description}:\n")
+    rows, max_error = top_heavy_hitters(conn, name, start_datetime, end_datetime, 10)
+    if not rows:
+        print("No results found.")
+        return
+    if max_error:
+        print_query_results([(key[0], label, count, error) for key, count, error, label in rows], headers + ["Max Overcount"])
+        print("\nApproximate counts: each may overstate the true count by at most its Max Overcount (use --exact for exact counts).")
+    else:
+        print_query_results([(key[0], label, count) for key, count, error, label in rows], headers)
+
+def print_top_distinct_counts(conn, name, start_datetime, end_datetime, headers, description):
+    """Print a top-10 IP table of distinct counts from the per-day HyperLogLog sketches."""
+    print(f"\n{description}:\n")
+    rows = top_distinct_counts(conn, name, start_datetime, end_datetime, 10)
+    if not rows:
+        print("No results found.")
+        return
+    _, params = build_conditions(start_datetime, end_datetime)
+    regions = fetch_latest_labels(conn, 'GlobalProtectLogs', 'IP_Address', 'Source_Region', [ip for ip, _ in rows], *params)
+    print_query_results([(ip, regions[ip], count) for ip, count in rows], headers)
+    print("\nDistinct counts are HyperLogLog estimates (use --exact for exact counts).")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Summarize GlobalProtect activity for a date/time range.")
+    parser.add_argument('--exact', action='store_true',
+                        help="Compute the top-10 IP tables with exact GROUP BY queries instead of the per-day sketches.")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    configure_logging()
     conn = create_connection("panorama_logs.db")
     if conn:
         now = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
@@ -176,8 +230,7 @@ def main():
         start_datetime, end_datetime = get_datetime_range(start_datetime_input, end_datetime_input)
         conditions, params = build_conditions(start_datetime, end_datetime)
 
-        events = fetch_event_sequence(conn, start_datetime, end_datetime)
-        alerts = analyze_event_sequences(events)
+        alerts = fetch_sequence_alerts(conn, start_datetime, end_datetime)
         
         if alerts:
             print("\nHeads-up! Found IPs with a failed 'portal-auth' followed by a successful 'gateway-auth':")
@@ -191,8 +244,10 @@ def main():
         and_or_where = "AND" if conditions else "WHERE"
 
         # Define and execute other queries considering date/time filters
+        # Entries with a sketch dimension are answered from the per-day heavy-hitter or
+        # HyperLogLog sketches unless --exact is given
         queries = [
-            (f"""
+            ('ip_users', f"""
              SELECT IP_Address, Source_Region, COUNT(DISTINCT Source_User) AS UniqueUsernames
              FROM GlobalProtectLogs
              {where_clause}
@@ -201,7 +256,7 @@ def main():
              LIMIT 10;
              """, params, ["IP Address", "Region", "Unique Usernames"], "Top 10 IP address/username combo attempts"),
 
-            (f"""
+            ('globalprotect_failed_ip', f"""
             SELECT IP_Address, Source_Region, COUNT(*) AS FailedAttempts
             FROM GlobalProtectLogs
             {where_clause} {and_or_where} Status = 'failure'
@@ -210,7 +265,7 @@ def main():
             LIMIT 10;
             """, params, ["IP Address", "Region", "Failed Attempts"], "Top 10 IP addresses by failed login attempts"),
 
-            (f"""
+            ('globalprotect_ip', f"""
              SELECT IP_Address, Source_Region, COUNT(*) AS TotalEntries
              FROM GlobalProtectLogs
              {where_clause}
@@ -219,7 +274,7 @@ def main():
              LIMIT 10;
              """, params, ["IP Address", "Region", "Total Entries"], "Top 10 IP addresses by total number of log entries"),
 
-            (f"""
+            (None, f"""
              SELECT Status, COUNT(*) AS Count
              FROM GlobalProtectLogs
              {where_clause}
@@ -228,7 +283,13 @@ def main():
              """, params, ["Status", "Count"], "Total number of successes and failures"),
         ]
 
-        for query, params, headers, description in queries:
+        for sketch_name, query, params, headers, description in queries:
+            if sketch_name in DISTINCT_DIMENSIONS and not args.exact:
+                print_top_distinct_counts(conn, sketch_name, start_datetime, end_datetime, headers, description)
+                continue
+            if sketch_name and not args.exact:
+                print_top_heavy_hitters(conn, sketch_name, start_datetime, end_datetime, headers, description)
+                continue
             print(f"\n{description}:\n")
             results = execute_query(conn, query, params)
             if results:
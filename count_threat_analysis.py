@@ -1,7 +1,10 @@
 import sqlite3
 from datetime import datetime, timedelta
 import os
+import numpy as np
 from dotenv import load_dotenv
+from module_database import query_to_arrays
+from module_threat_analysis import THREAT_AGGREGATE_COLUMNS, SEVERITY_ORDER, count_groups, is_country_region
 
 load_dotenv()
 
@@ -32,6 +35,32 @@ def print_query_results(results, headers):
     for row in results:
         print(row_format.format(*(str(cell) if cell is not None else '' for cell in row)))
 
+def fetch_threat_aggregates(conn, params, ip_exclusion_condition):
+    """Compute every threat summary table from a single scan of the matching rows."""
+    query = f"""
+    SELECT Threat_ID, Severity, Source_Region, IP_Address, Action,
+           strftime('%Y-%m-%d', replace(Time_Generated, '/', '-')) AS Date
+    FROM ThreatLogs
+    WHERE Time_Generated >= ? AND Time_Generated <= ? {ip_exclusion_condition}
+    """
+    arrays = query_to_arrays(conn, query, params, columns=THREAT_AGGREGATE_COLUMNS, categoricals=THREAT_AGGREGATE_COLUMNS)
+
+    # Country and IP tables skip range-style regions ("10.0.0.0-10.255.255.255") and NULLs
+    regions = arrays['Source_Region__categories']
+    valid_region = np.array([False] + [is_country_region(region) for region in regions], dtype=bool)
+    country_mask = valid_region[arrays['Source_Region'] + 1]
+
+    # Highest count first; ties in group-key order, as SQLite's GROUP BY emits them
+    by_count = lambda row: (-row[-1], tuple('' if value is None else value for value in row[:-1]))
+    return {
+        'threat_ids': sorted(count_groups(arrays, ['Threat_ID', 'Severity']), key=by_count)[:10],
+        'countries': sorted(count_groups(arrays, ['Source_Region'], country_mask), key=by_count)[:10],
+        'top_ips': sorted(count_groups(arrays, ['IP_Address', 'Source_Region'], country_mask), key=by_count)[:10],
+        'severity': sorted(count_groups(arrays, ['Severity']), key=lambda row: SEVERITY_ORDER.get(row[0], 6)),
+        'actions': sorted(count_groups(arrays, ['Action']), key=by_count),
+        'daily': sorted(count_groups(arrays, ['Date']), key=lambda row: (row[0] is not None, row[0] or ''), reverse=True),
+    }
+
 def get_date_input(prompt):
     user_input = input(prompt)
     if not user_input:
@@ -78,91 +107,25 @@ def main():
 
     params = [start_datetime.strftime("%Y/%m/%d %H:%M:%S"), end_datetime.strftime("%Y/%m/%d %H:%M:%S")]
 
-    # Top 10 Threat IDs by count with severity
-    query_threat_ids = f"""
-    SELECT Threat_ID, Severity, COUNT(*) AS Count
-    FROM ThreatLogs
-    WHERE Time_Generated >= ? AND Time_Generated <= ? {ip_exclusion_condition}
-    GROUP BY Threat_ID, Severity
-    ORDER BY Count DESC
-    LIMIT 10;
-    """
+    aggregates = fetch_threat_aggregates(conn, params, ip_exclusion_condition)
+
     print("\nTop 10 Threat IDs by count with severity:")
-    results = execute_query(conn, query_threat_ids, params)
-    print_query_results(results, ["Threat ID", "Severity", "Count"])
+    print_query_results(aggregates['threat_ids'], ["Threat ID", "Severity", "Count"])
 
-    # Threat count by country
-    query_country = f"""
-    SELECT Source_Region AS Country, COUNT(*) AS Threats
-    FROM ThreatLogs
-    WHERE Time_Generated >= ? AND Time_Generated <= ? 
-        AND Source_Region NOT LIKE '%.%'
-        AND Source_Region NOT GLOB '*[0-9]*' {ip_exclusion_condition}
-    GROUP BY Source_Region
-    ORDER BY Threats DESC
-    LIMIT 10;
-    """
     print("\nThreat count by country:")
-    results = execute_query(conn, query_country, params)
-    print_query_results(results, ["Country", "Threats"])
+    print_query_results(aggregates['countries'], ["Country", "Threats"])
 
-    # Top 10 IPs by threat count
-    query_top_ips = f"""
-    SELECT IP_Address, Source_Region, COUNT(*) AS Threat_Count
-    FROM ThreatLogs
-    WHERE Time_Generated >= ? AND Time_Generated <= ? 
-        AND Source_Region NOT LIKE '%.%'
-        AND Source_Region NOT GLOB '*[0-9]*' {ip_exclusion_condition}
-    GROUP BY IP_Address, Source_Region
-    ORDER BY Threat_Count DESC 
-    LIMIT 10; 
-    """
     print("\nTop 10 IP addresses by threat count:")
-    results = execute_query(conn, query_top_ips, params)
-    print_query_results(results, ["IP Address", "Source Region", "Threat Count"])
+    print_query_results(aggregates['top_ips'], ["IP Address", "Source Region", "Threat Count"])
 
-    # Breakdown of threats by severity
-    query_severity = f"""
-    SELECT Severity, COUNT(*) AS Count
-    FROM ThreatLogs
-    WHERE Time_Generated >= ? AND Time_Generated <= ? {ip_exclusion_condition}
-    GROUP BY Severity
-    ORDER BY CASE Severity
-        WHEN 'critical' THEN 1
-        WHEN 'high' THEN 2
-        WHEN 'medium' THEN 3
-        WHEN 'low' THEN 4
-        WHEN 'informational' THEN 5
-        ELSE 6
-    END;
-    """
     print("\nBreakdown of threats by severity:")
-    results = execute_query(conn, query_severity, params)
-    print_query_results(results, ["Severity", "Count"])
+    print_query_results(aggregates['severity'], ["Severity", "Count"])
 
-    # Daily count of threats
-    query_daily = f"""
-    SELECT strftime('%Y-%m-%d', replace(Time_Generated, '/', '-')) AS Date, COUNT(*) AS Daily_Count
-    FROM ThreatLogs
-    WHERE Time_Generated >= ? AND Time_Generated <= ? {ip_exclusion_condition}
-    GROUP BY strftime('%Y-%m-%d', replace(Time_Generated, '/', '-'))
-    ORDER BY Date DESC;
-    """
     print("\nDaily count of threats:")
-    results = execute_query(conn, query_daily, params)
-    print_query_results(results, ["Date", "Daily Count"])
+    print_query_results(aggregates['daily'], ["Date", "Daily Count"])
 
-    # Query to count each type of Action within the threat data
-    query_actions = f"""
-    SELECT Action, COUNT(*) AS Count
-    FROM ThreatLogs
-    WHERE Time_Generated >= ? AND Time_Generated <= ? {ip_exclusion_condition}
-    GROUP BY Action
-    ORDER BY Count DESC;
-    """
     print("\nCount of each type of Action:")
-    results = execute_query(conn, query_actions, params)
-    print_query_results(results, ["Action", "Count"])
+    print_query_results(aggregates['actions'], ["Action", "Count"])
 
     conn.close()
 
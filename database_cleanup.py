@@ -1,5 +1,8 @@
 import sqlite3
 from sqlite3 import Error
+from module_database import record_ingest_batch
+from module_sketch import delete_day_sketches
+from module_utility import configure_logging
 
 def create_connection(db_file):
     """Create a database connection to the SQLite database specified by db_file."""
@@ -24,10 +27,16 @@ def delete_old_records(conn, days_old):
             cur.execute(query)
             print(f"Deleted old records from table: {query.split(' ')[2]}")
         conn.commit()
+        # Let cached report results covering the purged days expire
+        cutoff = cur.execute(f"SELECT strftime('%Y/%m/%d %H:%M:%S', DATE('now', '{retention_period}'))").fetchone()[0]
+        for table_name in ['GlobalProtectLogs', 'ThreatLogs', 'TrafficLogs']:
+            record_ingest_batch(conn, table_name, '0000/00/00 00:00:00', cutoff)
+        delete_day_sketches(conn, cutoff[:10])
     except Error as e:
         print("Error deleting old records:", e)
 
 def main():
+    configure_logging()
     database_path = "./panorama_logs.db"  # Update this path to your database file
     conn = create_connection(database_path)
     if conn:
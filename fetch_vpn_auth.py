@@ -7,6 +7,7 @@ import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
 from collections import Counter, defaultdict
 from dotenv import load_dotenv
+from module_sketch import HyperLogLog
 
 # Load environment variables
 load_dotenv()
@@ -106,7 +107,7 @@ def analyze_logs():
     user_ip_combo_counter = Counter()
     ip_region_mapping = {}
     user_ip_region_mapping = {}  # Track the latest non-"N/A" region for each user+IP combo
-    ip_usernames_mapping = defaultdict(set)  # Tracks unique usernames attempted by each IP
+    ip_usernames_mapping = defaultdict(HyperLogLog)  # Fixed-size distinct counter of usernames attempted by each IP
     success_counter = Counter()
     failure_counter = Counter()
 
@@ -133,14 +134,14 @@ def analyze_logs():
             if user != "N/A" and ip != "N/A":
                 user_ip_combo = f"{user}||{ip}"
                 user_ip_combo_counter[user_ip_combo] += 1
-                ip_usernames_mapping[ip].add(user)  # Add user to set of unique usernames for the IP
+                ip_usernames_mapping[ip].add(user)  # Add user to the IP's distinct username sketch
                 
                 # Update user+IP region mapping if the current region is not "N/A"
                 if region != "N/A":
                     user_ip_region_mapping[user_ip_combo] = region
 
     # Calculate counts of unique usernames for each IP
-    unique_usernames_count = {ip: len(usernames) for ip, usernames in ip_usernames_mapping.items()}
+    unique_usernames_count = {ip: usernames.estimate() for ip, usernames in ip_usernames_mapping.items()}
     
     # Sort IPs by the number of unique usernames attempted
     top_ips_by_unique_usernames = sorted(unique_usernames_count.items(), key=lambda x: x[1], reverse=True)[:10]
@@ -163,7 +164,7 @@ def analyze_logs():
     print("\nTop 10 IPs by Unique Usernames Attempted:")
     for ip, count in top_ips_by_unique_usernames:
         region = ip_region_mapping.get(ip, "N/A")
-        print(f"IP: {ip}, Region: {region}, Unique Usernames: {count}")
+        print(f"IP: {ip}, Region: {region}, Unique Usernames: ~{count}")
 
     total_successes = sum(success_counter.values())
     total_failures = sum(failure_counter.values())
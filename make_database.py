@@ -1,5 +1,126 @@
+import argparse
 import sqlite3
 from sqlite3 import Error
+from module_utility import configure_logging
+from module_watchlist import ALERT_LEVEL, WATCH_COLUMNS, tag_existing_rows, tagged_condition
+
+# SQL table creation statements for each log type
+sql_create_traffic_table = """CREATE TABLE IF NOT EXISTS TrafficLogs (
+                                id INTEGER PRIMARY KEY,
+                                Time_Generated DATETIME NOT NULL,
+                                IP_Address TEXT,
+                                Destination_IP TEXT,
+                                Source_Region TEXT,
+                                Destination_Region TEXT,
+                                Application TEXT,
+                                Action TEXT,
+                                Proto TEXT,
+                                Bytes INTEGER,
+                                Packets INTEGER,
+                                Session_End_Reason TEXT,
+                                Rule TEXT,
+                                Suspicion_Level INTEGER CHECK (Suspicion_Level BETWEEN 1 AND 10),
+                                Additional_Data TEXT,
+                                UNIQUE(Time_Generated, IP_Address, Destination_IP)
+                            );"""
+
+
+sql_create_threat_table = """CREATE TABLE IF NOT EXISTS ThreatLogs (
+                               id INTEGER PRIMARY KEY,
+                               Time_Generated DATETIME NOT NULL,
+                               IP_Address TEXT,
+                               Destination_IP TEXT,
+                               Source_Region TEXT,
+                               Destination_Region TEXT,
+                               Application TEXT,
+                               Action TEXT,
+                               Threat_ID TEXT,
+                               Threat_Name TEXT,
+                               Severity TEXT,
+                               Category TEXT,
+                               Suspicion_Level INTEGER CHECK (suspicion_level BETWEEN 1 AND 10),
+                               Additional_Data TEXT,
+                               UNIQUE(Time_Generated, IP_Address, Threat_ID)
+                             );"""
+
+sql_create_globalprotect_table = """CREATE TABLE IF NOT EXISTS GlobalProtectLogs (
+                                    id INTEGER PRIMARY KEY,
+                                    Time_Generated DATETIME NOT NULL,
+                                    IP_Address TEXT,
+                                    Source_Region TEXT,
+                                    Source_User TEXT,
+                                    Portal TEXT,
+                                    Event_ID TEXT,
+                                    Status TEXT,
+                                    Suspicion_Level INTEGER CHECK (suspicion_level BETWEEN 1 AND 10),
+                                    Additional_Data TEXT,
+                                    UNIQUE(Time_Generated, IP_Address, Event_ID)
+                                    );"""
+
+# Clustered variants: the natural key is the primary key of a WITHOUT ROWID
+# table, so rows are stored in Time_Generated order and a report window is a
+# contiguous run of pages regardless of the order the rows were ingested in.
+sql_create_threat_table_clustered = """CREATE TABLE IF NOT EXISTS {name} (
+                                         Time_Generated DATETIME NOT NULL,
+                                         IP_Address TEXT NOT NULL,
+                                         Destination_IP TEXT,
+                                         Source_Region TEXT,
+                                         Destination_Region TEXT,
+                                         Application TEXT,
+                                         Action TEXT,
+                                         Threat_ID TEXT NOT NULL,
+                                         Threat_Name TEXT,
+                                         Severity TEXT,
+                                         Category TEXT,
+                                         Suspicion_Level INTEGER CHECK (suspicion_level BETWEEN 1 AND 10),
+                                         Additional_Data TEXT,
+                                         PRIMARY KEY(Time_Generated, IP_Address, Threat_ID)
+                                       ) WITHOUT ROWID;"""
+
+sql_create_globalprotect_table_clustered = """CREATE TABLE IF NOT EXISTS {name} (
+                                              Time_Generated DATETIME NOT NULL,
+                                              IP_Address TEXT NOT NULL,
+                                              Source_Region TEXT,
+                                              Source_User TEXT,
+                                              Portal TEXT,
+                                              Event_ID TEXT NOT NULL,
+                                              Status TEXT,
+                                              Suspicion_Level INTEGER CHECK (suspicion_level BETWEEN 1 AND 10),
+                                              Additional_Data TEXT,
+                                              PRIMARY KEY(Time_Generated, IP_Address, Event_ID)
+                                              ) WITHOUT ROWID;"""
+
+# Table name -> (clustered DDL template, key columns used to order the copy)
+CLUSTERED_TABLES = {
+    'ThreatLogs': (sql_create_threat_table_clustered, ('Time_Generated', 'IP_Address', 'Threat_ID')),
+    'GlobalProtectLogs': (sql_create_globalprotect_table_clustered, ('Time_Generated', 'IP_Address', 'Event_ID')),
+}
+
+# Secondary indexes for lookups by address or user, e.g. matching indicator lists
+sql_create_lookup_indexes = [
+    "CREATE INDEX IF NOT EXISTS idx_threat_ip_time ON ThreatLogs(IP_Address, Time_Generated);",
+    "CREATE INDEX IF NOT EXISTS idx_threat_destination_time ON ThreatLogs(Destination_IP, Time_Generated);",
+    "CREATE INDEX IF NOT EXISTS idx_globalprotect_ip_time ON GlobalProtectLogs(IP_Address, Time_Generated);",
+    "CREATE INDEX IF NOT EXISTS idx_globalprotect_user_time ON GlobalProtectLogs(Source_User, Time_Generated);",
+]
+
+INDEX_PREFIXES = {'TrafficLogs': 'traffic', 'ThreatLogs': 'threat', 'GlobalProtectLogs': 'globalprotect'}
+
+# Partial indexes over alert rows only (Suspicion_Level >= ALERT_LEVEL, the
+# threshold the scorer reports against). The level is part of the name, so
+# changing ALERT_LEVEL builds new indexes and drop_stale_flagged_indexes
+# removes the old ones
+sql_create_flagged_indexes = [
+    f"CREATE INDEX IF NOT EXISTS idx_{prefix}_alert_{ALERT_LEVEL} ON {table_name}(Time_Generated) WHERE Suspicion_Level >= {ALERT_LEVEL};"
+    for table_name, prefix in INDEX_PREFIXES.items()
+]
+
+# Partial indexes over rows carrying watchlist tags, which the known-offender
+# search walks instead of joining against the indicator list
+sql_create_tagged_indexes = [
+    f"CREATE INDEX IF NOT EXISTS idx_{prefix}_tagged ON {table_name}(Time_Generated) WHERE {tagged_condition()};"
+    for table_name, prefix in INDEX_PREFIXES.items()
+]
 
 def create_connection(db_file):
     """Create a database connection to the specified SQLite database."""
@@ -20,71 +141,132 @@ def create_table(conn, create_table_sql):
     except Error as e:
         print(e)
 
-def main():
-    database = "./panorama_logs.db"
+def create_indexes(conn, index_statements):
+    """Create each index from index_statements, skipping any that fail."""
+    for statement in index_statements:
+        try:
+            conn.execute(statement)
+        except Error as e:
+            print(e)
+    conn.commit()
 
-    # SQL table creation statements for each log type
-    sql_create_traffic_table = """CREATE TABLE IF NOT EXISTS TrafficLogs (
-                                    id INTEGER PRIMARY KEY,
-                                    Time_Generated DATETIME NOT NULL,
-                                    IP_Address TEXT,
-                                    Destination_IP TEXT,
-                                    Source_Region TEXT,
-                                    Destination_Region TEXT,
-                                    Application TEXT,
-                                    Action TEXT,
-                                    Proto TEXT,
-                                    Bytes INTEGER,
-                                    Packets INTEGER,
-                                    Session_End_Reason TEXT,
-                                    Rule TEXT,
-                                    Suspicion_Level INTEGER CHECK (Suspicion_Level BETWEEN 1 AND 10),
-                                    Additional_Data TEXT,
-                                    UNIQUE(Time_Generated, IP_Address, Destination_IP)
-                                );"""
-
-
-    sql_create_threat_table = """CREATE TABLE IF NOT EXISTS ThreatLogs (
-                                   id INTEGER PRIMARY KEY,
-                                   Time_Generated DATETIME NOT NULL,
-                                   IP_Address TEXT,
-                                   Destination_IP TEXT,
-                                   Source_Region TEXT,
-                                   Destination_Region TEXT,
-                                   Application TEXT,
-                                   Action TEXT,
-                                   Threat_ID TEXT,
-                                   Threat_Name TEXT,
-                                   Severity TEXT,
-                                   Category TEXT,
-                                   Suspicion_Level INTEGER CHECK (suspicion_level BETWEEN 1 AND 10),
-                                   Additional_Data TEXT,
-                                   UNIQUE(Time_Generated, IP_Address, Threat_ID)
-                                 );"""
-
-    sql_create_globalprotect_table = """CREATE TABLE IF NOT EXISTS GlobalProtectLogs (
-                                        id INTEGER PRIMARY KEY,
-                                        Time_Generated DATETIME NOT NULL,
-                                        IP_Address TEXT,
-                                        Source_Region TEXT,
-                                        Source_User TEXT,
-                                        Portal TEXT,
-                                        Event_ID TEXT,
-                                        Status TEXT,
-                                        Suspicion_Level INTEGER CHECK (suspicion_level BETWEEN 1 AND 10),
-                                        Additional_Data TEXT,
-                                        UNIQUE(Time_Generated, IP_Address, Event_ID)
-                                        );"""
+def drop_stale_flagged_indexes(conn):
+    """Drop flagged-row indexes built for another alert level (or the old Suspicion_Level > 1 ones)."""
+    current = {f"idx_{prefix}_alert_{ALERT_LEVEL}" for prefix in INDEX_PREFIXES.values()}
+    stale = [row[0] for row in conn.execute("""SELECT name FROM sqlite_master WHERE type = 'index'
+                                               AND (name GLOB 'idx_*_flagged' OR name GLOB 'idx_*_alert_*')""")
+             if row[0] not in current]
+    for name in stale:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.commit()
+
+def is_clustered(conn, table_name):
+    """Return True if table_name is already a WITHOUT ROWID table."""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).fetchone()
+    return row is not None and 'WITHOUT ROWID' in row[0].upper()
+
+def rebuild_clustered(conn, table_name, allow_dropped=False):
+    """Copy an existing rowid log table into its clustered WITHOUT ROWID layout.
+
+    Rows with a NULL key column or a key already copied cannot be kept; unless
+    allow_dropped is set, any such rows roll the rebuild back and are reported.
+    """
+    ddl, key_columns = CLUSTERED_TABLES[table_name]
+    if is_clustered(conn, table_name):
+        print(f"{table_name} is already clustered, skipping.")
+        return
+
+    new_table = f"{table_name}_clustered"
+    old_columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+    columns = ", ".join(column for column in old_columns if column != 'id')
+    not_null = " AND ".join(f"{column} IS NOT NULL" for column in key_columns)
+    try:
+        conn.execute("BEGIN")
+        conn.execute(f"DROP TABLE IF EXISTS {new_table}")
+        conn.execute(ddl.format(name=new_table))
+        conn.execute(f"""INSERT OR IGNORE INTO {new_table} ({columns})
+                         SELECT {columns} FROM {table_name}
+                         WHERE {not_null}
+                         ORDER BY {", ".join(key_columns)}""")
+        copied = conn.execute(f"SELECT COUNT(*) FROM {new_table}").fetchone()[0]
+        total, null_keys = conn.execute(f"SELECT COUNT(*), COUNT(*) - COUNT(CASE WHEN {not_null} THEN 1 END) FROM {table_name}").fetchone()
+        if copied != total:
+            dropped = f"{total - copied} of {total} rows ({null_keys} with a NULL key, {total - copied - null_keys} duplicate keys)"
+            if not allow_dropped:
+                conn.rollback()
+                print(f"Not rebuilding {table_name}: {dropped} would be dropped. Use --allow-dropped-rows to rebuild anyway.")
+                return
+            print(f"Dropping {dropped} from {table_name}.")
+        conn.execute(f"DROP TABLE {table_name}")
+        conn.execute(f"ALTER TABLE {new_table} RENAME TO {table_name}")
+        conn.commit()
+        print(f"Rebuilt {table_name} as a clustered table ({copied} rows).")
+    except Error as e:
+        conn.rollback()
+        print(f"Error rebuilding {table_name}:", e)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Create the Panorama log database.")
+    parser.add_argument('--database', default="./panorama_logs.db", help="Path to the SQLite database file.")
+    parser.add_argument('--clustered', action='store_true',
+                        help="Create ThreatLogs and GlobalProtectLogs as WITHOUT ROWID tables clustered on (time, ip, threat/event).")
+    parser.add_argument('--rebuild-clustered', action='store_true',
+                        help="Convert existing ThreatLogs and GlobalProtectLogs tables to the clustered layout.")
+    parser.add_argument('--allow-dropped-rows', action='store_true',
+                        help="With --rebuild-clustered, convert even if rows with a NULL or duplicate key would be dropped.")
+    parser.add_argument('--tag-watchlists', action='store_true',
+                        help="Retag all existing rows against the current watchlist files (bad_ips.txt, tor_ips.txt).")
+    parser.add_argument('--rescore', action='store_true',
+                        help="Recompute Suspicion_Level for all existing rows from the scoring signals (implied by --tag-watchlists).")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    configure_logging()
 
     # Create a database connection
-    conn = create_connection(database)
+    conn = create_connection(args.database)
 
     # Create tables
     if conn is not None:
         create_table(conn, sql_create_traffic_table)
-        create_table(conn, sql_create_threat_table)
-        create_table(conn, sql_create_globalprotect_table)
+        if args.clustered:
+            create_table(conn, sql_create_threat_table_clustered.format(name='ThreatLogs'))
+            create_table(conn, sql_create_globalprotect_table_clustered.format(name='GlobalProtectLogs'))
+        else:
+            create_table(conn, sql_create_threat_table)
+            create_table(conn, sql_create_globalprotect_table)
         print("Tables created successfully.")
+
+        if args.rebuild_clustered:
+            for table_name in CLUSTERED_TABLES:
+                rebuild_clustered(conn, table_name, args.allow_dropped_rows)
+            # Reclaim the pages freed by the old tables and lay the new ones out contiguously
+            conn.execute("VACUUM")
+            print("Database vacuumed.")
+
+        create_indexes(conn, sql_create_lookup_indexes)
+        drop_stale_flagged_indexes(conn)
+        create_indexes(conn, sql_create_flagged_indexes)
+        create_indexes(conn, sql_create_tagged_indexes)
+        print("Indexes created successfully.")
+
+        if args.tag_watchlists:
+            for table_name in WATCH_COLUMNS:
+                try:
+                    tag_existing_rows(conn, table_name)
+                except Error as e:
+                    print(f"Error tagging {table_name}:", e)
+
+        # Retagging resets levels to the watchlist alone, so scores are always recomputed after it
+        if args.rescore or args.tag_watchlists:
+            # Scoring pulls in pandas and the analysis modules; only load them when asked to rescore
+            from module_scoring import TABLE_SIGNALS, rescore_table
+            for table_name in TABLE_SIGNALS:
+                try:
+                    rescore_table(conn, args.database, table_name)
+                except Error as e:
+                    print(f"Error scoring {table_name}:", e)
         conn.close()
     else:
         print("Error! Cannot create the database connection.")
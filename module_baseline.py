@@ -0,0 +1,124 @@
+import sqlite3
+import json
+import logging
+import os
+from datetime import date, timedelta
+from typing import Dict, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from module_database import execute_query, get_table_watermark
+from module_utility import day_range
+
+logger = logging.getLogger(__name__)
+
+# Number of closed days before the report window used as the anomaly baseline
+BASELINE_DAYS = int(os.getenv('BASELINE_DAYS', '30'))
+
+# One row per (day, metric); a day is only written once it has closed
+sql_create_daily_stats = """CREATE TABLE IF NOT EXISTS DailyStats (
+                              Day TEXT NOT NULL,
+                              Metric TEXT NOT NULL,
+                              Value REAL NOT NULL,
+                              PRIMARY KEY(Day, Metric)
+                            ) WITHOUT ROWID;"""
+
+# The GlobalProtectLogs watermark each day was computed at, so a late backfill
+# into a closed day gets that day recomputed on the next run
+sql_create_daily_stats_state = """CREATE TABLE IF NOT EXISTS DailyStatsState (
+                                    Day TEXT PRIMARY KEY,
+                                    Watermark TEXT NOT NULL,
+                                    Computed_At TEXT DEFAULT CURRENT_TIMESTAMP
+                                  ) WITHOUT ROWID;"""
+
+def compute_daily_stats(conn: sqlite3.Connection, day: str) -> Dict[str, float]:
+    params = day_range(day)
+    stats = {}
+
+    ip_counts = np.array([row[0] for row in execute_query(conn, """
+        SELECT COUNT(*) FROM GlobalProtectLogs
+        WHERE Time_Generated >= ? AND Time_Generated <= ? AND IP_Address IS NOT NULL
+        GROUP BY IP_Address;""", params)], dtype='float64')
+    if ip_counts.size:
+        p = ip_counts / ip_counts.sum()
+        stats['login_entropy'] = float(-(p * np.log2(p)).sum())
+
+    # Moments of the per-IP failure count distribution; kept as sums so days pool exactly
+    failure_counts = np.array([row[0] for row in execute_query(conn, """
+        SELECT COUNT(*) FROM GlobalProtectLogs
+        WHERE Time_Generated >= ? AND Time_Generated <= ? AND Status = 'failure'
+        GROUP BY IP_Address;""", params)], dtype='float64')
+    if failure_counts.size:
+        stats['failure_ips'] = float(failure_counts.size)
+        stats['failure_sum'] = float(failure_counts.sum())
+        stats['failure_sumsq'] = float((failure_counts ** 2).sum())
+
+    for hour, count in execute_query(conn, """
+        SELECT substr(Time_Generated, 12, 2) as hour, COUNT(*) FROM GlobalProtectLogs
+        WHERE Time_Generated >= ? AND Time_Generated <= ?
+        GROUP BY hour;""", params):
+        stats[f'volume_hour_{hour}'] = float(count)
+    return stats
+
+def update_daily_stats(conn: sqlite3.Connection, first_day: date, last_day: date) -> int:
+    # Only days before today are closed; today's numbers are still moving
+    last_day = min(last_day, date.today() - timedelta(days=1))
+    if last_day < first_day:
+        return 0
+    try:
+        conn.execute(sql_create_daily_stats)
+        conn.execute(sql_create_daily_stats_state)
+        stored = dict(conn.execute("SELECT Day, Watermark FROM DailyStatsState WHERE Day >= ? AND Day <= ?",
+                                   (first_day.strftime('%Y/%m/%d'), last_day.strftime('%Y/%m/%d'))).fetchall())
+    except sqlite3.Error as e:
+        logger.error(f"Error preparing daily stats store: {e}")
+        return 0
+
+    computed = 0
+    day = first_day
+    while day <= last_day:
+        day_str = day.strftime('%Y/%m/%d')
+        day = day + timedelta(days=1)
+        watermark = get_table_watermark(conn, 'GlobalProtectLogs', day_range(day_str))
+        if day_str in stored and (watermark[0] != 'batch' or stored[day_str] == json.dumps(watermark)):
+            continue
+
+        stats = compute_daily_stats(conn, day_str)
+        try:
+            with conn:
+                conn.execute("DELETE FROM DailyStats WHERE Day = ?", (day_str,))
+                conn.executemany("INSERT INTO DailyStats(Day, Metric, Value) VALUES(?,?,?)",
+                                 [(day_str, metric, value) for metric, value in stats.items()])
+                conn.execute("INSERT OR REPLACE INTO DailyStatsState(Day, Watermark) VALUES(?,?)", (day_str, json.dumps(watermark)))
+            computed += 1
+        except sqlite3.Error as e:
+            logger.error(f"Error storing daily stats for {day_str}: {e}")
+    logger.info(f"Computed daily stats for {computed} day(s) between {first_day} and {last_day}.")
+    return computed
+
+def load_daily_stats(conn: sqlite3.Connection, first_day: date, last_day: date, metrics: Sequence[str]) -> pd.DataFrame:
+    placeholders = ", ".join("?" for _ in metrics)
+    rows = execute_query(conn, f"""
+        SELECT Day, Metric, Value FROM DailyStats
+        WHERE Day >= ? AND Day <= ? AND Metric IN ({placeholders});""",
+        (first_day.strftime('%Y/%m/%d'), last_day.strftime('%Y/%m/%d'), *metrics))
+    stats_df = pd.DataFrame(rows, columns=['Day', 'Metric', 'Value'])
+    return stats_df.pivot(index='Day', columns='Metric', values='Value').reindex(columns=list(metrics))
+
+def baseline_days(before_day: date, days: int = BASELINE_DAYS) -> Tuple[date, date]:
+    return before_day - timedelta(days=days), before_day - timedelta(days=1)
+
+def entropy_baseline(conn: sqlite3.Connection, before_day: date, days: int = BASELINE_DAYS) -> pd.Series:
+    stats_df = load_daily_stats(conn, *baseline_days(before_day, days), ['login_entropy'])
+    return stats_df['login_entropy'].dropna()
+
+def failure_count_baseline(conn: sqlite3.Connection, before_day: date, days: int = BASELINE_DAYS) -> Optional[Tuple[float, float]]:
+    # Mean and standard deviation of per-IP daily failure counts, pooled over the baseline days
+    stats_df = load_daily_stats(conn, *baseline_days(before_day, days), ['failure_ips', 'failure_sum', 'failure_sumsq'])
+    n, total, total_sq = stats_df.sum().tolist()
+    if n < 2:
+        return None
+    mean = total / n
+    std = np.sqrt(max(total_sq - total * total / n, 0.0) / (n - 1))
+    if std == 0:
+        return None
+    return mean, std
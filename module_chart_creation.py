@@ -1,51 +1,111 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
+import io
+import matplotlib
+# Charts are only ever written out, never shown; Agg needs no display and is safe in worker processes
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
 import numpy as np
 import pandas as pd
 import logging
-from typing import Dict, Optional
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def create_bar_chart(data: Dict[str, float], title: str, x_label: str, y_label: str, output_file: str, threshold: Optional[float] = None):
-    plt.figure(figsize=(10, 5))
-    plt.bar(data.keys(), data.values(), color='skyblue')
-    plt.title(title)
-    plt.xlabel(x_label)
-    plt.ylabel(y_label)
-    plt.xticks(rotation=45, ha='right')
+# Charts are described by (kind, payload): the payload is plain data (lists,
+# strings, NumPy arrays) so it pickles cheaply to a worker process, and the
+# worker builds the figure and sends back PNG bytes
+
+def bar_chart_figure(labels: Sequence[str], values: Sequence[float], title: str, x_label: str, y_label: str,
+                     threshold: Optional[float] = None) -> Figure:
+    figure = Figure(figsize=(10, 5))
+    ax = figure.subplots()
+    ax.bar(labels, values, color='skyblue')
+    ax.set_title(title)
+    ax.set_xlabel(x_label)
+    ax.set_ylabel(y_label)
+    ax.tick_params(axis='x', labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
     if threshold is not None:
-        plt.axhline(y=threshold, color='r', linestyle='--', label=f'Threshold ({threshold:.2f})')
-        plt.legend()
-    plt.tight_layout()
-    plt.savefig(output_file)
-    plt.close()
+        ax.axhline(y=threshold, color='r', linestyle='--', label=f'Threshold ({threshold:.2f})')
+        ax.legend()
+    figure.tight_layout()
+    return figure
+
+def stacked_bar_chart_figure(index: Sequence[str], columns: Sequence[str], values: np.ndarray, title: str) -> Figure:
+    figure = Figure(figsize=(10, 5))
+    ax = figure.subplots()
+    pd.DataFrame(values, index=pd.Index(index, name='Date'), columns=columns).plot(kind='bar', stacked=True, ax=ax)
+    ax.set_title(title)
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Count')
+    ax.tick_params(axis='x', labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
+    figure.tight_layout()
+    return figure
+
+def entropy_heatmap_figure(times: Sequence[str], features: Sequence[str], values: np.ndarray) -> Figure:
+    # One image of features x buckets instead of a patch per cell, so it stays
+    # fast however many buckets the range holds
+    figure = Figure(figsize=(12, 8))
+    ax = figure.subplots()
+    image = ax.imshow(values.T, aspect='auto', cmap='viridis', interpolation='nearest')
+    figure.colorbar(image, ax=ax)
+    ax.set_title('Entropy of Log Features Over Time')
+    ax.set_xlabel('Time')
+    ax.set_ylabel('Features')
+    ax.set_yticks(range(len(features)), features)
+
+    num_ticks = 10
+    tick_positions = np.linspace(0, len(times) - 1, num_ticks, dtype=int)
+    ax.set_xticks(tick_positions, [times[position] for position in tick_positions], rotation=45, ha='right')
+    figure.tight_layout()
+    return figure
+
+CHART_FIGURES: Dict[str, Callable[..., Figure]] = {
+    'bar': bar_chart_figure,
+    'stacked_bar': stacked_bar_chart_figure,
+    'entropy_heatmap': entropy_heatmap_figure,
+}
+
+def bar_chart_payload(data: Dict[Any, float], title: str, x_label: str, y_label: str,
+                      threshold: Optional[float] = None) -> Dict[str, Any]:
+    return {'labels': [str(label) for label in data], 'values': [float(value) for value in data.values()],
+            'title': title, 'x_label': x_label, 'y_label': y_label, 'threshold': threshold}
+
+def stacked_bar_chart_payload(df: pd.DataFrame, title: str) -> Dict[str, Any]:
+    return {'index': [str(label) for label in df.index], 'columns': [str(column) for column in df.columns],
+            'values': df.to_numpy(dtype='float64'), 'title': title}
+
+def entropy_heatmap_payload(entropy_df: pd.DataFrame) -> Dict[str, Any]:
+    return {'times': list(entropy_df.index.strftime('%Y-%m-%d %H:%M')), 'features': [str(column) for column in entropy_df.columns],
+            'values': entropy_df.to_numpy(dtype='float64')}
+
+def render_chart(kind: str, payload: Dict[str, Any]) -> bytes:
+    buffer = io.BytesIO()
+    CHART_FIGURES[kind](**payload).savefig(buffer, format='png')
+    return buffer.getvalue()
+
+def render_charts(charts: List[Tuple[str, Dict[str, Any]]], executor: Optional[Executor] = None) -> List[bytes]:
+    """PNG bytes for each (kind, payload), rendered in parallel when an executor is given."""
+    if executor is None or len(charts) < 2:
+        return [render_chart(kind, payload) for kind, payload in charts]
+    kinds, payloads = zip(*charts)
+    return list(executor.map(render_chart, kinds, payloads))
+
+def write_chart(output_file: str, image: bytes) -> None:
+    with open(output_file, 'wb') as file:
+        file.write(image)
+
+def create_bar_chart(data: Dict[str, float], title: str, x_label: str, y_label: str, output_file: str, threshold: Optional[float] = None):
+    write_chart(output_file, render_chart('bar', bar_chart_payload(data, title, x_label, y_label, threshold)))
     logger.info(f"Bar chart saved to {output_file}")
 
 def create_stacked_bar_chart(df: pd.DataFrame, title: str, output_file: str):
-    df.plot(kind='bar', stacked=True, figsize=(10, 5))
-    plt.title(title)
-    plt.xlabel('Date')
-    plt.ylabel('Count')
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    plt.savefig(output_file)
-    plt.close()
+    write_chart(output_file, render_chart('stacked_bar', stacked_bar_chart_payload(df, title)))
     logger.info(f"Stacked bar chart saved to {output_file}")
 
 def create_entropy_heatmap(entropy_df: pd.DataFrame, start_date: str, end_date: str, output_file: str):
-    plt.figure(figsize=(12, 8))
-    sns.heatmap(entropy_df.T, cmap='viridis', cbar=True)
-    plt.title('Entropy of Log Features Over Time')
-    plt.xlabel('Time')
-    plt.ylabel('Features')
-
-    num_ticks = 10
-    tick_labels = entropy_df.index.strftime('%Y-%m-%d %H:%M')
-    tick_positions = np.linspace(0, len(entropy_df.index) - 1, num_ticks, dtype=int)
-    plt.xticks(tick_positions, tick_labels[tick_positions], rotation=45, ha='right')
-
-    plt.savefig(output_file)
-    plt.close()
-    logger.info(f"Entropy heatmap saved to {output_file}")
\ No newline at end of file
+    write_chart(output_file, render_chart('entropy_heatmap', entropy_heatmap_payload(entropy_df)))
+    logger.info(f"Entropy heatmap saved to {output_file}")
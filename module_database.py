@@ -1,9 +1,41 @@
 import sqlite3
 import logging
-from typing import Optional, List, Tuple
+import queue
+import threading
+import re
+import hashlib
+import pickle
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Optional, List, Tuple, Dict, Iterator, Sequence, Union, Callable, Any
+from module_utility import print_query_results
+
+# NumPy and pandas are only imported by the functions that build arrays and
+# frames, so connection and query helpers stay cheap for the command-line tools
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger('slow_query')
+
+# Queries slower than this get their plan captured and a slow_query log record
+SLOW_QUERY_SECONDS = float(os.getenv('SLOW_QUERY_SECONDS', '0.5'))
+
+# Applied to every pooled read connection: the report only reads, so refuse
+# writes, keep a large page cache and let SQLite memory-map the file.
+READ_PRAGMAS = (
+    "PRAGMA query_only = ON",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+)
+
+def normalize_sql(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().rstrip(";").strip()
 
 def create_connection(db_file: str = "panorama_logs.db") -> Optional[sqlite3.Connection]:
     try:
@@ -14,13 +46,414 @@ def create_connection(db_file: str = "panorama_logs.db") -> Optional[sqlite3.Con
         logger.error(f"Error creating connection: {e}")
         return None
 
+def create_read_connection(db_file: str = "panorama_logs.db") -> Optional[sqlite3.Connection]:
+    try:
+        conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True, check_same_thread=False)
+        for pragma in READ_PRAGMAS:
+            conn.execute(pragma)
+        logger.info(f"Read-only database connection established to {db_file}")
+        return conn
+    except sqlite3.Error as e:
+        logger.error(f"Error creating read-only connection: {e}")
+        return None
+
+class ConnectionPool:
+    """A small pool of read-only connections to one database file.
+
+    Connections are opened lazily up to ``size`` and handed out with
+    ``checkout``/``checkin``. A thread that checks out again while it already
+    holds a connection gets the same one back, so nested helpers (e.g. a report
+    section calling ``process_known_offenders``) share the caller's connection
+    and its warm page cache instead of opening the file again.
+    """
+
+    def __init__(self, db_file: str = "panorama_logs.db", size: int = 4):
+        self.db_file = db_file
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def checkout(self, timeout: Optional[float] = None) -> Optional[sqlite3.Connection]:
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            self._local.depth += 1
+            return held
+
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                conn = create_read_connection(self.db_file)
+                if conn is None:
+                    with self._lock:
+                        self._opened -= 1
+                    return None
+            else:
+                try:
+                    conn = self._idle.get(timeout=timeout)
+                except queue.Empty:
+                    logger.error(f"Timed out waiting for a connection to {self.db_file}")
+                    return None
+
+        self._local.conn = conn
+        self._local.depth = 1
+        return conn
+
+    def checkin(self, conn: sqlite3.Connection) -> None:
+        if getattr(self._local, 'conn', None) is not conn:
+            raise ValueError("Connection was not checked out by this thread")
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            self._local.conn = None
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[Optional[sqlite3.Connection]]:
+        conn = self.checkout(timeout)
+        try:
+            yield conn
+        finally:
+            if conn is not None:
+                self.checkin(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._opened = 0
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_read_pool(db_file: str = "panorama_logs.db", size: int = 4) -> ConnectionPool:
+    with _pools_lock:
+        pool = _pools.get(db_file)
+        if pool is None:
+            pool = _pools[db_file] = ConnectionPool(db_file, size)
+        return pool
+
+@contextmanager
+def savepoint(conn: sqlite3.Connection, name: str) -> Iterator[None]:
+    """Run the block inside SAVEPOINT name: released on success, rolled back to on error.
+
+    Unlike commit(), releasing only ends a transaction the savepoint itself
+    started; inside the caller's transaction the changes simply join it.
+    """
+    conn.execute(f"SAVEPOINT {name}")
+    try:
+        yield
+    except BaseException:
+        conn.execute(f"ROLLBACK TO {name}")
+        conn.execute(f"RELEASE {name}")
+        raise
+    conn.execute(f"RELEASE {name}")
+
+@contextmanager
+def temp_table(conn: sqlite3.Connection, name: str, columns: str, rows: Sequence[Tuple]) -> Iterator[str]:
+    """Load rows into a connection-private temp table for the duration of the block.
+
+    Pooled read connections run with query_only, which also refuses temp
+    tables; it is lifted just long enough to build this one. The main
+    database stays protected by the read-only open mode. The table is built
+    and dropped inside savepoints, so a transaction the caller has open is
+    neither committed nor ended.
+    """
+    query_only = conn.execute("PRAGMA query_only").fetchone()[0]
+    conn.execute("PRAGMA query_only = OFF")
+    try:
+        with savepoint(conn, name):
+            conn.execute(f"DROP TABLE IF EXISTS temp.{name}")
+            conn.execute(f"CREATE TEMP TABLE {name} ({columns})")
+            if rows:
+                conn.executemany(f"INSERT OR IGNORE INTO temp.{name} VALUES({', '.join('?' * len(rows[0]))})", rows)
+    finally:
+        conn.execute(f"PRAGMA query_only = {query_only}")
+    try:
+        yield f"temp.{name}"
+    finally:
+        conn.execute("PRAGMA query_only = OFF")
+        try:
+            with savepoint(conn, name):
+                conn.execute(f"DROP TABLE IF EXISTS temp.{name}")
+        finally:
+            conn.execute(f"PRAGMA query_only = {query_only}")
+
+class QueryStats:
+    """Per-run timing totals for every statement run through this module."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, query: str, elapsed: float, rows: int) -> None:
+        key = normalize_sql(query)
+        with self._lock:
+            entry = self._stats.setdefault(key, {'calls': 0, 'total': 0.0, 'max': 0.0, 'rows': 0})
+            entry['calls'] += 1
+            entry['total'] += elapsed
+            entry['max'] = max(entry['max'], elapsed)
+            entry['rows'] += rows
+
+    def top(self, n: int = 10) -> List[Tuple[str, Dict[str, float]]]:
+        with self._lock:
+            return sorted(self._stats.items(), key=lambda item: item[1]['total'], reverse=True)[:n]
+
+    def summary(self, n: int = 10) -> str:
+        results = [(f"{entry['total']:.3f}", int(entry['calls']), f"{entry['max']:.3f}", int(entry['rows']), query[:80])
+                   for query, entry in self.top(n)]
+        return print_query_results(results, ["Total (s)", "Calls", "Max (s)", "Rows", "Query"])
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+query_stats = QueryStats()
+
+def explain_query_plan(conn: sqlite3.Connection, query: str, params: Sequence = ()) -> List[str]:
+    try:
+        return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+    except sqlite3.Error as e:
+        return [f"unavailable: {e}"]
+
+def record_query(conn: sqlite3.Connection, query: str, params: Sequence, elapsed: float, rows: int) -> None:
+    query_stats.record(query, elapsed, rows)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Executed query in %.3fs (%d rows): %s with params: %s", elapsed, rows, query, params)
+    if elapsed >= SLOW_QUERY_SECONDS:
+        slow_query_logger.warning(json.dumps({
+            'elapsed': round(elapsed, 4),
+            'rows': rows,
+            'query': normalize_sql(query),
+            'params': [str(param) for param in params],
+            'plan': explain_query_plan(conn, query, params),
+        }))
+
+# Failed queries are logged and return an empty result; the per-thread count
+# lets cached_query tell such a result apart from a genuinely empty one
+_query_errors = threading.local()
+
+def query_error_count() -> int:
+    return getattr(_query_errors, 'count', 0)
+
+def log_query_error(error: sqlite3.Error) -> None:
+    _query_errors.count = query_error_count() + 1
+    logger.error(f"Error executing query: {error}")
+
 def execute_query(conn: sqlite3.Connection, query: str, params: Tuple = ()) -> List[Tuple]:
     try:
+        started = time.perf_counter()
         cur = conn.cursor()
         cur.execute(query, params)
         rows = cur.fetchall()
-        logger.info(f"Executed query: {query} with params: {params}")
+        record_query(conn, query, params, time.perf_counter() - started, len(rows))
         return rows
     except sqlite3.Error as e:
-        logger.error(f"Error executing query: {e}")
-        return []
\ No newline at end of file
+        log_query_error(e)
+        return []
+
+def iter_query(conn: sqlite3.Connection, query: str, params: Tuple = (), arraysize: int = 10000,
+               chunked: bool = False) -> Iterator[Union[Tuple, List[Tuple]]]:
+    """Stream a query's results instead of materializing them with fetchall().
+
+    Yields one row at a time, or lists of up to ``arraysize`` rows when
+    ``chunked`` is True.
+    """
+    try:
+        started = time.perf_counter()
+        row_count = 0
+        cur = conn.cursor()
+        cur.arraysize = arraysize
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany()
+            if not rows:
+                record_query(conn, query, params, time.perf_counter() - started, row_count)
+                break
+            row_count += len(rows)
+            if chunked:
+                yield rows
+            else:
+                yield from rows
+    except sqlite3.Error as e:
+        log_query_error(e)
+
+def query_to_arrays(conn: sqlite3.Connection, query: str, params: Tuple = (), columns: Sequence[str] = (),
+                    dtypes: Optional[Dict[str, str]] = None, categoricals: Sequence[str] = (),
+                    arraysize: int = 10000) -> Dict[str, 'np.ndarray']:
+    """Fetch a query straight into one NumPy array per column.
+
+    Rows are pulled ``arraysize`` at a time and each chunk is converted to
+    column arrays immediately, so the full result never exists as a list of
+    tuples. Columns named in ``categoricals`` are dictionary-encoded while
+    streaming: the array holds int32 codes (-1 for NULL) and the categories
+    are returned under ``"<column>__categories"``.
+    """
+    import numpy as np
+    dtypes = dtypes or {}
+    chunks: Dict[str, List[np.ndarray]] = {column: [] for column in columns}
+    lookups: Dict[str, Dict] = {column: {} for column in categoricals}
+
+    for rows in iter_query(conn, query, params, arraysize, chunked=True):
+        for column, values in zip(columns, zip(*rows)):
+            if column in lookups:
+                lookup = lookups[column]
+                codes = [-1 if value is None else lookup.setdefault(value, len(lookup)) for value in values]
+                chunks[column].append(np.fromiter(codes, dtype=np.int32, count=len(codes)))
+            else:
+                chunks[column].append(np.array(values, dtype=dtypes.get(column, object)))
+
+    arrays: Dict[str, np.ndarray] = {}
+    for column in columns:
+        if column in lookups:
+            arrays[column] = np.concatenate(chunks[column]) if chunks[column] else np.empty(0, dtype=np.int32)
+            arrays[f"{column}__categories"] = np.array(list(lookups[column]), dtype=object)
+        else:
+            default = np.empty(0, dtype=dtypes.get(column, object))
+            arrays[column] = np.concatenate(chunks[column]) if chunks[column] else default
+    return arrays
+
+def query_to_dataframe(conn: sqlite3.Connection, query: str, params: Tuple = (), columns: Sequence[str] = (),
+                       dtypes: Optional[Dict[str, str]] = None, categoricals: Sequence[str] = (),
+                       arraysize: int = 10000) -> 'pd.DataFrame':
+    """Like query_to_arrays, but returns a DataFrame with categorical columns built from the codes."""
+    import pandas as pd
+    arrays = query_to_arrays(conn, query, params, columns, dtypes, categoricals, arraysize)
+    data = {}
+    for column in columns:
+        if column in categoricals:
+            data[column] = pd.Categorical.from_codes(arrays[column], categories=arrays[f"{column}__categories"])
+        else:
+            data[column] = arrays[column]
+    return pd.DataFrame(data, columns=list(columns))
+
+# Ingesters append one row per committed batch with the Time_Generated span it
+# touched. The query cache uses this as its watermark: a cached result for a
+# time range stays valid until a batch overlapping that range is recorded.
+sql_create_ingest_log = """CREATE TABLE IF NOT EXISTS IngestLog (
+                            batch_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            table_name TEXT NOT NULL,
+                            min_time TEXT NOT NULL,
+                            max_time TEXT NOT NULL,
+                            recorded_at TEXT DEFAULT CURRENT_TIMESTAMP
+                        );"""
+
+def record_ingest_batch(conn: sqlite3.Connection, table_name: str, min_time: str, max_time: str) -> None:
+    try:
+        conn.execute(sql_create_ingest_log)
+        conn.execute("INSERT INTO IngestLog(table_name, min_time, max_time) VALUES(?,?,?)", (table_name, min_time, max_time))
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Error recording ingest batch: {e}")
+
+def get_table_watermark(conn: sqlite3.Connection, table_name: str, time_range: Optional[Sequence[str]] = None) -> Tuple:
+    try:
+        if time_range:
+            row = conn.execute("SELECT MAX(batch_id) FROM IngestLog WHERE table_name = ? AND max_time >= ? AND min_time <= ?",
+                               (table_name, time_range[0], time_range[1])).fetchone()
+        else:
+            row = conn.execute("SELECT MAX(batch_id) FROM IngestLog WHERE table_name = ?", (table_name,)).fetchone()
+        return ('batch', row[0] or 0)
+    except sqlite3.Error:
+        pass
+    # No ingest log yet: fall back to the newest row in the table
+    try:
+        return ('rowid', conn.execute(f"SELECT MAX(rowid) FROM {table_name}").fetchone()[0])
+    except sqlite3.Error:
+        return ('time', conn.execute(f"SELECT MAX(Time_Generated) FROM {table_name}").fetchone()[0])
+
+class QueryCache:
+    """Query results keyed by normalized SQL + params and tagged with table watermarks.
+
+    Results are kept in memory for the life of the process and, when
+    ``persist_path`` is given, pickled into a small SQLite file so a later run
+    over the same closed range can reuse them.
+    """
+
+    def __init__(self, persist_path: Optional[str] = None):
+        self._memory: Dict[str, Tuple[Tuple, Any]] = {}
+        self._lock = threading.Lock()
+        self._store = None
+        if persist_path:
+            self._store = sqlite3.connect(persist_path, check_same_thread=False)
+            self._store.execute("CREATE TABLE IF NOT EXISTS QueryCache (key TEXT PRIMARY KEY, watermark BLOB, result BLOB)")
+            self._store.commit()
+
+    def get(self, key: str, watermark: Tuple) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._store is not None:
+                row = self._store.execute("SELECT watermark, result FROM QueryCache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (pickle.loads(row[0]), pickle.loads(row[1]))
+                    self._memory[key] = entry
+        if entry is not None and entry[0] == watermark:
+            return True, entry[1]
+        return False, None
+
+    def put(self, key: str, watermark: Tuple, result: Any) -> None:
+        with self._lock:
+            self._memory[key] = (watermark, result)
+            if self._store is not None:
+                self._store.execute("INSERT OR REPLACE INTO QueryCache(key, watermark, result) VALUES(?,?,?)",
+                                    (key, pickle.dumps(watermark), pickle.dumps(result)))
+                self._store.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._store is not None:
+                self._store.execute("DELETE FROM QueryCache")
+                self._store.commit()
+
+_query_cache = QueryCache()
+
+def configure_query_cache(persist_path: Optional[str] = None) -> QueryCache:
+    global _query_cache
+    _query_cache = QueryCache(persist_path)
+    return _query_cache
+
+def query_tables(query: str) -> List[str]:
+    return sorted(set(re.findall(r"\b(?:FROM|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)", query, re.IGNORECASE)))
+
+def cached_query(conn: sqlite3.Connection, query: str, params: Sequence = (), time_range: Optional[Sequence[str]] = None,
+                 loader: Callable[..., Any] = execute_query, loader_kwargs: Optional[Dict[str, Any]] = None,
+                 cache: Optional[QueryCache] = None) -> Any:
+    """Run ``loader(conn, query, params, **loader_kwargs)`` through the query cache.
+
+    ``time_range`` is the (start, end) Time_Generated span the query reads, in
+    the table's own format; when given, only ingest batches overlapping it
+    invalidate the cached result.
+    """
+    cache = cache or _query_cache
+    loader_kwargs = loader_kwargs or {}
+    key_source = repr((normalize_sql(query), tuple(params), loader.__qualname__, sorted(loader_kwargs.items())))
+    key = hashlib.sha256(key_source.encode()).hexdigest()
+    try:
+        watermark = tuple((table, get_table_watermark(conn, table, time_range)) for table in query_tables(query))
+    except sqlite3.Error:
+        # A table that cannot be read has no watermark; run uncached and let the loader report the error
+        return loader(conn, query, params, **loader_kwargs)
+
+    hit, result = cache.get(key, watermark)
+    if hit:
+        logger.debug(f"Query cache hit for {key[:12]}")
+    else:
+        errors = query_error_count()
+        result = loader(conn, query, params, **loader_kwargs)
+        # A failed query's empty result is not cached, so the next call runs it again
+        if query_error_count() == errors:
+            cache.put(key, watermark, result)
+    # Callers are free to modify the DataFrames they get back; a result can
+    # only be a DataFrame if a loader has already imported pandas
+    pd = sys.modules.get('pandas')
+    return result.copy() if pd is not None and isinstance(result, pd.DataFrame) else result
@@ -2,59 +2,118 @@ import pandas as pd
 import numpy as np
 import sqlite3
 from datetime import datetime
-from scipy.stats import entropy
-from module_database import execute_query
+from module_database import cached_query, query_to_dataframe
 from module_utility import build_conditions
+from module_report_cache import day_results
 import logging
-from typing import List, Tuple, Optional
+from typing import Any, Callable, List, Tuple, Optional
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def fetch_login_data(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> List[Tuple]:
+def fetch_daily_ip_counts(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> pd.DataFrame:
     conditions, params = build_conditions(start_datetime, end_datetime)
     query = f"""
-    SELECT substr(Time_Generated, 1, 10) as date, IP_Address
+    SELECT substr(Time_Generated, 1, 10) as date, COUNT(*) as count
     FROM GlobalProtectLogs
-    WHERE {conditions};
+    WHERE {conditions} AND IP_Address IS NOT NULL
+    GROUP BY date, IP_Address;
     """
-    return execute_query(conn, query, params)
+    return cached_query(conn, query, params, time_range=params, loader=query_to_dataframe,
+                        loader_kwargs={'columns': ['date', 'count'], 'dtypes': {'count': 'int64'}, 'categoricals': ['date']})
+
+def entropy_from_counts(groups: pd.Series, counts: pd.Series, base: Optional[float] = 2) -> pd.Series:
+    # Shannon entropy per group straight from the non-zero (group, value) counts;
+    # zero cells contribute nothing, so the dense group x value matrix is never needed
+    counts = counts.astype('float64')
+    totals = counts.groupby(groups, observed=True).transform('sum')
+    p = counts / totals
+    log_p = np.log(p) if base is None else np.log(p) / np.log(base)
+    return (-p * log_p).groupby(groups, observed=True).sum()
 
-def calculate_entropy(df: pd.DataFrame) -> pd.Series:
-    daily_login_attempts = df.groupby(['date', 'IP_Address']).size().unstack(fill_value=0)
-    daily_entropy = daily_login_attempts.apply(lambda x: entropy(x, base=2), axis=1)
+def calculate_entropy_from_counts(counts_df: pd.DataFrame) -> pd.Series:
+    daily_entropy = entropy_from_counts(counts_df['date'], counts_df['count'])
+    daily_entropy.index = daily_entropy.index.astype(str)
+    daily_entropy.index.name = 'date'
     logger.info("Calculated daily entropy.")
     return daily_entropy
 
-def identify_anomalies(daily_entropy: pd.Series) -> Tuple[pd.Series, float]:
-    mean_entropy = daily_entropy.mean()
-    std_entropy = daily_entropy.std()
+# Bump when the per-day entropy computations change, so stored days are recomputed
+DAILY_ENTROPY_VERSION = 1
+BUCKETED_ENTROPY_VERSION = 1
+
+def fetch_daily_entropy(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> pd.Series:
+    daily_ip_counts = fetch_daily_ip_counts(conn, start_datetime, end_datetime)
+    if daily_ip_counts.empty:
+        return pd.Series(dtype='float64', index=pd.Index([], dtype=object, name='date'))
+    return calculate_entropy_from_counts(daily_ip_counts)
+
+def daily_login_entropy(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> pd.Series:
+    # Each day's entropy only depends on that day's logins, so closed days come from the results store
+    days = day_results(conn, 'daily_entropy', DAILY_ENTROPY_VERSION, ['GlobalProtectLogs'], start_datetime, end_datetime,
+                       fetch_daily_entropy)
+    return pd.concat(days) if days else fetch_daily_entropy(conn, start_datetime, end_datetime)
+
+def identify_anomalies(daily_entropy: pd.Series, baseline: Optional[pd.Series] = None) -> Tuple[pd.Series, float]:
+    # Compare against the stored baseline days when there are enough of them,
+    # otherwise fall back to the spread of the window itself
+    reference = baseline if baseline is not None and len(baseline) >= 2 else daily_entropy
+    mean_entropy = reference.mean()
+    std_entropy = reference.std()
     anomaly_threshold = mean_entropy + 2 * std_entropy
     anomaly_days = daily_entropy[daily_entropy > anomaly_threshold]
-    logger.info(f"Identified {len(anomaly_days)} anomalies with threshold {anomaly_threshold}.")
+    logger.info(f"Identified {len(anomaly_days)} anomalies with threshold {anomaly_threshold} over {len(reference)} reference days.")
     return anomaly_days, anomaly_threshold
 
-def fetch_all_login_data(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> List[Tuple]:
+def fetch_all_login_dataframe(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> pd.DataFrame:
     conditions, params = build_conditions(start_datetime, end_datetime)
     query = f"""
     SELECT Time_Generated, IP_Address, Source_Region, Source_User
     FROM GlobalProtectLogs
     WHERE {conditions};
     """
-    return execute_query(conn, query, params)
-
-def calculate_hourly_entropy(df: pd.DataFrame) -> pd.DataFrame:
-    df['Time_Generated'] = pd.to_datetime(df['Time_Generated'])
-    df.set_index('Time_Generated', inplace=True)
-    df_resampled = df.resample('H').agg({
-        'IP_Address': lambda x: list(x) if len(x) > 0 else np.nan,
-        'Source_Region': lambda x: list(x) if len(x) > 0 else np.nan,
-        'Source_User': lambda x: list(x) if len(x) > 0 else np.nan
-    })
-    df_resampled.dropna(inplace=True)
-    
-    entropy_df = pd.DataFrame(index=df_resampled.index)
-    for column in ['IP_Address', 'Source_Region', 'Source_User']:
-        entropy_df[column] = df_resampled[column].apply(lambda x: entropy(pd.Series(pd.factorize(np.array(x))[0])))
-    logger.info("Calculated hourly entropy.")
-    return entropy_df
\ No newline at end of file
+    columns = ['Time_Generated', 'IP_Address', 'Source_Region', 'Source_User']
+    return cached_query(conn, query, params, time_range=params, loader=query_to_dataframe,
+                        loader_kwargs={'columns': columns, 'categoricals': columns[1:]})
+
+ENTROPY_FEATURES = ['IP_Address', 'Source_Region', 'Source_User']
+
+def calculate_bucketed_entropy(df: pd.DataFrame, columns: List[str] = ENTROPY_FEATURES, bucket: str = '1h') -> pd.DataFrame:
+    bucket_width = pd.Timedelta(bucket)
+    if not pd.Timedelta(minutes=5) <= bucket_width <= pd.Timedelta(days=1):
+        raise ValueError(f"Entropy bucket must be between 5 minutes and 1 day, got '{bucket}'")
+
+    times = pd.to_datetime(df['Time_Generated'], format='%Y/%m/%d %H:%M:%S', errors='coerce')
+    buckets = times.dt.floor(bucket_width).rename('Time_Generated')
+
+    entropy_df = pd.DataFrame(index=pd.DatetimeIndex(buckets.dropna().unique(), name='Time_Generated').sort_values())
+    for column in columns:
+        # Entropy of the value frequencies within each bucket
+        counts = df.groupby([buckets, df[column]], observed=True).size()
+        bucket_index = counts.index.get_level_values('Time_Generated').to_series(index=counts.index)
+        entropy_df[column] = entropy_from_counts(bucket_index, counts, base=None)
+    entropy_df = entropy_df.fillna(0.0)
+    logger.info(f"Calculated {bucket} entropy for {len(columns)} features over {len(entropy_df)} buckets.")
+    return entropy_df
+
+def bucketed_login_entropy(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime, bucket: str = '1h',
+                           run: Optional[Callable[..., Any]] = None) -> pd.DataFrame:
+    """calculate_bucketed_entropy over the range's logins, assembled from per-day results where possible.
+
+    ``run(func, *args)`` executes the entropy calculation (e.g. on a process
+    pool); by default it is called in place.
+    """
+    run = run or (lambda func, *args: func(*args))
+
+    def compute(conn: sqlite3.Connection, start: datetime, end: datetime) -> pd.DataFrame:
+        df = fetch_all_login_dataframe(conn, start, end)
+        if df.empty:
+            return pd.DataFrame(columns=ENTROPY_FEATURES, index=pd.DatetimeIndex([], name='Time_Generated'), dtype='float64')
+        return run(calculate_bucketed_entropy, df, ENTROPY_FEATURES, bucket)
+
+    # Buckets are floored from the epoch, so they only line up with midnight
+    # (and never straddle two days) when they divide a day evenly
+    if pd.Timedelta(days=1) % pd.Timedelta(bucket):
+        return compute(conn, start_datetime, end_datetime)
+    days = day_results(conn, 'bucketed_entropy', BUCKETED_ENTROPY_VERSION, ['GlobalProtectLogs'], start_datetime, end_datetime,
+                       compute, variant=(bucket,))
+    return pd.concat(days) if days else compute(conn, start_datetime, end_datetime)
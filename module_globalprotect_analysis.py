@@ -1,11 +1,15 @@
 from datetime import datetime, timedelta
-from module_database import execute_query
+from module_database import execute_query, iter_query, get_table_watermark, temp_table
 from module_utility import build_conditions
+from module_sketch import top_distinct_counts, fetch_latest_labels, HyperLogLog
+from module_threat_analysis import is_country_region
+from module_report_cache import day_results
 import sqlite3
 import logging
-from typing import List, Tuple, Any
+import os
+from collections import deque
+from typing import List, Tuple, Any, Dict, Deque, NamedTuple, Optional
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 def fetch_event_sequence(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> List[Tuple]:
@@ -37,6 +41,126 @@ def analyze_event_sequences(events: List[Tuple]) -> List[Tuple]:
     logger.info(f"Analyzed {len(events)} events and identified {len(alerts)} alerts.")
     return alerts
 
+# LAG() and the WINDOW clause need SQLite 3.25+
+SQLITE_HAS_WINDOW_FUNCTIONS = sqlite3.sqlite_version_info >= (3, 25, 0)
+
+def fetch_sequence_alerts(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> List[Tuple]:
+    if not SQLITE_HAS_WINDOW_FUNCTIONS:
+        return analyze_event_sequences(fetch_event_sequence(conn, start_datetime, end_datetime))
+
+    conditions, params = build_conditions(start_datetime, end_datetime)
+    query = f"""
+    SELECT IP_Address, Previous_Time, Time_Generated
+    FROM (
+        SELECT IP_Address, Event_ID, Status, Time_Generated,
+               LAG(Event_ID) OVER w AS Previous_Event,
+               LAG(Status) OVER w AS Previous_Status,
+               LAG(Time_Generated) OVER w AS Previous_Time
+        FROM GlobalProtectLogs
+        WHERE Event_ID IN ('portal-auth', 'gateway-auth')
+        {'AND ' + conditions if conditions else ''}
+        WINDOW w AS (PARTITION BY IP_Address ORDER BY Time_Generated)
+    )
+    WHERE Previous_Event = 'portal-auth' AND Previous_Status = 'failure'
+      AND Event_ID = 'gateway-auth' AND Status = 'success'
+    ORDER BY IP_Address, Time_Generated ASC;
+    """
+    alerts = execute_query(conn, query, params)
+    logger.info(f"Identified {len(alerts)} alerts.")
+    return alerts
+
+class SequencePattern(NamedTuple):
+    """At least ``min_failures`` failed ``failure_event``s in the
+    ``window_minutes`` before a successful ``success_event``, all from the same
+    ``key`` (IP_Address or Source_User)."""
+    name: str
+    description: str
+    key: str
+    min_failures: int
+    window_minutes: float
+    failure_event: str = 'portal-auth'
+    success_event: str = 'gateway-auth'
+
+DEFAULT_SEQUENCE_PATTERNS = [
+    SequencePattern('ip_portal_bruteforce', "IP with repeated failed 'portal-auth' then a successful 'gateway-auth'",
+                    'IP_Address', min_failures=5, window_minutes=30),
+    SequencePattern('user_portal_bruteforce', "User with repeated failed 'portal-auth' then a successful 'gateway-auth'",
+                    'Source_User', min_failures=5, window_minutes=30),
+]
+
+# Key values that identify nobody and would otherwise lump unrelated events together
+IGNORED_SEQUENCE_KEYS = {None, '', 'N/A'}
+
+class SequencePatternEngine:
+    """Evaluates many SequencePatterns over one time-ordered pass of GlobalProtect events.
+
+    State is a deque of failure timestamps per (pattern, key); timestamps older
+    than the pattern window are dropped as events arrive, and keys that have
+    gone quiet for longer than every window are swept periodically, so memory
+    tracks the number of recently active keys rather than the history.
+    """
+
+    SWEEP_INTERVAL = 10000
+
+    def __init__(self, patterns: List[SequencePattern]):
+        self.patterns = patterns
+        self.state: List[Dict[str, Tuple[Deque[int], Deque[str]]]] = [{} for _ in patterns]
+        self.alerts: Dict[str, List[Tuple]] = {pattern.name: [] for pattern in patterns}
+        self.max_window = max((pattern.window_minutes * 60 for pattern in patterns), default=0)
+        self.processed = 0
+
+    def process(self, epoch: int, time_generated: str, keys: Dict[str, str], event_id: str, status: str) -> None:
+        for pattern, state in zip(self.patterns, self.state):
+            key = keys[pattern.key]
+            if key in IGNORED_SEQUENCE_KEYS:
+                continue
+            if event_id == pattern.failure_event and status == 'failure':
+                epochs, times = state.setdefault(key, (deque(), deque()))
+                epochs.append(epoch)
+                times.append(time_generated)
+                self.evict(epochs, times, epoch, pattern.window_minutes * 60)
+            elif event_id == pattern.success_event and status == 'success' and key in state:
+                epochs, times = state.pop(key)
+                self.evict(epochs, times, epoch, pattern.window_minutes * 60)
+                if len(epochs) >= pattern.min_failures:
+                    self.alerts[pattern.name].append((key, len(epochs), times[0], times[-1], time_generated))
+
+        self.processed += 1
+        if self.processed % self.SWEEP_INTERVAL == 0:
+            self.sweep(epoch)
+
+    @staticmethod
+    def evict(epochs: Deque[int], times: Deque[str], now: int, window: float) -> None:
+        while epochs and now - epochs[0] > window:
+            epochs.popleft()
+            times.popleft()
+
+    def sweep(self, now: int) -> None:
+        for state in self.state:
+            stale = [key for key, (epochs, _) in state.items() if not epochs or now - epochs[-1] > self.max_window]
+            for key in stale:
+                del state[key]
+
+def run_sequence_patterns(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime,
+                          patterns: List[SequencePattern] = DEFAULT_SEQUENCE_PATTERNS) -> Dict[str, List[Tuple]]:
+    conditions, params = build_conditions(start_datetime, end_datetime)
+    event_ids = sorted({pattern.failure_event for pattern in patterns} | {pattern.success_event for pattern in patterns})
+    query = f"""
+    SELECT CAST(strftime('%s', replace(Time_Generated, '/', '-')) AS INTEGER), Time_Generated,
+           IP_Address, Source_User, Event_ID, Status
+    FROM GlobalProtectLogs
+    WHERE Event_ID IN ({','.join('?' * len(event_ids))})
+    {'AND ' + conditions if conditions else ''}
+    ORDER BY Time_Generated ASC;
+    """
+    engine = SequencePatternEngine(patterns)
+    for epoch, time_generated, ip, user, event_id, status in iter_query(conn, query, event_ids + params):
+        if epoch is None:
+            continue
+        engine.process(epoch, time_generated, {'IP_Address': ip, 'Source_User': user}, event_id, status)
+    logger.info(f"Evaluated {len(patterns)} sequence patterns over {engine.processed} events.")
+    return engine.alerts
+
 def print_query_results(results: List[Tuple[Any, ...]], headers: List[str]) -> None:
     column_widths = [len(header) for header in headers]
     for row in results:
@@ -47,27 +171,30 @@ def print_query_results(results: List[Tuple[Any, ...]], headers: List[str]) -> N
     for row in results:
         print(row_format.format(*row))
 
-def print_daily_status_summary(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> str:
-    query = """
-    SELECT strftime('%Y-%m-%d', datetime(substr(Time_Generated, 1, 4) || '-' || 
-                                          substr(Time_Generated, 6, 2) || '-' || 
-                                          substr(Time_Generated, 9, 2) || ' ' || 
-                                          substr(Time_Generated, 12))) AS Date, 
-           Status, COUNT(*) AS Count
+def fetch_daily_status_counts(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> List[Tuple]:
+    # Time_Generated is compared as stored, so the range is a search of its index;
+    # results are kept per day by day_results rather than the query cache
+    conditions, params = build_conditions(start_datetime, end_datetime)
+    query = f"""
+    SELECT replace(substr(Time_Generated, 1, 10), '/', '-') AS Date, Status, COUNT(*) AS Count
     FROM GlobalProtectLogs
-    WHERE datetime(substr(Time_Generated, 1, 4) || '-' || 
-                  substr(Time_Generated, 6, 2) || '-' || 
-                  substr(Time_Generated, 9, 2) || ' ' || 
-                  substr(Time_Generated, 12)) >= datetime(?)
-    AND datetime(substr(Time_Generated, 1, 4) || '-' || 
-                substr(Time_Generated, 6, 2) || '-' || 
-                substr(Time_Generated, 9, 2) || ' ' || 
-                substr(Time_Generated, 12)) <= datetime(?)
+    WHERE {conditions}
     GROUP BY Date, Status
     ORDER BY Date, Status DESC;
     """
-    params = [start_datetime.strftime("%Y-%m-%d %H:%M:%S"), end_datetime.strftime("%Y-%m-%d %H:%M:%S")]
-    results = execute_query(conn, query, params)
+    return execute_query(conn, query, params)
+
+# Bump when fetch_daily_status_counts changes, so stored days are recomputed
+DAILY_STATUS_VERSION = 2
+
+def daily_status_counts(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> List[Tuple]:
+    # Rows are grouped by date, so the range is the concatenation of its days
+    days = day_results(conn, 'daily_status', DAILY_STATUS_VERSION, ['GlobalProtectLogs'], start_datetime, end_datetime,
+                       fetch_daily_status_counts)
+    return [row for rows in days for row in rows]
+
+def print_daily_status_summary(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> str:
+    results = daily_status_counts(conn, start_datetime, end_datetime)
     
     summary = "\nDaily Status Summary:\n"
     if not results:
@@ -84,4 +211,261 @@ def print_daily_status_summary(conn: sqlite3.Connection, start_datetime: datetim
             current_date = date
         summary += f"  {status.capitalize()} count: {count}\n"
     logger.info("Generated daily status summary.")
-    return summary
\ No newline at end of file
+    return summary
+
+# The password-spray view looks back this many days from the end of the report window
+PASSWORD_SPRAY_DAYS = int(os.getenv('PASSWORD_SPRAY_DAYS', '28'))
+
+def password_spray_summary(conn: sqlite3.Connection, end_datetime: datetime, days: int = PASSWORD_SPRAY_DAYS, top_n: int = 10) -> str:
+    # Whole days, so every day but the last comes straight from the stored sketches
+    start_datetime = datetime.combine((end_datetime - timedelta(days=days - 1)).date(), datetime.min.time())
+    time_range = (start_datetime.strftime("%Y/%m/%d %H:%M:%S"), end_datetime.strftime("%Y/%m/%d %H:%M:%S"))
+    ip_rows = top_distinct_counts(conn, 'ip_failed_users', start_datetime, end_datetime, top_n)
+    user_rows = top_distinct_counts(conn, 'user_ips', start_datetime, end_datetime, top_n)
+    regions = fetch_latest_labels(conn, 'GlobalProtectLogs', 'IP_Address', 'Source_Region', [ip for ip, _ in ip_rows], *time_range)
+
+    summary = f"\nPassword spray candidates, {time_range[0]} to {time_range[1]}:\n"
+    summary += "IPs by distinct usernames with failed logins:\n"
+    if not ip_rows:
+        summary += "  No failed logins in this range.\n"
+    for ip, usernames in ip_rows:
+        summary += f"  {ip} ({regions.get(ip) or 'Unknown'}): ~{usernames} usernames\n"
+    summary += "Usernames by distinct source IPs:\n"
+    if not user_rows:
+        summary += "  No logins in this range.\n"
+    for user, ips in user_rows:
+        summary += f"  {user}: ~{ips} IPs\n"
+    summary += f"Distinct counts are HyperLogLog estimates (standard error about {HyperLogLog().relative_error:.1%}).\n"
+    logger.info("Generated password spray summary.")
+    return summary
+
+# Successful logins by the same user from two different countries closer
+# together than this many minutes are reported as impossible travel
+IMPOSSIBLE_TRAVEL_MINUTES = float(os.getenv('IMPOSSIBLE_TRAVEL_MINUTES', '120'))
+
+# Last country login per user, so an incremental run continues where the last one stopped
+sql_create_travel_state = """CREATE TABLE IF NOT EXISTS TravelState (
+                               Source_User TEXT PRIMARY KEY,
+                               Source_Region TEXT NOT NULL,
+                               Epoch INTEGER NOT NULL,
+                               Time_Generated TEXT NOT NULL,
+                               IP_Address TEXT
+                             ) WITHOUT ROWID;"""
+
+sql_create_travel_alerts = """CREATE TABLE IF NOT EXISTS TravelAlerts (
+                                Source_User TEXT NOT NULL,
+                                Time_Generated TEXT NOT NULL,
+                                Source_Region TEXT NOT NULL,
+                                IP_Address TEXT,
+                                Previous_Region TEXT NOT NULL,
+                                Previous_Time TEXT NOT NULL,
+                                Minutes REAL NOT NULL,
+                                PRIMARY KEY(Source_User, Time_Generated, Source_Region)
+                              ) WITHOUT ROWID;"""
+
+# GlobalProtectLogs watermark (see get_table_watermark) the detector has
+# consumed up to: the last IngestLog batch id, or the last rowid before any
+# batch was recorded. Rows are picked up by when they arrived, not by their
+# Time_Generated, so late and backfilled logins are not missed
+sql_create_travel_progress = """CREATE TABLE IF NOT EXISTS TravelProgress (
+                                  Id INTEGER PRIMARY KEY CHECK (Id = 1),
+                                  Kind TEXT NOT NULL,
+                                  Value
+                                );"""
+
+class ImpossibleTravelDetector:
+    """Streams successful logins ordered by user and time, keeping one (region, epoch, time, ip) per user."""
+
+    def __init__(self, max_minutes: float = IMPOSSIBLE_TRAVEL_MINUTES, state: Optional[Dict[str, Tuple[str, int, str, str]]] = None):
+        self.max_seconds = max_minutes * 60
+        self.state: Dict[str, Tuple[str, int, str, str]] = state if state is not None else {}
+        self.alerts: List[Tuple] = []
+        self.processed = 0
+
+    def process(self, epoch: int, time_generated: str, user: str, region: str, ip: str) -> None:
+        self.processed += 1
+        if user in IGNORED_SEQUENCE_KEYS or not is_country_region(region) or region == 'N/A':
+            return
+        previous = self.state.get(user)
+        if previous is not None and previous[0] != region and epoch - previous[1] < self.max_seconds:
+            self.alerts.append((user, time_generated, region, ip, previous[0], previous[2], (epoch - previous[1]) / 60))
+        self.state[user] = (region, epoch, time_generated, ip)
+
+TRAVEL_EVENTS_QUERY = """
+    SELECT CAST(strftime('%s', replace(Time_Generated, '/', '-')) AS INTEGER), Time_Generated,
+           Source_User, Source_Region, IP_Address
+    FROM GlobalProtectLogs
+    WHERE Status = 'success' AND Source_User IS NOT NULL AND {conditions}
+    ORDER BY Source_User, Time_Generated, Source_Region, IP_Address;
+    """
+
+# Rows since the watermark are a small slice: read them by time or rowid and
+# sort them, rather than walk the whole user index (MATERIALIZED needs SQLite 3.35+)
+SQLITE_HAS_MATERIALIZED_CTE = sqlite3.sqlite_version_info >= (3, 35, 0)
+TRAVEL_NEW_EVENTS_QUERY = f"""
+    WITH new_logins AS {'MATERIALIZED' if SQLITE_HAS_MATERIALIZED_CTE else ''} (
+        SELECT CAST(strftime('%s', replace(Time_Generated, '/', '-')) AS INTEGER) AS Epoch, Time_Generated,
+               Source_User, Source_Region, IP_Address
+        FROM GlobalProtectLogs
+        WHERE Status = 'success' AND Source_User IS NOT NULL AND {{conditions}}
+    )
+    SELECT * FROM new_logins
+    ORDER BY Source_User, Time_Generated, Source_Region, IP_Address;
+    """
+
+def run_impossible_travel(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime,
+                          max_minutes: float = IMPOSSIBLE_TRAVEL_MINUTES) -> List[Tuple]:
+    """One pass over a window with fresh state.
+
+    ORDER BY walks idx_globalprotect_user_time; region and IP only order
+    logins that share a second, so the result does not depend on rowids.
+    """
+    conditions, params = build_conditions(start_datetime, end_datetime)
+    detector = ImpossibleTravelDetector(max_minutes)
+    for epoch, time_generated, user, region, ip in iter_query(conn, TRAVEL_EVENTS_QUERY.format(conditions=conditions), params):
+        if epoch is not None:
+            detector.process(epoch, time_generated, user, region, ip)
+    logger.info(f"Checked {detector.processed} logins for impossible travel and found {len(detector.alerts)} alerts.")
+    return detector.alerts
+
+# New batches are read as one Time_Generated range each; past this many, the
+# ranges separated by the shortest gaps are joined to keep the statement small
+TRAVEL_MAX_RANGES = int(os.getenv('TRAVEL_MAX_RANGES', '64'))
+
+def batch_time_ranges(spans: List[Tuple[str, str]], max_ranges: int = TRAVEL_MAX_RANGES) -> List[Tuple[str, str]]:
+    """Disjoint ranges covering the (min_time, max_time) spans, at most max_ranges of them."""
+    ranges: List[List[str]] = []
+    for start, end in sorted(spans):
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    if len(ranges) > max_ranges:
+        parse = lambda value: datetime.strptime(value, '%Y/%m/%d %H:%M:%S')
+        gaps = [parse(following[0]) - parse(previous[1]) for previous, following in zip(ranges, ranges[1:])]
+        # Keep the widest gaps as range boundaries and join across the rest
+        kept = set(sorted(range(len(gaps)), key=lambda i: gaps[i], reverse=True)[:max_ranges - 1])
+        joined = [ranges[0]]
+        for i, (start, end) in enumerate(ranges[1:]):
+            if i in kept:
+                joined.append([start, end])
+            else:
+                joined[-1][1] = end
+        ranges = joined
+    return [(start, end) for start, end in ranges]
+
+def new_login_conditions(conn: sqlite3.Connection, progress: Tuple[str, Any]) -> Optional[Tuple[str, Tuple]]:
+    """Conditions selecting the GlobalProtectLogs rows added since ``progress``, or None when nothing was added.
+
+    A batch only records the Time_Generated span it touched, so everything in
+    the spans of the new batches is read, each as its own index range; rows
+    consumed before are told apart by the per-user state.
+    """
+    kind, value = progress
+    if kind == 'batch':
+        spans = conn.execute("SELECT min_time, max_time FROM IngestLog WHERE table_name = 'GlobalProtectLogs' AND batch_id > ?",
+                             (value,)).fetchall()
+        if not spans:
+            return None
+        ranges = batch_time_ranges(spans)
+        conditions = " OR ".join("(Time_Generated >= ? AND Time_Generated <= ?)" for _ in ranges)
+        return f"({conditions})", tuple(bound for time_range in ranges for bound in time_range)
+    if kind == 'rowid':
+        return "rowid > ?", (value or 0,)
+    return "Time_Generated >= ?", (value or '0000/00/00 00:00:00',)
+
+def update_travel_alerts(conn: sqlite3.Connection, max_minutes: float = IMPOSSIBLE_TRAVEL_MINUTES) -> int:
+    """Run the detector over logins ingested since the stored watermark and persist alerts, state and watermark.
+
+    A user whose new logins start before their stored last login got rows
+    late (a backfill, or a batch that arrived out of order); their alerts
+    from that point on may be wrong, so the user is replayed from their whole
+    history instead. New rows sharing the stored login's second are only
+    skipped when they sort at or before it, as they were consumed last time.
+    """
+    try:
+        for statement in (sql_create_travel_state, sql_create_travel_alerts, sql_create_travel_progress):
+            conn.execute(statement)
+        # Superseded by TravelProgress, which tracks ingest rather than Time_Generated
+        conn.execute("DROP TABLE IF EXISTS TravelWatermark")
+        progress = conn.execute("SELECT Kind, Value FROM TravelProgress WHERE Id = 1").fetchone()
+        # Taken before reading, so rows ingested meanwhile are read again next time rather than missed
+        watermark = get_table_watermark(conn, 'GlobalProtectLogs')
+        state = {user: (region, epoch, time_generated, ip) for user, region, epoch, time_generated, ip
+                 in conn.execute("SELECT Source_User, Source_Region, Epoch, Time_Generated, IP_Address FROM TravelState")}
+    except sqlite3.Error as e:
+        logger.error(f"Error preparing impossible travel state: {e}")
+        return 0
+
+    # The first run, or one after the watermark changed kind, covers the whole
+    # history, which the user index walks without a sort
+    rebuild = progress is None or progress[0] != watermark[0]
+    detector = ImpossibleTravelDetector(max_minutes, {} if rebuild else state)
+    replay = set()
+    if rebuild:
+        increment = ("1 = 1", ())
+        query = TRAVEL_EVENTS_QUERY
+    else:
+        increment = new_login_conditions(conn, progress)
+        query = TRAVEL_NEW_EVENTS_QUERY
+    if increment is not None:
+        conditions, params = increment
+        for epoch, time_generated, user, region, ip in iter_query(conn, query.format(conditions=conditions), params):
+            if epoch is None or user in replay:
+                continue
+            previous = detector.state.get(user)
+            if previous and time_generated < previous[2]:
+                replay.add(user)
+                continue
+            if previous and time_generated == previous[2] and (region, ip or '') <= (previous[0], previous[3] or ''):
+                continue
+            detector.process(epoch, time_generated, user, region, ip)
+
+    replayed = ImpossibleTravelDetector(max_minutes)
+    if replay:
+        with temp_table(conn, 'travel_replay', 'Source_User TEXT PRIMARY KEY', [(user,) for user in replay]) as users:
+            conditions = f"Source_User IN (SELECT Source_User FROM {users})"
+            for epoch, time_generated, user, region, ip in iter_query(conn, TRAVEL_EVENTS_QUERY.format(conditions=conditions)):
+                if epoch is not None:
+                    replayed.process(epoch, time_generated, user, region, ip)
+        for user in replay:
+            detector.state.pop(user, None)
+        detector.state.update(replayed.state)
+
+    try:
+        with conn:
+            if rebuild:
+                conn.execute("DELETE FROM TravelAlerts")
+                conn.execute("DELETE FROM TravelState")
+            conn.executemany("DELETE FROM TravelAlerts WHERE Source_User = ?", [(user,) for user in replay])
+            conn.executemany("INSERT OR IGNORE INTO TravelAlerts VALUES(?,?,?,?,?,?,?)", detector.alerts + replayed.alerts)
+            conn.executemany("INSERT OR REPLACE INTO TravelState VALUES(?,?,?,?,?)",
+                             [(user, *values) for user, values in detector.state.items()])
+            conn.execute("INSERT OR REPLACE INTO TravelProgress(Id, Kind, Value) VALUES(1, ?, ?)", watermark)
+    except sqlite3.Error as e:
+        logger.error(f"Error storing impossible travel alerts: {e}")
+        return 0
+    logger.info(f"Checked {detector.processed} new logins for impossible travel, replayed {len(replay)} user(s) with late "
+                f"logins ({replayed.processed} logins) and stored {len(detector.alerts) + len(replayed.alerts)} alerts.")
+    return len(detector.alerts) + len(replayed.alerts)
+
+def fetch_travel_alerts(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> List[Tuple]:
+    query = """
+    SELECT Source_User, Previous_Region, Previous_Time, Source_Region, Time_Generated, IP_Address, Minutes
+    FROM TravelAlerts
+    WHERE Time_Generated >= ? AND Time_Generated <= ?
+    ORDER BY Time_Generated, Source_User;
+    """
+    params = (start_datetime.strftime("%Y/%m/%d %H:%M:%S"), end_datetime.strftime("%Y/%m/%d %H:%M:%S"))
+    return execute_query(conn, query, params)
+
+def impossible_travel_summary(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> str:
+    alerts = fetch_travel_alerts(conn, start_datetime, end_datetime)
+    summary = f"\nLogins by the same user from different countries less than {IMPOSSIBLE_TRAVEL_MINUTES:g} minutes apart:\n"
+    if not alerts:
+        summary += "No impossible travel found in the specified range."
+        return summary
+    for user, previous_region, previous_time, region, time_generated, ip, minutes in alerts:
+        summary += f"User: {user}, {previous_region} at {previous_time} -> {region} at {time_generated} ({minutes:.0f} min, IP {ip})\n"
+    logger.info("Generated impossible travel summary.")
+    return summary
@@ -0,0 +1,159 @@
+import bisect
+import heapq
+import ipaddress
+import logging
+import socket
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# NumPy is only needed once network indicators are matched, so plain
+# IP/username checks (query_file_database) never import it
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INVALID_IPV4 = b'\xff\xff\xff\xff\xff'
+
+def parse_indicator(text: str) -> Optional[Tuple[int, int, int]]:
+    """(version, first, last) for an IP, a CIDR or a 'first-last' range, None for anything else."""
+    text = text.strip()
+    try:
+        if '/' in text:
+            network = ipaddress.ip_network(text, strict=False)
+            return network.version, int(network.network_address), int(network.broadcast_address)
+        if '-' in text:
+            first, last = (ipaddress.ip_address(part.strip()) for part in text.split('-', 1))
+            if first.version != last.version or first > last:
+                return None
+            return first.version, int(first), int(last)
+        address = ipaddress.ip_address(text)
+        return address.version, int(address), int(address)
+    except ValueError:
+        return None
+
+def pack_ipv4(value: Optional[str]) -> bytes:
+    try:
+        return b'\x00' + socket.inet_pton(socket.AF_INET, value)
+    except (OSError, TypeError):
+        return INVALID_IPV4
+
+def ipv4_to_int(values: Sequence[Optional[str]]) -> Tuple['np.ndarray', 'np.ndarray']:
+    """Dotted-quad strings as int64, plus a mask of which values were valid IPv4 addresses."""
+    import numpy as np
+    # inet_pton is strict dotted-quad (unlike inet_aton); a leading flag byte marks
+    # invalid values, and the packed buffer decodes in one pass
+    packed = np.frombuffer(b''.join(map(pack_ipv4, values)), dtype='>u1').reshape(-1, 5)
+    addresses = packed[:, 1:].copy().view('>u4').ravel().astype('int64')
+    return addresses, packed[:, 0] == 0
+
+def flatten_intervals(intervals: List[Tuple[int, int, int]]) -> Tuple[List[int], List[int], List[Tuple[int, ...]]]:
+    """Disjoint (starts, ends, labels) segments from possibly overlapping (first, last, label) intervals.
+
+    Each segment carries the labels of every interval containing it, so an
+    address inside a /32 that sits in a /16 reports under both networks.
+    """
+    boundaries = sorted({first for first, _, _ in intervals} | {last + 1 for _, last, _ in intervals})
+    by_start = sorted(intervals)
+    starts, ends, labels = [], [], []
+    expiry: List[Tuple[int, int]] = []
+    # Open intervals per label, so a label outlives any one of its intervals
+    active: Dict[int, int] = {}
+    position = 0
+    for segment_start, next_boundary in zip(boundaries, boundaries[1:]):
+        while position < len(by_start) and by_start[position][0] == segment_start:
+            first, last, label = by_start[position]
+            heapq.heappush(expiry, (last, label))
+            active[label] = active.get(label, 0) + 1
+            position += 1
+        while expiry and expiry[0][0] < segment_start:
+            label = heapq.heappop(expiry)[1]
+            active[label] -= 1
+            if not active[label]:
+                del active[label]
+        if not active:
+            continue
+        segment_labels = tuple(sorted(active))
+        if labels and labels[-1] == segment_labels and ends[-1] + 1 == segment_start:
+            ends[-1] = next_boundary - 1
+        else:
+            starts.append(segment_start)
+            ends.append(next_boundary - 1)
+            labels.append(segment_labels)
+    return starts, ends, labels
+
+class IndicatorSet:
+    """Indicators from a feed file: plain items matched by equality, networks matched by range.
+
+    Single IPs and anything that is not an address (usernames) stay in `exact`
+    so they can keep using indexed equality lookups; CIDRs and ranges are
+    flattened into sorted interval arrays that log IPs are matched against in
+    bulk with a binary search.
+    """
+
+    def __init__(self, indicators: Iterable[str]):
+        self.exact: List[str] = []
+        self.networks: List[str] = []
+        intervals = {4: [], 6: []}
+        for indicator in indicators:
+            parsed = parse_indicator(indicator)
+            if parsed is None or '/' not in indicator and '-' not in indicator:
+                self.exact.append(indicator)
+                continue
+            version, first, last = parsed
+            intervals[version].append((first, last, len(self.networks)))
+            self.networks.append(indicator)
+
+        # Empty lists when there are no IPv4 networks, so NumPy is never imported for them
+        self.v4_starts = self.v4_ends = self.v4_label_offsets = self.v4_labels = []
+        if intervals[4]:
+            import numpy as np
+            starts, ends, labels = flatten_intervals(intervals[4])
+            self.v4_starts = np.array(starts, dtype='int64')
+            self.v4_ends = np.array(ends, dtype='int64')
+            # Labels of segment i are v4_labels[v4_label_offsets[i]:v4_label_offsets[i + 1]]
+            self.v4_label_offsets = np.cumsum([0] + [len(segment) for segment in labels], dtype='int64')
+            self.v4_labels = np.array([label for segment in labels for label in segment], dtype='int64')
+        # 128-bit addresses do not fit a numpy integer; IPv6 networks are rare in feeds, so plain lists
+        self.v6_starts, self.v6_ends, self.v6_labels = flatten_intervals(intervals[6])
+
+    @classmethod
+    def from_file(cls, filename: str) -> 'IndicatorSet':
+        with open(filename, 'r') as file:
+            return cls(file.read().splitlines())
+
+    def __len__(self) -> int:
+        return len(self.exact) + len(self.networks)
+
+    def match_networks(self, values: Sequence[Optional[str]]) -> List[Tuple[str, str]]:
+        """(network, value) for every network each value falls inside."""
+        if not self.networks or not len(values):
+            return []
+        import numpy as np
+        values = np.asarray(values, dtype='object')
+        addresses, is_v4 = ipv4_to_int(values)
+        pairs: List[Tuple[str, str]] = []
+        if len(self.v4_starts):
+            segment = np.searchsorted(self.v4_starts, addresses, side='right') - 1
+            hit = is_v4 & (segment >= 0)
+            hit[hit] &= addresses[hit] <= self.v4_ends[segment[hit]]
+            # One row per (value, containing network): repeat each hit by its segment's label count
+            rows = np.flatnonzero(hit)
+            first = self.v4_label_offsets[segment[rows]]
+            counts = self.v4_label_offsets[segment[rows] + 1] - first
+            within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            labels = self.v4_labels[np.repeat(first, counts) + within]
+            pairs.extend((self.networks[label], value) for label, value in zip(labels, values[np.repeat(rows, counts)]))
+        if self.v6_starts:
+            for value in values[~is_v4]:
+                pairs.extend((self.networks[label], value) for label in self.match_v6(value))
+        return pairs
+
+    def match_v6(self, value: Optional[str]) -> Tuple[int, ...]:
+        try:
+            address = ipaddress.ip_address(value)
+        except (TypeError, ValueError):
+            return ()
+        if address.version != 6:
+            return ()
+        segment = bisect.bisect_right(self.v6_starts, int(address)) - 1
+        return self.v6_labels[segment] if segment >= 0 and int(address) <= self.v6_ends[segment] else ()
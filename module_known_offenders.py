@@ -1,56 +1,132 @@
 import sqlite3
 import logging
-from typing import List, Tuple, Optional
-from module_database import create_connection
+from typing import Dict, List, Tuple, Optional
+from module_database import get_read_pool, temp_table, execute_query
+from module_indicators import IndicatorSet
+from module_watchlist import tagged_condition, tags_current, watchlist_for_file
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Per table: the columns an indicator is matched against (one indexed join each),
+# the natural key that identifies a row when it matches through more than one
+# column, and the three columns reported as GROUP_CONCAT(DISTINCT ...) lists
+OFFENDER_TABLES = {
+    'ThreatLogs': (('IP_Address', 'Destination_IP'), ('Time_Generated', 'IP_Address', 'Threat_ID'),
+                   ('IP_Address', 'Destination_IP', 'Source_Region')),
+    'GlobalProtectLogs': (('IP_Address', 'Source_User'), ('Time_Generated', 'IP_Address', 'Event_ID'),
+                          ('IP_Address', 'Source_User', 'Source_Region')),
+}
+
+# Match columns that hold addresses, and so are checked against CIDR and range indicators
+IP_COLUMNS = ('IP_Address', 'Destination_IP')
+
+def offender_time_range(start_date: Optional[str], end_date: Optional[str]) -> Tuple[str, str]:
+    return ((start_date or "0000/00/00") + " 00:00:00", (end_date or "9999/99/99") + " 23:59:59")
+
+def query_offender_aggregates(conn: sqlite3.Connection, items_table: str, table_name: str, start_date: Optional[str],
+                              end_date: Optional[str]) -> Dict[str, Tuple]:
+    match_columns, key_columns, report_columns = OFFENDER_TABLES[table_name]
+    selected = ", ".join(dict.fromkeys(f"t.{column}" for column in key_columns + report_columns))
+    # UNION (not UNION ALL) so a row matching the item in several columns counts once.
+    # CROSS JOIN pins the (item, value) list as the outer loop, so each value is an
+    # index probe on (column, Time_Generated) rather than a scan of the whole window.
+    matches = "\n        UNION\n".join(f"""
+        SELECT i.item, {selected}
+        FROM {items_table} i CROSS JOIN {table_name} t ON t.{column} = i.value
+        WHERE t.Time_Generated BETWEEN ? AND ?""" for column in match_columns)
+    query = f"""
+    WITH matches AS ({matches}
+    )
+    SELECT item, '{table_name}', MIN(Time_Generated), MAX(Time_Generated), COUNT(*),
+           {", ".join(f"GROUP_CONCAT(DISTINCT {column})" for column in report_columns)}
+    FROM matches
+    GROUP BY item;
+    """
+    params = offender_time_range(start_date, end_date) * len(match_columns)
+    return {row[0]: row[1:] for row in execute_query(conn, query, params)}
+
 def query_database_for_offenders(conn: sqlite3.Connection, item: str, start_date: str, end_date: str) -> List[Tuple]:
-    queries = [
-        {
-            "query": """
-            SELECT 'ThreatLogs', MIN(Time_Generated), MAX(Time_Generated), COUNT(*), GROUP_CONCAT(DISTINCT IP_Address), GROUP_CONCAT(DISTINCT Destination_IP), GROUP_CONCAT(DISTINCT Source_Region)
-            FROM ThreatLogs WHERE (IP_Address = ? OR Destination_IP = ?)
-            AND Time_Generated BETWEEN ? AND ?
-            """,
-            "params": (item, item, start_date + " 00:00:00", end_date + " 23:59:59")
-        },
-        {
-            "query": """
-            SELECT 'GlobalProtectLogs', MIN(Time_Generated), MAX(Time_Generated), COUNT(*), GROUP_CONCAT(DISTINCT IP_Address), GROUP_CONCAT(DISTINCT Source_User), GROUP_CONCAT(DISTINCT Source_Region)
-            FROM GlobalProtectLogs WHERE (IP_Address = ? OR Source_User = ?)
-            AND Time_Generated BETWEEN ? AND ?
-            """,
-            "params": (item, item, start_date + " 00:00:00", end_date + " 23:59:59")
-        }
-    ]
+    return search_offenders([item], conn, start_date, end_date)
+
+def fetch_distinct_values(conn: sqlite3.Connection, table_name: str, column: str, start_date: Optional[str],
+                          end_date: Optional[str]) -> List[str]:
+    query = f"SELECT DISTINCT {column} FROM {table_name} WHERE Time_Generated BETWEEN ? AND ? AND {column} IS NOT NULL;"
+    return [row[0] for row in execute_query(conn, query, offender_time_range(start_date, end_date))]
+
+def indicator_pairs(indicators: IndicatorSet, conn: sqlite3.Connection, start_date: Optional[str],
+                    end_date: Optional[str]) -> List[Tuple[str, str]]:
+    """(item, value) pairs to join on: each exact item against itself, each network against the log IPs inside it."""
+    pairs = [(item, item) for item in indicators.exact]
+    if indicators.networks:
+        values = set()
+        for table_name, (match_columns, _, _) in OFFENDER_TABLES.items():
+            for column in match_columns:
+                if column in IP_COLUMNS:
+                    values.update(fetch_distinct_values(conn, table_name, column, start_date, end_date))
+        pairs.extend(indicators.match_networks(list(values)))
+    return pairs
+
+def search_offenders(items: List[str], conn: sqlite3.Connection, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Tuple]:
+    """Per-item ThreatLogs and GlobalProtectLogs aggregates for every item, in input order.
+
+    Items may be IPs, usernames, CIDRs or 'first-last' ranges; a network item
+    aggregates every logged address inside it. Items without a match get the
+    same all-NULL, zero-count rows the per-item aggregate queries returned.
+    """
+    pairs = indicator_pairs(IndicatorSet(items), conn, start_date, end_date)
+    with temp_table(conn, 'offender_items', 'item TEXT, value TEXT, PRIMARY KEY(value, item)', pairs) as items_table:
+        aggregates = {table_name: query_offender_aggregates(conn, items_table, table_name, start_date, end_date)
+                      for table_name in OFFENDER_TABLES}
+
+    results = []
+    for item in items:
+        for table_name, found in aggregates.items():
+            results.append(found.get(item, (table_name, None, None, 0, None, None, None)))
+    return results
 
+def query_tagged_aggregates(conn: sqlite3.Connection, table_name: str, watchlist: str, start_date: Optional[str],
+                            end_date: Optional[str]) -> Dict[str, Tuple]:
+    # Rows were tagged at ingest with the indicators they matched, so this is a
+    # walk of the tagged-rows partial index rather than a join against the list
+    _, _, report_columns = OFFENDER_TABLES[table_name]
+    query = f"""
+    SELECT item.value, '{table_name}', MIN(t.Time_Generated), MAX(t.Time_Generated), COUNT(*),
+           {", ".join(f"GROUP_CONCAT(DISTINCT t.{column})" for column in report_columns)}
+    FROM {table_name} t, json_each(t.Additional_Data, '$.watchlists.{watchlist}') item
+    WHERE {tagged_condition('t')} AND t.Time_Generated BETWEEN ? AND ?
+    GROUP BY item.value;
+    """
+    return {row[0]: row[1:] for row in execute_query(conn, query, offender_time_range(start_date, end_date))}
+
+def search_tagged_offenders(items: List[str], conn: sqlite3.Connection, watchlist: str, start_date: Optional[str] = None,
+                            end_date: Optional[str] = None) -> List[Tuple]:
+    """search_offenders for a watchlist file, answered from the rows tagged at ingest."""
+    aggregates = {table_name: query_tagged_aggregates(conn, table_name, watchlist, start_date, end_date)
+                  for table_name in OFFENDER_TABLES}
     results = []
-    cursor = conn.cursor()
-    for q in queries:
-        cursor.execute(q["query"], q["params"])
-        results.extend(cursor.fetchall())
+    for item in items:
+        for table_name, found in aggregates.items():
+            results.append(found.get(item, (table_name, None, None, 0, None, None, None)))
     return results
 
 def read_and_search_offenders(filename: str, conn: sqlite3.Connection, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Tuple]:
     with open(filename, 'r') as file:
         items = file.read().splitlines()
 
-    results = []
-    for item in items:
-        item_results = query_database_for_offenders(conn, item, start_date, end_date)
-        results.extend(item_results)
-
-    return results
+    # Tags only stand in for the join while every table was retagged with this exact file
+    watchlist = watchlist_for_file(filename)
+    if watchlist and all(tags_current(conn, table_name, watchlist) for table_name in OFFENDER_TABLES):
+        return search_tagged_offenders(items, conn, watchlist, start_date, end_date)
+    if watchlist:
+        logger.info(f"Watchlist tags for {filename} are out of date; matching against the full logs (run make_database.py --tag-watchlists).")
+    return search_offenders(items, conn, start_date, end_date)
 
 def process_known_offenders(db_path: str, ips_file: str, start_date: str, end_date: str) -> List[Tuple]:
-    conn = create_connection(db_path)
-    if conn:
-        results = read_and_search_offenders(ips_file, conn, start_date, end_date)
-        conn.close()
-        logger.info("Processed known offenders from database.")
-        return results
-    else:
-        logger.error("Failed to create database connection.")
-        return []
\ No newline at end of file
+    with get_read_pool(db_path).connection() as conn:
+        if conn:
+            results = read_and_search_offenders(ips_file, conn, start_date, end_date)
+            logger.info("Processed known offenders from database.")
+            return results
+        else:
+            logger.error("Failed to create database connection.")
+            return []
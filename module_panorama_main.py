@@ -1,166 +1,312 @@
-import pandas as pd
+import argparse
+import multiprocessing
 from datetime import datetime, timedelta
-from module_database import create_connection
-from module_utility import get_validated_input, get_datetime_range, validate_datetime, get_user_confirmation
-from module_globalprotect_analysis import fetch_event_sequence, analyze_event_sequences, print_daily_status_summary
-from module_threat_analysis import threat_analysis, fetch_threat_counts_by_day
-from module_statistical_analysis import fetch_failed_logins, perform_statistical_analysis
-from module_entropy_analysis import fetch_login_data, calculate_entropy, identify_anomalies, fetch_all_login_data, calculate_hourly_entropy
-from module_known_offenders import process_known_offenders
-from module_pdf_report import PDFReport, print_and_append
-from module_chart_creation import create_bar_chart, create_stacked_bar_chart, create_entropy_heatmap
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from module_database import create_connection, get_read_pool, configure_query_cache, query_stats
+from module_utility import get_validated_input, get_datetime_range, validate_datetime, get_user_confirmation, configure_logging
+from module_report_cache import configure_day_results
 import os
 import logging
-from typing import List, Tuple, Optional
+from typing import TYPE_CHECKING, List, Tuple, Optional, Callable, Any, NamedTuple
+
+# The analysis, chart and PDF modules (pandas, matplotlib, fpdf) are imported
+# inside the sections that use them, so the date prompts appear immediately
+if TYPE_CHECKING:
+    from module_pdf_report import PDFReport
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-load_dotenv()
+DB_FILE = "panorama_logs.db"
+
+class ReportContext:
+    """Inputs shared by every report section.
+
+    Sections run on worker threads; each gets its own pooled read connection
+    through ``connection()`` and hands CPU-heavy pandas/scipy work to the
+    process pool through ``compute()``.
+    """
+
+    def __init__(self, start_datetime: datetime, end_datetime: datetime, start_datetime_input: str, end_datetime_input: str,
+                 exclude_own_ips: bool, processes: Optional[ProcessPoolExecutor] = None, exact: bool = False):
+        self.start_datetime = start_datetime
+        self.end_datetime = end_datetime
+        self.start_datetime_input = start_datetime_input
+        self.end_datetime_input = end_datetime_input
+        self.exclude_own_ips = exclude_own_ips
+        self.processes = processes
+        self.exact = exact
+        self.pool = get_read_pool(DB_FILE)
+
+    def connection(self):
+        return self.pool.connection()
+
+    def compute(self, func: Callable, *args) -> Any:
+        if self.processes is None:
+            return func(*args)
+        return self.processes.submit(func, *args).result()
+
+# Report items returned by sections and replayed into the PDF in order:
+#   ('text', message, to_terminal)
+#   ('chart', kind, payload, output_file)   see module_chart_creation.CHART_FIGURES
+#   ('ln', height)
+ReportItem = Tuple
+
+class ReportSection(NamedTuple):
+    title: str
+    run: Callable[[ReportContext], List[ReportItem]]
+
+def globalprotect_section(ctx: ReportContext) -> List[ReportItem]:
+    import pandas as pd
+    from module_chart_creation import stacked_bar_chart_payload
+    from module_globalprotect_analysis import (fetch_sequence_alerts, run_sequence_patterns, DEFAULT_SEQUENCE_PATTERNS,
+                                               print_daily_status_summary, daily_status_counts)
+    items = []
+    with ctx.connection() as conn:
+        alerts = fetch_sequence_alerts(conn, ctx.start_datetime, ctx.end_datetime)
+        if alerts:
+            alert_msg = "\nHeads-up! Found IPs with a failed 'portal-auth' followed by a successful 'gateway-auth':"
+            for alert in alerts:
+                alert_msg += f"\nIP: {alert[0]}, Failed portal-auth at {alert[1]}, Successful gateway-auth at {alert[2]}"
+            items.append(('text', alert_msg, True))
+        else:
+            alert_msg = "\nNo instances found of an IP with a failed 'portal-auth' followed by a successful 'gateway-auth'."
+            items.append(('text', alert_msg, True))
+
+        pattern_alerts = run_sequence_patterns(conn, ctx.start_datetime, ctx.end_datetime, DEFAULT_SEQUENCE_PATTERNS)
+        for pattern in DEFAULT_SEQUENCE_PATTERNS:
+            if pattern_alerts[pattern.name]:
+                pattern_msg = f"\n{pattern.description} ({pattern.min_failures}+ failures within {pattern.window_minutes:g} minutes):"
+                for key, failures, first_failure, last_failure, success in pattern_alerts[pattern.name]:
+                    pattern_msg += f"\n{pattern.key}: {key}, {failures} failures from {first_failure} to {last_failure}, Successful gateway-auth at {success}"
+                items.append(('text', pattern_msg, True))
+
+        items.append(('text', print_daily_status_summary(conn, ctx.start_datetime, ctx.end_datetime), True))
+
+        daily_status_df = pd.DataFrame(daily_status_counts(conn, ctx.start_datetime, ctx.end_datetime), columns=['Date', 'Status', 'Count'])
+
+    if not daily_status_df.empty:
+        daily_status_pivot = daily_status_df.pivot(index='Date', columns='Status', values='Count').fillna(0)
+        items.append(('chart', 'stacked_bar', stacked_bar_chart_payload(daily_status_pivot, "Daily Status Summary"), "daily_status_chart.png"))
+    return items
+
+def password_spray_section(ctx: ReportContext) -> List[ReportItem]:
+    from module_globalprotect_analysis import password_spray_summary
+    with ctx.connection() as conn:
+        return [('text', password_spray_summary(conn, ctx.end_datetime), True)]
+
+def impossible_travel_section(ctx: ReportContext) -> List[ReportItem]:
+    from module_globalprotect_analysis import impossible_travel_summary
+    with ctx.connection() as conn:
+        return [('text', impossible_travel_summary(conn, ctx.start_datetime, ctx.end_datetime), True)]
+
+def statistical_section(ctx: ReportContext) -> List[ReportItem]:
+    from module_baseline import failure_count_baseline
+    from module_chart_creation import bar_chart_payload
+    from module_statistical_analysis import failed_logins, perform_statistical_analysis, OUTLIER_SCORE_LABELS
+    with ctx.connection() as conn:
+        failed_login_counts = failed_logins(conn, ctx.start_datetime, ctx.end_datetime)
+        baseline = failure_count_baseline(conn, ctx.start_datetime.date())
+    if not failed_login_counts:
+        return [('text', "\nNo failed login attempts found within the specified range.", True)]
+
+    # OUTLIER_METHOD=mad scores IPs by median/MAD instead of mean/standard deviation
+    method = os.getenv('OUTLIER_METHOD', 'zscore')
+    outlier_summary = ctx.compute(perform_statistical_analysis, failed_login_counts, baseline, method)
+    label = OUTLIER_SCORE_LABELS[method]
+    if outlier_summary.empty:
+        return [('text', f"\nNo outliers found based on {label} analysis.", True)]
+
+    top_outliers = outlier_summary.head(10)
+    stat_msg = f"\nTop 10 IPs with unusual number of login attempts (Outliers), their country codes, and {label}s:"
+    for index, row in top_outliers.iterrows():
+        stat_msg += f"\n{row['IP_Address']} ({row['Source_Region']}): {row['Total Attempts']} attempts ({label}: {row['outlier_score']:.2f})"
+    outliers_dict = top_outliers.set_index('IP_Address')['Total Attempts'].to_dict()
+    return [
+        ('text', stat_msg, True),
+        ('chart', 'bar', bar_chart_payload(outliers_dict, "Top 10 Outliers by Total Attempts", "IP Address", "Total Attempts"), "outliers_chart.png"),
+    ]
+
+def entropy_section(ctx: ReportContext) -> List[ReportItem]:
+    from module_baseline import entropy_baseline
+    from module_chart_creation import bar_chart_payload
+    from module_entropy_analysis import daily_login_entropy, identify_anomalies
+    with ctx.connection() as conn:
+        daily_entropy = daily_login_entropy(conn, ctx.start_datetime, ctx.end_datetime)
+        baseline = entropy_baseline(conn, ctx.start_datetime.date())
+    if daily_entropy.empty:
+        return [('text', "\nNo login data found within the specified range.", True)]
+
+    anomaly_days, threshold = identify_anomalies(daily_entropy, baseline)
+
+    items = []
+    entropy_msg = "\nDays with unusually high entropy (anomalies):"
+    if not anomaly_days.empty:
+        for date, entropy_value in anomaly_days.items():
+            entropy_msg += f"\nDate: {date}, Entropy: {entropy_value:.2f}"
+        items.append(('text', entropy_msg, True))
+    else:
+        items.append(('text', "\nNo anomalies found based on entropy analysis.", True))
+
+    items.append(('chart', 'bar', bar_chart_payload(daily_entropy.to_dict(), "Daily Entropy Values", "Date", "Entropy", threshold), "entropy_chart.png"))
+    return items
+
+def entropy_heatmap_section(ctx: ReportContext) -> List[ReportItem]:
+    from module_chart_creation import entropy_heatmap_payload
+    from module_entropy_analysis import bucketed_login_entropy
+    with ctx.connection() as conn:
+        entropy_df = bucketed_login_entropy(conn, ctx.start_datetime, ctx.end_datetime, os.getenv('ENTROPY_BUCKET', '1h'), ctx.compute)
+    if entropy_df.empty:
+        return [('text', "\nNo login data found for heatmap within the specified range.", True)]
+
+    heatmap_output_file = f'entropy_heatmap.png'
+    return [('chart', 'entropy_heatmap', entropy_heatmap_payload(entropy_df), heatmap_output_file)]
+
+def threat_section(ctx: ReportContext) -> List[ReportItem]:
+    from module_threat_analysis import threat_analysis
+    with ctx.connection() as conn:
+        return [('text', threat_analysis(conn, ctx.start_datetime, ctx.end_datetime, ctx.exclude_own_ips, ctx.exact), True)]
+
+def daily_threat_section(ctx: ReportContext) -> List[ReportItem]:
+    from module_chart_creation import bar_chart_payload
+    from module_threat_analysis import threat_counts_by_day
+    items = []
+    with ctx.connection() as conn:
+        threat_counts = threat_counts_by_day(conn, ctx.start_datetime, ctx.end_datetime)
+    if not threat_counts.empty:
+        threat_counts_by_day_dict = threat_counts['Count'].to_dict()
+        items.append(('chart', 'bar', bar_chart_payload(threat_counts_by_day_dict, "Threat Counts by Day", "Date", "Count"), "threat_counts_chart.png"))
+    items.append(('ln', 10))
+    return items
+
+def known_offenders_section(ctx: ReportContext) -> List[ReportItem]:
+    from module_known_offenders import process_known_offenders
+    bad_ips_file = 'bad_ips.txt'
+    bad_ips_results = process_known_offenders(DB_FILE, bad_ips_file, ctx.start_datetime_input, ctx.end_datetime_input)
+
+    if not bad_ips_results:
+        return [('text', "\nNo bad IPs found within the specified range.", True)]
+
+    bad_ips_msg = "\nKnown Bad IPs found in logs:"
+    seen_bad_ips = set()
+    for result in bad_ips_results:
+        if result not in seen_bad_ips:
+            seen_bad_ips.add(result)
+            table_name, first_seen, last_seen, count, ip_addresses, destination_ips, source_regions = result
+            if table_name == 'ThreatLogs':
+                bad_ips_msg += f"\nTable: {table_name}, First Seen: {first_seen}, Last Seen: {last_seen}, Count: {count}, IPs: {ip_addresses}, Dest. IPs: {destination_ips}, Regions: {source_regions}"
+            elif table_name == 'GlobalProtectLogs':
+                bad_ips_msg += f"\nTable: {table_name}, First Seen: {first_seen}, Last Seen: {last_seen}, Count: {count}, IPs: {ip_addresses}, Users: {destination_ips}, Regions: {source_regions}"
+    return [('text', bad_ips_msg, True)]
+
+# Report sections in the order they appear in the PDF
+REPORT_SECTIONS = [
+    ReportSection('GlobalProtect Analysis', globalprotect_section),
+    ReportSection('Password Spray Candidates', password_spray_section),
+    ReportSection('Impossible Travel', impossible_travel_section),
+    ReportSection('Statistical Analysis', statistical_section),
+    ReportSection('Entropy Analysis', entropy_section),
+    ReportSection('Entropy Heatmap', entropy_heatmap_section),
+    ReportSection('Threat Analysis', threat_section),
+    ReportSection('Daily Count of Threats', daily_threat_section),
+    ReportSection('Known Offenders Analysis', known_offenders_section),
+]
+
+def run_sections(ctx: ReportContext, sections: List[ReportSection], workers: int) -> List[List[ReportItem]]:
+    if workers <= 1:
+        return [section.run(ctx) for section in sections]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(section.run, ctx) for section in sections]
+        return [future.result() for future in futures]
+
+def render_report_charts(results: List[List[ReportItem]], processes: Optional[ProcessPoolExecutor] = None) -> None:
+    from module_chart_creation import render_charts, write_chart
+    # Every chart of the report is rendered at once, one per worker, and written
+    # to its output file before the PDF is laid out
+    charts = [item for items in results for item in items if item[0] == 'chart']
+    images = render_charts([(kind, payload) for _, kind, payload, _ in charts], processes)
+    for (_, _, _, output_file), image in zip(charts, images):
+        write_chart(output_file, image)
+    logger.info(f"Rendered {len(charts)} charts.")
+
+def assemble_report(pdf: 'PDFReport', sections: List[ReportSection], results: List[List[ReportItem]]) -> None:
+    from module_pdf_report import print_and_append
+    for section, items in zip(sections, results):
+        pdf.chapter_title(section.title)
+        for item in items:
+            if item[0] == 'text':
+                print_and_append(pdf, item[1], to_terminal=item[2])
+            elif item[0] == 'chart':
+                pdf.add_image(item[3], w=180)
+            elif item[0] == 'ln':
+                pdf.ln(item[1])
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate the Panorama analysis report.")
+    parser.add_argument('--exact', action='store_true',
+                        help="Compute top-N IP tables with exact GROUP BY queries instead of the per-day sketches.")
+    return parser.parse_args()
 
 def main():
-    conn = create_connection("panorama_logs.db")
+    args = parse_args()
+    configure_logging()
+    from dotenv import load_dotenv
+    load_dotenv()
+    # Set QUERY_CACHE_PATH to keep query results between runs
+    configure_query_cache(os.getenv('QUERY_CACHE_PATH'))
+    # Per-day section results for closed days; set REPORT_CACHE_PATH empty to keep them in memory only
+    configure_day_results(os.getenv('REPORT_CACHE_PATH', 'report_cache.db'))
+    # REPORT_WORKERS=1 runs the sections one after another on the main thread
+    workers = int(os.getenv('REPORT_WORKERS', str(min(len(REPORT_SECTIONS), os.cpu_count() or 1))))
+    pool = get_read_pool(DB_FILE, size=max(workers, 1))
+    conn = pool.checkout()
     if conn:
+        pool.checkin(conn)
         now = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
         yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y/%m/%d %H:%M:%S")
         start_datetime_input = get_validated_input('Enter start date/time (YYYY/MM/DD HH:MM:SS), or leave blank: ', validate_datetime, yesterday)
         end_datetime_input = get_validated_input('Enter end date/time (YYYY/MM/DD HH:MM:SS), or leave blank: ', validate_datetime, now)
-        
+
         exclude_own_ips = get_user_confirmation('Do you want to exclude threats from IPs in the ' + os.getenv('ORG_IP_PREFIX') + '.*.* range? (yes/no): ', default='yes')
-        
+
         start_datetime, end_datetime = get_datetime_range(start_datetime_input, end_datetime_input)
 
+        from module_baseline import BASELINE_DAYS, update_daily_stats
+        from module_globalprotect_analysis import update_travel_alerts
+        from module_pdf_report import PDFReport
+
+        # Bring the per-day stats store up to date for the baseline and the window;
+        # days already stored are skipped, so a daily run only computes the new day
+        stats_conn = create_connection(DB_FILE)
+        if stats_conn:
+            update_daily_stats(stats_conn, start_datetime.date() - timedelta(days=BASELINE_DAYS), end_datetime.date())
+            # The travel detector only reads logins ingested since its stored watermark
+            update_travel_alerts(stats_conn)
+            stats_conn.close()
+
         pdf = PDFReport(start_datetime_input, end_datetime_input)
         pdf.add_page()
 
-        pdf.chapter_title('GlobalProtect Analysis')
-        events = fetch_event_sequence(conn, start_datetime, end_datetime)
-        alerts = analyze_event_sequences(events)
-        if alerts:
-            alert_msg = "\nHeads-up! Found IPs with a failed 'portal-auth' followed by a successful 'gateway-auth':"
-            for alert in alerts:
-                alert_msg += f"\nIP: {alert[0]}, Failed portal-auth at {alert[1]}, Successful gateway-auth at {alert[2]}"
-            print_and_append(pdf, alert_msg)
-        else:
-            alert_msg = "\nNo instances found of an IP with a failed 'portal-auth' followed by a successful 'gateway-auth'."
-            print_and_append(pdf, alert_msg)
-
-        daily_status_summary = print_daily_status_summary(conn, start_datetime, end_datetime)
-        print_and_append(pdf, daily_status_summary)
-
-        daily_status_df = pd.read_sql_query("""
-            SELECT strftime('%Y-%m-%d', datetime(substr(Time_Generated, 1, 4) || '-' || 
-                                                substr(Time_Generated, 6, 2) || '-' || 
-                                                substr(Time_Generated, 9, 2) || ' ' || 
-                                                substr(Time_Generated, 12))) AS Date, 
-                Status, COUNT(*) AS Count
-            FROM GlobalProtectLogs
-            WHERE datetime(substr(Time_Generated, 1, 4) || '-' || 
-                        substr(Time_Generated, 6, 2) || '-' || 
-                        substr(Time_Generated, 9, 2) || ' ' || 
-                        substr(Time_Generated, 12)) >= datetime(?)
-            AND datetime(substr(Time_Generated, 1, 4) || '-' || 
-                        substr(Time_Generated, 6, 2) || '-' || 
-                        substr(Time_Generated, 9, 2) || ' ' || 
-                        substr(Time_Generated, 12)) <= datetime(?)
-            GROUP BY Date, Status
-            ORDER BY Date, Status DESC;
-        """, conn, params=[start_datetime.strftime("%Y-%m-%d %H:%M:%S"), end_datetime.strftime("%Y-%m-%d %H:%M:%S")])
-
-        if not daily_status_df.empty:
-            daily_status_pivot = daily_status_df.pivot(index='Date', columns='Status', values='Count').fillna(0)
-            create_stacked_bar_chart(daily_status_pivot, "Daily Status Summary", "daily_status_chart.png")
-            pdf.add_image("daily_status_chart.png", w=180)
-
-        pdf.chapter_title('Statistical Analysis')
-        failed_logins = fetch_failed_logins(conn, start_datetime, end_datetime)
-        if failed_logins:
-            outlier_summary = perform_statistical_analysis(failed_logins)
-            if not outlier_summary.empty:
-                top_outliers = outlier_summary.head(10)
-                stat_msg = "\nTop 10 IPs with unusual number of login attempts (Outliers), their country codes, and Z-scores:"
-                for index, row in top_outliers.iterrows():
-                    stat_msg += f"\n{row['IP_Address']} ({row['Source_Region']}): {row['Total Attempts']} attempts (Z-score: {row['z_score']:.2f})"
-                print_and_append(pdf, stat_msg)
-                outliers_dict = top_outliers.set_index('IP_Address')['Total Attempts'].to_dict()
-                create_bar_chart(outliers_dict, "Top 10 Outliers by Total Attempts", "IP Address", "Total Attempts", "outliers_chart.png")
-                pdf.add_image("outliers_chart.png", w=180)
-            else:
-                print_and_append(pdf, "\nNo outliers found based on Z-score analysis.")
-        else:
-            print_and_append(pdf, "\nNo failed login attempts found within the specified range.")
-
-        pdf.chapter_title('Entropy Analysis')
-        login_data = fetch_login_data(conn, start_datetime, end_datetime)
-        if login_data:
-            df = pd.DataFrame(login_data, columns=['date', 'IP_Address'])
-            daily_entropy = calculate_entropy(df)
-            anomaly_days, threshold = identify_anomalies(daily_entropy)
-            
-            entropy_msg = "\nDays with unusually high entropy (anomalies):"
-            if not anomaly_days.empty:
-                for date, entropy_value in anomaly_days.items():
-                    entropy_msg += f"\nDate: {date}, Entropy: {entropy_value:.2f}"
-                print_and_append(pdf, entropy_msg)
-            else:
-                print_and_append(pdf, "\nNo anomalies found based on entropy analysis.")
-            
-            create_bar_chart(daily_entropy.to_dict(), "Daily Entropy Values", "Date", "Entropy", "entropy_chart.png", threshold=threshold)
-            pdf.add_image("entropy_chart.png", w=180)
-        else:
-            print_and_append(pdf, "\nNo login data found within the specified range.")
-
-        pdf.chapter_title('Entropy Heatmap')
-        all_login_data = fetch_all_login_data(conn, start_datetime, end_datetime)
-        if all_login_data:
-            df_all = pd.DataFrame(all_login_data, columns=['Time_Generated', 'IP_Address', 'Source_Region', 'Source_User'])
-            entropy_df = calculate_hourly_entropy(df_all)
-            heatmap_output_file = f'entropy_heatmap.png'
-            create_entropy_heatmap(entropy_df, start_datetime_input, end_datetime_input, heatmap_output_file)
-            pdf.add_image(heatmap_output_file, w=180)
-        else:
-            print_and_append(pdf, "\nNo login data found for heatmap within the specified range.")
-
-        pdf.chapter_title('Threat Analysis')
-        threat_output = threat_analysis(conn, start_datetime, end_datetime, exclude_own_ips)
-        print_and_append(pdf, threat_output)
-
-        pdf.chapter_title('Daily Count of Threats')
-        threat_counts_by_day = fetch_threat_counts_by_day(conn, start_datetime, end_datetime)
-        if not threat_counts_by_day.empty:
-            threat_counts_by_day_dict = threat_counts_by_day['Count'].to_dict()
-            create_bar_chart(threat_counts_by_day_dict, "Threat Counts by Day", "Date", "Count", "threat_counts_chart.png")
-            pdf.add_image("threat_counts_chart.png", w=180)
-
-        pdf.ln(10) 
-        pdf.chapter_title('Known Offenders Analysis')
-
-        bad_ips_file = 'bad_ips.txt'
-        bad_ips_results = process_known_offenders("panorama_logs.db", bad_ips_file, start_datetime_input, end_datetime_input)
-
-        if bad_ips_results:
-            bad_ips_msg = "\nKnown Bad IPs found in logs:"
-            seen_bad_ips = set()
-            for result in bad_ips_results:
-                if result not in seen_bad_ips:
-                    seen_bad_ips.add(result)
-                    table_name, first_seen, last_seen, count, ip_addresses, destination_ips, source_regions = result
-                    if table_name == 'ThreatLogs':
-                        bad_ips_msg += f"\nTable: {table_name}, First Seen: {first_seen}, Last Seen: {last_seen}, Count: {count}, IPs: {ip_addresses}, Dest. IPs: {destination_ips}, Regions: {source_regions}"
-                    elif table_name == 'GlobalProtectLogs':
-                        bad_ips_msg += f"\nTable: {table_name}, First Seen: {first_seen}, Last Seen: {last_seen}, Count: {count}, IPs: {ip_addresses}, Users: {destination_ips}, Regions: {source_regions}"
-            print_and_append(pdf, bad_ips_msg, to_terminal=True)
-        else:
-            print_and_append(pdf, "\nNo bad IPs found within the specified range.", to_terminal=True)
+        # Workers are started from section threads, so spawn rather than fork them
+        processes = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=configure_logging) if workers > 1 else None
+        try:
+            ctx = ReportContext(start_datetime, end_datetime, start_datetime_input, end_datetime_input, exclude_own_ips, processes, args.exact)
+            results = run_sections(ctx, REPORT_SECTIONS, workers)
+            render_report_charts(results, processes)
+        finally:
+            if processes is not None:
+                processes.shutdown()
 
-        conn.close()
+        assemble_report(pdf, REPORT_SECTIONS, results)
+        pdf.appendix_index()
+        pool.close()
 
         pdf.output("analysis_report.pdf")
         logger.info("Analysis report generated successfully.")
+        logger.info("Top queries by total time:\n" + query_stats.summary())
 
     else:
         logger.error("Error! Cannot create the database connection.")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
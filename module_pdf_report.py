@@ -1,16 +1,34 @@
 from fpdf import FPDF
 import pandas as pd
+import csv
 import logging
-from typing import Dict, Optional
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Sequence
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+LOGO_FILE = 'organization_logo.png'
+
+# Rows of a table and lines of a text block kept in the PDF; anything longer is
+# cut there and written in full to a CSV appendix next to the report
+PDF_MAX_TABLE_ROWS = int(os.getenv('PDF_MAX_TABLE_ROWS', '500'))
+PDF_MAX_BODY_LINES = int(os.getenv('PDF_MAX_BODY_LINES', '200'))
+
 class PDFReport(FPDF):
-    def __init__(self, start_date: str, end_date: str):
+    def __init__(self, start_date: str, end_date: str, appendix_prefix: str = 'analysis_report'):
         super().__init__()
         self.start_date = start_date
         self.end_date = end_date
+        self.appendix_prefix = appendix_prefix
+        self.appendices: List[str] = []
+        self.section = ''
+        # fpdf embeds each image file once per document and references it from
+        # every page; the file is checked once so a missing logo is skipped
+        # rather than failing on every header
+        self.logo = LOGO_FILE if os.path.exists(LOGO_FILE) else None
+        if self.logo is None:
+            logger.warning(f"{LOGO_FILE} not found; the report is generated without a logo.")
         self.alias_nb_pages()
 
     def header(self):
@@ -18,7 +36,8 @@ class PDFReport(FPDF):
         self.cell(0, 10, 'Panorama Analysis Report', 0, 1, 'L')
         self.set_font('Arial', '', 12)
         self.cell(0, 10, f'{self.start_date} to {self.end_date}', 0, 1, 'L')
-        self.image('organization_logo.png', x=170, y=10, w=30)
+        if self.logo:
+            self.image(self.logo, x=170, y=10, w=30)
         self.ln(20)
 
     def footer(self):
@@ -27,6 +46,7 @@ class PDFReport(FPDF):
         self.cell(0, 10, f'Page {self.page_no()}/{{nb}}', 0, 0, 'R')
 
     def chapter_title(self, title: str):
+        self.section = title
         self.set_font('Arial', 'B', 12)
         self.set_text_color(0, 0, 0)
         self.cell(0, 10, title, 0, 1, 'L')
@@ -36,26 +56,82 @@ class PDFReport(FPDF):
         self.set_font('Arial', '', 12)
         self.set_text_color(0, 0, 0)
         if body:
-            self.multi_cell(0, 10, body)
+            lines = body.split('\n')
+            if len(lines) > PDF_MAX_BODY_LINES:
+                appendix = self.write_appendix(['Line'], ([line] for line in lines if line))
+                lines = lines[:PDF_MAX_BODY_LINES] + [f"... {len(lines) - PDF_MAX_BODY_LINES} more lines in {appendix}"]
+            self.write_lines(lines, 10)
         self.ln()
 
+    def write_lines(self, lines: Sequence[str], h: float):
+        # Most lines fit the page width and go out as a single cell; only the
+        # long ones pay for multi_cell's word wrapping
+        width = self.w - self.r_margin - self.l_margin - 2 * self.c_margin
+        for line in lines:
+            if self.get_string_width(line) <= width:
+                self.cell(0, h, line, 0, 1)
+            else:
+                self.multi_cell(0, h, line)
+
     def add_image(self, image_path: str, x: Optional[float] = None, y: Optional[float] = None, w: float = 0, h: float = 0):
         self.image(image_path, x=x, y=y, w=w, h=h)
 
-    def add_table(self, data: pd.DataFrame, col_widths: Dict[str, float]):
+    def table_header(self, columns: Sequence[str], widths: Sequence[float], h: float):
         self.set_font('Arial', 'B', 12)
-        for header in data.columns:
-            self.cell(col_widths[header], 10, header, 1, 0, 'C')
+        for column, width in zip(columns, widths):
+            self.cell(width, h, column, 1, 0, 'C')
         self.ln()
-
         self.set_font('Arial', '', 12)
-        for index, row in data.iterrows():
-            for col in data.columns:
-                self.cell(col_widths[col], 10, str(row[col]), 1, 0, 'C')
+
+    def add_table(self, data: pd.DataFrame, col_widths: Dict[str, float], h: float = 10):
+        """Draw a DataFrame as a bordered table, repeating the header on every page it spans.
+
+        Cells are read from one string array per column rather than row by row;
+        tables longer than PDF_MAX_TABLE_ROWS show their first rows and point to
+        a CSV appendix holding all of them.
+        """
+        columns = [str(column) for column in data.columns]
+        widths = [col_widths[column] for column in data.columns]
+        shown = min(len(data), PDF_MAX_TABLE_ROWS)
+        values = [data[column].iloc[:shown].astype(str).tolist() for column in data.columns]
+
+        self.table_header(columns, widths, h)
+        for row in zip(*values):
+            if self.y + h > self.page_break_trigger:
+                self.add_page()
+                self.table_header(columns, widths, h)
+            for width, value in zip(widths, row):
+                self.cell(width, h, value, 1, 0, 'C')
             self.ln()
+
+        if len(data) > shown:
+            appendix = self.appendix_path()
+            data.to_csv(appendix, index=False)
+            self.appendices.append(appendix)
+            self.cell(0, h, f"... {len(data) - shown} more rows in {appendix}", 0, 1, 'L')
         self.ln()
 
+    def appendix_path(self) -> str:
+        slug = re.sub(r'[^a-z0-9]+', '_', self.section.lower()).strip('_') or 'report'
+        return f"{self.appendix_prefix}_appendix_{len(self.appendices) + 1}_{slug}.csv"
+
+    def write_appendix(self, headers: Sequence[str], rows: Iterable[Sequence]) -> str:
+        path = self.appendix_path()
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(headers)
+            writer.writerows(rows)
+        self.appendices.append(path)
+        logger.info(f"Wrote the full '{self.section}' section to {path}.")
+        return path
+
+    def appendix_index(self):
+        if not self.appendices:
+            return
+        self.chapter_title('Appendices')
+        self.chapter_body("Sections cut short in this report, written in full alongside it:\n" + "\n".join(self.appendices))
+
 def print_and_append(pdf: PDFReport, message: str, to_terminal: bool = True):
     if to_terminal:
         logger.info(message)
-    pdf.chapter_body(message)
\ No newline at end of file
+    pdf.chapter_body(message)
@@ -0,0 +1,131 @@
+import logging
+import pickle
+import sqlite3
+import sys
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from module_database import get_table_watermark
+from module_utility import day_range
+
+logger = logging.getLogger(__name__)
+
+# One result per (section, closed day, variant, version); Version is bumped when
+# a section's per-day computation changes, so results from older code are never reused
+sql_create_day_results = """CREATE TABLE IF NOT EXISTS DayResults (
+                              Section TEXT NOT NULL,
+                              Day TEXT NOT NULL,
+                              Variant TEXT NOT NULL,
+                              Version INTEGER NOT NULL,
+                              Watermark BLOB NOT NULL,
+                              Result BLOB NOT NULL,
+                              Computed_At TEXT DEFAULT CURRENT_TIMESTAMP,
+                              PRIMARY KEY(Section, Day, Variant, Version)
+                            ) WITHOUT ROWID;"""
+
+class DayResultStore:
+    """Per-day section results for closed days, tagged with the watermark each day was computed at.
+
+    Results are kept in memory for the life of the process and, when
+    ``persist_path`` is given, pickled into a small SQLite file so the next
+    report over an overlapping range only computes the days it has not seen.
+    """
+
+    def __init__(self, persist_path: Optional[str] = None):
+        self._memory: Dict[Tuple, Tuple[Tuple, Any]] = {}
+        self._lock = threading.Lock()
+        self._store = None
+        if persist_path:
+            self._store = sqlite3.connect(persist_path, check_same_thread=False)
+            self._store.execute(sql_create_day_results)
+            self._store.commit()
+
+    def get(self, section: str, version: int, day: str, variant: str, watermark: Tuple) -> Tuple[bool, Any]:
+        key = (section, day, variant, version)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._store is not None:
+                row = self._store.execute("""SELECT Watermark, Result FROM DayResults
+                                             WHERE Section = ? AND Day = ? AND Variant = ? AND Version = ?""", key).fetchone()
+                if row is not None:
+                    entry = (pickle.loads(row[0]), pickle.loads(row[1]))
+                    self._memory[key] = entry
+        if entry is not None and entry[0] == watermark:
+            return True, entry[1]
+        return False, None
+
+    def put(self, section: str, version: int, day: str, variant: str, watermark: Tuple, result: Any) -> None:
+        key = (section, day, variant, version)
+        with self._lock:
+            self._memory[key] = (watermark, result)
+            if self._store is not None:
+                with self._store:
+                    # Results of other versions of this section for the day can never be read again
+                    self._store.execute("DELETE FROM DayResults WHERE Section = ? AND Day = ? AND Variant = ? AND Version != ?", key)
+                    self._store.execute("""INSERT OR REPLACE INTO DayResults(Section, Day, Variant, Version, Watermark, Result)
+                                           VALUES(?,?,?,?,?,?)""", key + (pickle.dumps(watermark), pickle.dumps(result)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._store is not None:
+                with self._store:
+                    self._store.execute("DELETE FROM DayResults")
+
+_day_results = DayResultStore()
+
+def configure_day_results(persist_path: Optional[str] = None) -> DayResultStore:
+    global _day_results
+    _day_results = DayResultStore(persist_path)
+    return _day_results
+
+class DayPiece(NamedTuple):
+    start: datetime
+    end: datetime
+    # 'YYYY/MM/DD' when the piece covers the whole calendar day, None for a partial day
+    day: Optional[str]
+
+def split_days(start_datetime: datetime, end_datetime: datetime) -> List[DayPiece]:
+    """The inclusive [start, end] range cut at midnight into per-day pieces."""
+    pieces = []
+    current = start_datetime
+    while current <= end_datetime:
+        day_start = datetime.combine(current.date(), time.min)
+        day_end = day_start + timedelta(days=1) - timedelta(seconds=1)
+        piece_end = min(day_end, end_datetime)
+        whole_day = current == day_start and piece_end == day_end
+        pieces.append(DayPiece(current, piece_end, day_start.strftime('%Y/%m/%d') if whole_day else None))
+        current = day_end + timedelta(seconds=1)
+    return pieces
+
+def day_results(conn: sqlite3.Connection, section: str, version: int, tables: Sequence[str], start_datetime: datetime,
+                end_datetime: datetime, compute: Callable[[sqlite3.Connection, datetime, datetime], Any],
+                variant: Tuple = (), store: Optional[DayResultStore] = None) -> List[Any]:
+    """``compute(conn, start, end)`` for every day piece of the range, in order.
+
+    Whole days before today come from the store, and are only recomputed when
+    an ingest batch into one of ``tables`` has touched the day since they were
+    stored. Today and the partial days at either end of the range are always
+    computed fresh. ``variant`` holds any other input the result depends on.
+    """
+    store = store or _day_results
+    today = date.today().strftime('%Y/%m/%d')
+    pieces = split_days(start_datetime, end_datetime)
+    results = []
+    reused = 0
+    for piece in pieces:
+        if piece.day is None or piece.day >= today:
+            results.append(compute(conn, piece.start, piece.end))
+            continue
+        watermark = tuple(get_table_watermark(conn, table, day_range(piece.day)) for table in tables)
+        hit, result = store.get(section, version, piece.day, repr(variant), watermark)
+        if hit:
+            reused += 1
+        else:
+            result = compute(conn, piece.start, piece.end)
+            store.put(section, version, piece.day, repr(variant), watermark, result)
+        # Callers are free to modify the frames they get back
+        pd = sys.modules.get('pandas')
+        results.append(result.copy() if pd is not None and isinstance(result, (pd.DataFrame, pd.Series)) else result)
+    logger.info(f"{section}: reused {reused} of {len(pieces)} day result(s).")
+    return results
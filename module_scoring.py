@@ -0,0 +1,276 @@
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from module_baseline import failure_count_baseline
+from module_database import create_read_connection, execute_query, query_to_dataframe, record_ingest_batch, temp_table
+from module_globalprotect_analysis import DEFAULT_SEQUENCE_PATTERNS, IGNORED_SEQUENCE_KEYS, SequencePattern
+from module_sketch import table_exists
+from module_statistical_analysis import OUTLIER_THRESHOLDS
+from module_utility import configure_logging
+from module_watchlist import ALERT_LEVEL, TABLE_KEYS, WATCHLISTS
+
+logger = logging.getLogger(__name__)
+
+# Each signal scores a row in [0, 1]; a row's Suspicion_Level is
+# 1 + sum(weight * signal), rounded and clipped to the column's 1-10 range.
+# The watchlist signal is (list level - 1) / 9, so with weight 9 a watchlist
+# hit alone keeps the level ingest-time tagging gave it. SCORING_WEIGHTS
+# (JSON) overrides individual weights; a weight of 0 disables a signal.
+# Weak signals on their own (a foreign region, a medium-severity threat) stay
+# below ALERT_LEVEL; only rows at or above it count as alerts and land in the
+# flagged partial indexes.
+DEFAULT_SIGNAL_WEIGHTS = {
+    'watchlist': 9.0,
+    'failed_then_success': 4.0,
+    'outlier': 3.0,
+    'foreign_region': 1.0,
+    'threat_severity': 4.0,
+}
+SIGNAL_WEIGHTS = {**DEFAULT_SIGNAL_WEIGHTS, **json.loads(os.getenv('SCORING_WEIGHTS', '{}'))}
+
+# Source regions that are not foreign; private ranges are never foreign
+HOME_REGIONS = set(os.getenv('HOME_REGIONS', 'US').split(','))
+
+SEVERITY_SIGNALS = {'informational': 0.0, 'low': 0.25, 'medium': 0.5, 'high': 0.75, 'critical': 1.0}
+
+TABLE_SIGNALS = {
+    'TrafficLogs': ('watchlist', 'foreign_region'),
+    'ThreatLogs': ('watchlist', 'foreign_region', 'threat_severity'),
+    'GlobalProtectLogs': ('watchlist', 'foreign_region', 'failed_then_success', 'outlier'),
+}
+
+# Columns read for scoring besides the table key
+SCORING_COLUMNS = {
+    'TrafficLogs': ('Source_Region', 'Additional_Data', 'Suspicion_Level'),
+    'ThreatLogs': ('Source_Region', 'Severity', 'Additional_Data', 'Suspicion_Level'),
+    'GlobalProtectLogs': ('Source_User', 'Source_Region', 'Event_ID', 'Status', 'Additional_Data', 'Suspicion_Level'),
+}
+
+# Rows before a scored range that are read for context only, so a sequence that
+# started before the range still counts
+SCORING_LOOKBACK = {
+    'TrafficLogs': timedelta(0),
+    'ThreatLogs': timedelta(0),
+    'GlobalProtectLogs': timedelta(minutes=max(pattern.window_minutes for pattern in DEFAULT_SEQUENCE_PATTERNS)),
+}
+
+SCORING_WORKERS = int(os.getenv('SCORING_WORKERS', str(os.cpu_count() or 1)))
+
+TIME_FORMAT = '%Y/%m/%d %H:%M:%S'
+
+def watchlist_signal(conn: sqlite3.Connection, df: pd.DataFrame) -> np.ndarray:
+    signal = np.zeros(len(df))
+    tagged = df['Additional_Data'].fillna('').str.startswith('{"watchlists"').to_numpy()
+    for index in np.flatnonzero(tagged):
+        lists = json.loads(df['Additional_Data'].iat[index]).get('watchlists', {})
+        levels = [WATCHLISTS[name][1] for name in lists if name in WATCHLISTS]
+        signal[index] = (max(levels) - 1) / 9 if levels else 0.0
+    return signal
+
+def foreign_region_signal(conn: sqlite3.Connection, df: pd.DataFrame) -> np.ndarray:
+    # Same rule as is_country_region: range labels like '10.0.0.0-10.255.255.255' are private
+    region = df['Source_Region'].fillna('').astype(str)
+    country = (region != '') & ~region.str.contains(r'[.\d]') & (region != 'N/A')
+    return (country & ~region.isin(HOME_REGIONS)).to_numpy(dtype='float64')
+
+def threat_severity_signal(conn: sqlite3.Connection, df: pd.DataFrame) -> np.ndarray:
+    return df['Severity'].astype(str).str.lower().map(SEVERITY_SIGNALS).fillna(0.0).to_numpy(dtype='float64')
+
+def sequence_pattern_hits(df: pd.DataFrame, epochs: np.ndarray, pattern: SequencePattern) -> np.ndarray:
+    """Success rows preceded by at least min_failures failures from the same key within the window.
+
+    Vectorised form of SequencePatternEngine: rows are sorted by (key, time)
+    and packed into one int64 (key code in the high bits, epoch in the low
+    bits), so a window start is a searchsorted and a failure count is a
+    difference of cumulative sums. As in the engine, a success clears the
+    key's earlier failures.
+    """
+    keys = df[pattern.key]
+    valid = ~keys.isin(IGNORED_SEQUENCE_KEYS).to_numpy() & ~keys.isna().to_numpy()
+    codes = pd.factorize(keys)[0].astype('int64')
+    packed = (codes << 32) | epochs
+    order = np.lexsort((epochs, codes))
+    packed = packed[order]
+
+    event_id = df['Event_ID'].to_numpy()[order]
+    status = df['Status'].to_numpy()[order]
+    is_failure = (event_id == pattern.failure_event) & (status == 'failure') & valid[order]
+    is_success = (event_id == pattern.success_event) & (status == 'success') & valid[order]
+    failures_before = np.concatenate(([0], np.cumsum(is_failure)))
+
+    window_start = np.searchsorted(packed, packed - int(pattern.window_minutes * 60), side='left')
+    positions = np.arange(len(packed))
+    last_success = np.maximum.accumulate(np.where(is_success, positions, -1))
+    previous_success = np.concatenate(([-1], last_success[:-1]))
+    window_start = np.maximum(window_start, previous_success + 1)
+
+    hits_sorted = is_success & (failures_before[positions] - failures_before[window_start] >= pattern.min_failures)
+    hits = np.zeros(len(packed), dtype=bool)
+    hits[order] = hits_sorted
+    return hits
+
+def failed_then_success_signal(conn: sqlite3.Connection, df: pd.DataFrame) -> np.ndarray:
+    epochs = pd.to_datetime(df['Time_Generated'], format=TIME_FORMAT, errors='coerce')
+    valid = epochs.notna().to_numpy()
+    epochs = np.where(valid, epochs.to_numpy(dtype='datetime64[s]').astype('int64'), 0)
+    hits = np.zeros(len(df), dtype=bool)
+    for pattern in DEFAULT_SEQUENCE_PATTERNS:
+        hits |= sequence_pattern_hits(df, epochs, pattern)
+    return (hits & valid).astype('float64')
+
+def outlier_signal(conn: sqlite3.Connection, df: pd.DataFrame) -> np.ndarray:
+    """Rows from an IP whose failures that day are a z-score outlier against the persisted daily baseline."""
+    threshold = OUTLIER_THRESHOLDS['zscore']
+    days = df['Time_Generated'].str.slice(0, 10)
+    signal = np.zeros(len(df))
+    if not table_exists(conn, 'DailyStats'):
+        return signal
+    for day in days.dropna().unique():
+        baseline = failure_count_baseline(conn, datetime.strptime(day, '%Y/%m/%d').date())
+        if baseline is None:
+            continue
+        mean, std = baseline
+        counts = dict(execute_query(conn, """
+            SELECT IP_Address, COUNT(*) FROM GlobalProtectLogs
+            WHERE Time_Generated >= ? AND Time_Generated <= ? AND Status = 'failure'
+            GROUP BY IP_Address;""", (f"{day} 00:00:00", f"{day} 23:59:59")))
+        on_day = (days == day).to_numpy()
+        z_scores = (df.loc[on_day, 'IP_Address'].map(counts).fillna(0).to_numpy(dtype='float64') - mean) / std
+        signal[on_day] = np.where(z_scores > threshold, np.clip(z_scores / (2 * threshold), 0, 1), 0.0)
+    return signal
+
+SIGNALS: Dict[str, Callable[[sqlite3.Connection, pd.DataFrame], np.ndarray]] = {
+    'watchlist': watchlist_signal,
+    'failed_then_success': failed_then_success_signal,
+    'outlier': outlier_signal,
+    'foreign_region': foreign_region_signal,
+    'threat_severity': threat_severity_signal,
+}
+
+def score_frame(conn: sqlite3.Connection, table_name: str, df: pd.DataFrame,
+                weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+    weights = SIGNAL_WEIGHTS if weights is None else weights
+    total = np.zeros(len(df))
+    for name in TABLE_SIGNALS[table_name]:
+        if weights.get(name):
+            total += weights[name] * SIGNALS[name](conn, df)
+    return np.clip(np.rint(1 + total), 1, 10).astype('int64')
+
+def score_range(conn: sqlite3.Connection, table_name: str, start_time: str, end_time: str,
+                weights: Optional[Dict[str, float]] = None) -> List[Tuple]:
+    """(level, *key) for the rows in [start_time, end_time] whose Suspicion_Level should change."""
+    keys = TABLE_KEYS[table_name]
+    columns = list(dict.fromkeys(keys + SCORING_COLUMNS[table_name]))
+    context_start = (datetime.strptime(start_time, TIME_FORMAT) - SCORING_LOOKBACK[table_name]).strftime(TIME_FORMAT)
+    df = query_to_dataframe(conn, f"""
+        SELECT {", ".join(columns)} FROM {table_name}
+        WHERE Time_Generated >= ? AND Time_Generated <= ?
+        ORDER BY Time_Generated;""", (context_start, end_time), columns=columns)
+    if df.empty:
+        return []
+
+    levels = score_frame(conn, table_name, df, weights)
+    changed = (df['Time_Generated'] >= start_time).to_numpy() & (levels != df['Suspicion_Level'].fillna(0).to_numpy())
+    updates = df.loc[changed, list(keys)]
+    updates.insert(0, 'level', levels[changed])
+    return list(updates.itertuples(index=False, name=None))
+
+# UPDATE ... FROM needs SQLite 3.33+; older libraries update row by row through the key index
+SQLITE_HAS_UPDATE_FROM = sqlite3.sqlite_version_info >= (3, 33, 0)
+
+def apply_scores(conn: sqlite3.Connection, table_name: str, updates: List[Tuple]) -> int:
+    """Write (level, *key) rows with one UPDATE ... FROM a temp table of scores."""
+    if not updates:
+        return 0
+    keys = TABLE_KEYS[table_name]
+    if not SQLITE_HAS_UPDATE_FROM:
+        conn.executemany(f"""UPDATE {table_name} SET Suspicion_Level = ?
+                             WHERE {" AND ".join(f"{key} IS ?" for key in keys)}""", updates)
+        conn.commit()
+        return len(updates)
+    with temp_table(conn, 'row_scores', f"level INTEGER, {', '.join(keys)}", updates) as scores_table:
+        conn.execute(f"""UPDATE {table_name} SET Suspicion_Level = s.level
+                         FROM {scores_table} s
+                         WHERE {" AND ".join(f"{table_name}.{key} IS s.{key}" for key in keys)}""")
+        conn.commit()
+    return len(updates)
+
+def score_time_range(conn: sqlite3.Connection, table_name: str, start_time: str, end_time: str) -> int:
+    """Re-score the rows in [start_time, end_time] in place."""
+    try:
+        return apply_scores(conn, table_name, score_range(conn, table_name, start_time, end_time))
+    except sqlite3.Error as e:
+        logger.error(f"Error scoring {table_name} rows: {e}")
+        return 0
+
+def score_day_chunk(db_file: str, table_name: str, start_time: str, end_time: str) -> List[Tuple]:
+    """Process-pool worker: score one chunk on its own read-only connection."""
+    conn = create_read_connection(db_file)
+    if conn is None:
+        logger.error(f"Could not open {db_file} to score {table_name} from {start_time} to {end_time}; chunk skipped.")
+        return []
+    try:
+        return score_range(conn, table_name, start_time, end_time)
+    finally:
+        conn.close()
+
+def rescore_table(conn: sqlite3.Connection, db_file: str, table_name: str, start_time: Optional[str] = None,
+                  end_time: Optional[str] = None, workers: int = SCORING_WORKERS) -> int:
+    """Re-score a historical range, one day per chunk, computing chunks in parallel.
+
+    Workers only read and score; the updates come back to this connection,
+    which is the only writer, and are applied as each chunk finishes.
+    """
+    span = conn.execute(f"SELECT MIN(Time_Generated), MAX(Time_Generated) FROM {table_name}").fetchone()
+    start_time, end_time = start_time or span[0], end_time or span[1]
+    if start_time is None or end_time is None:
+        return 0
+    day = datetime.strptime(start_time[:10], '%Y/%m/%d')
+    chunks = []
+    while day.strftime('%Y/%m/%d') <= end_time[:10]:
+        chunks.append((max(start_time, day.strftime(TIME_FORMAT)),
+                       min(end_time, (day + timedelta(days=1) - timedelta(seconds=1)).strftime(TIME_FORMAT))))
+        day += timedelta(days=1)
+
+    updated = 0
+    if workers <= 1 or len(chunks) == 1:
+        for chunk_start, chunk_end in chunks:
+            updated += apply_scores(conn, table_name, score_range(conn, table_name, chunk_start, chunk_end))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=configure_logging) as executor:
+            futures = [executor.submit(score_day_chunk, db_file, table_name, chunk_start, chunk_end)
+                       for chunk_start, chunk_end in chunks]
+            for future in futures:
+                updated += apply_scores(conn, table_name, future.result())
+    if updated:
+        record_ingest_batch(conn, table_name, start_time, end_time)
+    alerts = conn.execute(f"""SELECT COUNT(*) FROM {table_name}
+                              WHERE Suspicion_Level >= {ALERT_LEVEL} AND Time_Generated >= ? AND Time_Generated <= ?""",
+                          (start_time, end_time)).fetchone()[0]
+    logger.info(f"Re-scored {table_name} from {start_time} to {end_time}: {updated} row(s) changed, "
+                f"{alerts} at or above alert level {ALERT_LEVEL}.")
+    return updated
+
+def score_ingest_run(conn: sqlite3.Connection, db_file: str, table_name: str, start_time: str, end_time: str) -> int:
+    """Score what one ingest run fetched, once, after its last batch.
+
+    Daily signals such as the failure outlier only settle once a day is
+    complete, so every day the run closed is re-scored in full; the day
+    still open at end_time is scored from start_time on and is re-scored
+    in full by the run that closes it.
+    """
+    open_day = f"{end_time[:10]} 00:00:00"
+    updated = 0
+    if start_time < open_day:
+        closed_end = (datetime.strptime(open_day, TIME_FORMAT) - timedelta(seconds=1)).strftime(TIME_FORMAT)
+        updated += rescore_table(conn, db_file, table_name, f"{start_time[:10]} 00:00:00", closed_end)
+        start_time = open_day
+    return updated + score_time_range(conn, table_name, start_time, end_time)
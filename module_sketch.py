@@ -0,0 +1,482 @@
+import sqlite3
+import heapq
+import hashlib
+import json
+import math
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Sequence, Set, Tuple
+from module_database import execute_query, iter_query, temp_table
+from module_watchlist import ENTRY_COLUMNS, TABLE_KEYS
+
+logger = logging.getLogger(__name__)
+
+# Counters kept per sketch. Any key whose true count exceeds the sketch's
+# floor (at most total / capacity) is guaranteed to be tracked.
+SKETCH_CAPACITY = 1000
+
+class SpaceSaving:
+    """Mergeable Space-Saving heavy-hitter sketch.
+
+    Each tracked key carries an estimated count and the most it can overstate
+    the true count by, so ``count - error <= true count <= count``. Untracked
+    keys have a true count of at most ``floor``. Keys may carry a label (for
+    example the region last seen with an IP) that is not part of the key.
+    """
+
+    def __init__(self, capacity: int = SKETCH_CAPACITY):
+        self.capacity = capacity
+        self.counters: Dict[Hashable, List] = {}  # key -> [count, error, label]
+        self.floor = 0
+        self.total = 0
+        self._heap: List[Tuple[int, int, Hashable]] = []
+        self._sequence = 0
+
+    def _push(self, key: Hashable, count: int) -> None:
+        # Lazy min-heap: stale entries are skipped on eviction and compacted away
+        self._sequence += 1
+        heapq.heappush(self._heap, (count, self._sequence, key))
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self) -> None:
+        self._heap = [(entry[0], index, key) for index, (key, entry) in enumerate(self.counters.items())]
+        heapq.heapify(self._heap)
+
+    def update(self, key: Hashable, weight: int = 1, label: Any = None) -> None:
+        self.total += weight
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += weight
+            if label is not None:
+                counter[2] = label
+            self._push(key, counter[0])
+            return
+        if len(self.counters) < self.capacity:
+            self.counters[key] = [weight, 0, label]
+            self._push(key, weight)
+            return
+        while True:
+            count, _, evicted = heapq.heappop(self._heap)
+            if evicted in self.counters and self.counters[evicted][0] == count:
+                break
+        del self.counters[evicted]
+        self.floor = max(self.floor, count)
+        self.counters[key] = [count + weight, count, label]
+        self._push(key, count + weight)
+
+    @classmethod
+    def from_counts(cls, counts: Sequence[Tuple[Hashable, int, Any]], capacity: int = SKETCH_CAPACITY) -> 'SpaceSaving':
+        """Build a sketch from exact (key, count, label) rows, keeping the largest ``capacity``."""
+        sketch = cls(capacity)
+        ranked = sorted(counts, key=lambda row: row[1], reverse=True)
+        sketch.counters = {key: [count, 0, label] for key, count, label in ranked[:capacity]}
+        sketch.floor = ranked[capacity][1] if len(ranked) > capacity else 0
+        sketch.total = sum(row[1] for row in ranked)
+        sketch._rebuild_heap()
+        return sketch
+
+    def merge(self, other: 'SpaceSaving') -> 'SpaceSaving':
+        # A key missing from one side may have up to that side's floor there
+        merged = {}
+        for key in self.counters.keys() | other.counters.keys():
+            mine, theirs = self.counters.get(key), other.counters.get(key)
+            count = (mine[0] if mine else self.floor) + (theirs[0] if theirs else other.floor)
+            error = (mine[1] if mine else self.floor) + (theirs[1] if theirs else other.floor)
+            label = theirs[2] if theirs and (not mine or theirs[0] > mine[0]) else mine[2]
+            merged[key] = (key, count, error, label)
+
+        result = SpaceSaving(max(self.capacity, other.capacity))
+        ranked = sorted(merged.values(), key=lambda row: row[1], reverse=True)
+        result.counters = {key: [count, error, label] for key, count, error, label in ranked[:result.capacity]}
+        result.floor = self.floor + other.floor
+        if len(ranked) > result.capacity:
+            result.floor = max(result.floor, ranked[result.capacity][1])
+        result.total = self.total + other.total
+        result._rebuild_heap()
+        return result
+
+    def top(self, n: int, key_filter: Optional[Callable[[Hashable], bool]] = None) -> List[Tuple[Hashable, int, int, Any]]:
+        """Return up to n (key, count, error, label) rows, highest count first."""
+        rows = [(key, count, error, label) for key, (count, error, label) in self.counters.items()
+                if key_filter is None or key_filter(key)]
+        rows.sort(key=lambda row: (-row[1], tuple('' if value is None else str(value) for value in row[0])))
+        return rows[:n]
+
+    def to_json(self) -> str:
+        return json.dumps({'capacity': self.capacity, 'floor': self.floor, 'total': self.total,
+                           'counters': [[list(key), count, error, label] for key, (count, error, label) in self.counters.items()]})
+
+    @classmethod
+    def from_json(cls, payload: str) -> 'SpaceSaving':
+        data = json.loads(payload)
+        sketch = cls(data['capacity'])
+        sketch.floor = data['floor']
+        sketch.total = data['total']
+        sketch.counters = {tuple(key): [count, error, label] for key, count, error, label in data['counters']}
+        sketch._rebuild_heap()
+        return sketch
+
+# 2**8 one-byte registers per HyperLogLog: ~6.5% standard error in 256 bytes
+HLL_PRECISION = 8
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with a fixed 2**precision bytes of registers.
+
+    Values are hashed with a 64-bit blake2b (not the salted built-in hash) so registers built in
+    different processes and runs merge correctly.
+    """
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: Optional[bytearray] = None):
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+
+    def add(self, value: str) -> None:
+        hashed = int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+        index = hashed >> (64 - self.precision)
+        remainder = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is far more accurate while most registers are still empty
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def to_bytes(self) -> bytes:
+        # Sparse (index, rank) pairs while few registers are set, dense registers otherwise
+        occupied = [(index, rank) for index, rank in enumerate(self.registers) if rank]
+        if len(occupied) * 3 < len(self.registers):
+            return bytes([1, self.precision]) + b''.join(index.to_bytes(2, 'big') + bytes([rank]) for index, rank in occupied)
+        return bytes([0, self.precision]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> 'HyperLogLog':
+        sketch = cls(payload[1])
+        if payload[0] == 0:
+            sketch.registers = bytearray(payload[2:])
+        else:
+            for offset in range(2, len(payload), 3):
+                sketch.registers[int.from_bytes(payload[offset:offset + 2], 'big')] = payload[offset + 2]
+        return sketch
+
+class SketchDimension(NamedTuple):
+    table: str
+    key_columns: Tuple[str, ...]
+    label_column: Optional[str] = None
+    condition: str = ""
+
+# Dimensions kept per day; keys are always tuples of the key columns
+SKETCH_DIMENSIONS = {
+    'globalprotect_ip': SketchDimension('GlobalProtectLogs', ('IP_Address',), 'Source_Region'),
+    'globalprotect_failed_ip': SketchDimension('GlobalProtectLogs', ('IP_Address',), 'Source_Region', "Status = 'failure'"),
+    'threat_ip': SketchDimension('ThreatLogs', ('IP_Address', 'Source_Region')),
+}
+
+class DistinctDimension(NamedTuple):
+    table: str
+    key_column: str
+    value_column: str
+    condition: str = ""
+
+# Distinct values of value_column per key_column, one HyperLogLog per key per day
+DISTINCT_DIMENSIONS = {
+    'ip_users': DistinctDimension('GlobalProtectLogs', 'IP_Address', 'Source_User'),
+    'ip_failed_users': DistinctDimension('GlobalProtectLogs', 'IP_Address', 'Source_User', "Status = 'failure'"),
+    'user_ips': DistinctDimension('GlobalProtectLogs', 'Source_User', 'IP_Address'),
+}
+
+# Key '' holds the union of every key's sketch for the day and marks the day as built
+DAY_MARKER_KEY = ''
+
+sql_create_heavy_hitter_sketches = """CREATE TABLE IF NOT EXISTS HeavyHitterSketches (
+                                        Day TEXT NOT NULL,
+                                        Dimension TEXT NOT NULL,
+                                        Sketch TEXT NOT NULL,
+                                        PRIMARY KEY(Day, Dimension)
+                                      ) WITHOUT ROWID;"""
+
+sql_create_distinct_count_sketches = """CREATE TABLE IF NOT EXISTS DistinctCountSketches (
+                                          Dimension TEXT NOT NULL,
+                                          Day TEXT NOT NULL,
+                                          Key TEXT NOT NULL,
+                                          Registers BLOB NOT NULL,
+                                          PRIMARY KEY(Dimension, Day, Key)
+                                        ) WITHOUT ROWID;"""
+
+def full_days(start_datetime: datetime, end_datetime: datetime) -> Tuple[date, date]:
+    """First and last calendar days lying wholly inside [start, end]."""
+    first_full = start_datetime.date() if start_datetime.time() == datetime.min.time() else start_datetime.date() + timedelta(days=1)
+    last_full = end_datetime.date() if end_datetime.strftime("%H:%M:%S") == "23:59:59" else end_datetime.date() - timedelta(days=1)
+    return first_full, last_full
+
+def uncovered_ranges(start_datetime: datetime, end_datetime: datetime, stored_days: Set[str]) -> List[Tuple[str, str]]:
+    """Contiguous runs of [start, end] not covered by a stored day, one exact query each."""
+    first_full, last_full = full_days(start_datetime, end_datetime)
+    gaps = []
+    cursor = start_datetime
+    day = first_full
+    while day <= last_full:
+        if day.strftime("%Y/%m/%d") in stored_days:
+            day_start = datetime.combine(day, datetime.min.time())
+            if cursor < day_start:
+                gaps.append((cursor, day_start - timedelta(seconds=1)))
+            cursor = day_start + timedelta(days=1)
+        day += timedelta(days=1)
+    if cursor <= end_datetime:
+        gaps.append((cursor, end_datetime))
+    return [(gap_start.strftime("%Y/%m/%d %H:%M:%S"), gap_end.strftime("%Y/%m/%d %H:%M:%S")) for gap_start, gap_end in gaps]
+
+def table_exists(conn: sqlite3.Connection, table_name: str) -> bool:
+    return bool(execute_query(conn, "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)))
+
+def fetch_exact_counts(conn: sqlite3.Connection, dimension: SketchDimension, start_time: str, end_time: str,
+                       source: Optional[str] = None) -> List[Tuple[Tuple, int, Any]]:
+    """Exact (key, count, label) rows of a dimension, from its table or from ``source`` holding the same columns."""
+    key_list = ", ".join(dimension.key_columns)
+    label = dimension.label_column or "NULL"
+    condition = f"AND {dimension.condition}" if dimension.condition else ""
+    rows = execute_query(conn, f"""
+        SELECT {key_list}, {label}, COUNT(*)
+        FROM {source or dimension.table}
+        WHERE Time_Generated >= ? AND Time_Generated <= ? {condition}
+        GROUP BY {key_list};""", (start_time, end_time))
+    width = len(dimension.key_columns)
+    return [(tuple(row[:width]), row[-1], row[width]) for row in rows]
+
+def build_sketch(conn: sqlite3.Connection, dimension: SketchDimension, start_time: str, end_time: str,
+                 capacity: int = SKETCH_CAPACITY, source: Optional[str] = None) -> SpaceSaving:
+    return SpaceSaving.from_counts(fetch_exact_counts(conn, dimension, start_time, end_time, source), capacity)
+
+def refresh_day_sketches(conn: sqlite3.Connection, table_name: str, min_time: str, max_time: str) -> None:
+    """Rebuild the stored sketches of every day in [min_time, max_time] from table_name.
+
+    Each day is re-read in full, so this is for backfills and cleanup; hourly
+    ingest merges its batch into the stored days with merge_batch_sketches.
+    """
+    dimensions = {name: dimension for name, dimension in SKETCH_DIMENSIONS.items() if dimension.table == table_name}
+    distinct_dimensions = {name: dimension for name, dimension in DISTINCT_DIMENSIONS.items() if dimension.table == table_name}
+    if not dimensions and not distinct_dimensions:
+        return
+    try:
+        day = datetime.strptime(min_time[:10], "%Y/%m/%d")
+        last_day = datetime.strptime(max_time[:10], "%Y/%m/%d")
+    except ValueError:
+        logger.warning(f"Skipping sketch refresh for unparseable range {min_time} - {max_time}")
+        return
+    try:
+        conn.execute(sql_create_heavy_hitter_sketches)
+        conn.execute(sql_create_distinct_count_sketches)
+        while day <= last_day:
+            day_str = day.strftime("%Y/%m/%d")
+            start_time, end_time = f"{day_str} 00:00:00", f"{day_str} 23:59:59"
+            rows = [(day_str, name, build_sketch(conn, dimension, start_time, end_time).to_json())
+                    for name, dimension in dimensions.items()]
+            conn.executemany("INSERT OR REPLACE INTO HeavyHitterSketches(Day, Dimension, Sketch) VALUES(?,?,?)", rows)
+            for name, dimension in distinct_dimensions.items():
+                sketches = build_distinct_sketches(conn, dimension, start_time, end_time)
+                union = HyperLogLog()
+                for sketch in sketches.values():
+                    union.merge(sketch)
+                conn.execute("DELETE FROM DistinctCountSketches WHERE Dimension = ? AND Day = ?", (name, day_str))
+                conn.executemany("INSERT INTO DistinctCountSketches(Dimension, Day, Key, Registers) VALUES(?,?,?,?)",
+                                 [(name, day_str, key, sketch.to_bytes()) for key, sketch in sketches.items()] +
+                                 [(name, day_str, DAY_MARKER_KEY, union.to_bytes())])
+            conn.commit()
+            day += timedelta(days=1)
+    except sqlite3.Error as e:
+        logger.error(f"Error refreshing heavy-hitter sketches for {table_name}: {e}")
+
+def new_batch_entries(conn: sqlite3.Connection, table_name: str, entries: Sequence[Tuple]) -> List[Tuple]:
+    """The entries of a batch about to be upserted whose key is not stored yet, one per key.
+
+    Call before inserting. Only these rows add to the day sketches: upserting a
+    row that is already stored (hourly fetches share their boundary second)
+    must not count it twice.
+    """
+    columns = ENTRY_COLUMNS[table_name]
+    positions = [columns.index(key) for key in TABLE_KEYS[table_name]]
+    times = [entry[0] for entry in entries]
+    if not times:
+        return []
+    existing = set(iter_query(conn, f"""SELECT {", ".join(TABLE_KEYS[table_name])} FROM {table_name}
+                                        WHERE Time_Generated >= ? AND Time_Generated <= ?""", (min(times), max(times))))
+    fresh = {}
+    for entry in entries:
+        key = tuple(entry[position] for position in positions)
+        if key not in existing:
+            fresh[key] = entry
+    return list(fresh.values())
+
+def merge_batch_sketches(conn: sqlite3.Connection, table_name: str, entries: Sequence[Tuple]) -> None:
+    """Merge a batch of newly inserted entries (see new_batch_entries) into the stored day sketches.
+
+    The batch is grouped in SQL from a temp table and merged into each day's
+    SpaceSaving and per-key HyperLogLogs, so the cost follows the batch rather
+    than the day. A day with no stored sketches yet is built from the table once.
+    """
+    dimensions = {name: dimension for name, dimension in SKETCH_DIMENSIONS.items() if dimension.table == table_name}
+    distinct_dimensions = {name: dimension for name, dimension in DISTINCT_DIMENSIONS.items() if dimension.table == table_name}
+    if not entries or not dimensions and not distinct_dimensions:
+        return
+    days = set()
+    for entry in entries:
+        try:
+            days.add(datetime.strptime(entry[0][:10], "%Y/%m/%d").strftime("%Y/%m/%d"))
+        except (TypeError, ValueError):
+            continue
+
+    unbuilt = []
+    try:
+        conn.execute(sql_create_heavy_hitter_sketches)
+        conn.execute(sql_create_distinct_count_sketches)
+        with temp_table(conn, 'sketch_batch', ", ".join(ENTRY_COLUMNS[table_name]), list(entries)) as batch:
+            for day_str in sorted(days):
+                start_time, end_time = f"{day_str} 00:00:00", f"{day_str} 23:59:59"
+                stored = dict(execute_query(conn, "SELECT Dimension, Sketch FROM HeavyHitterSketches WHERE Day = ?", (day_str,)))
+                built = {row[0] for row in execute_query(
+                    conn, "SELECT Dimension FROM DistinctCountSketches WHERE Day = ? AND Key = ?", (day_str, DAY_MARKER_KEY))}
+                if not set(dimensions) <= set(stored) or not set(distinct_dimensions) <= built:
+                    unbuilt.append(day_str)
+                    continue
+
+                conn.executemany("INSERT OR REPLACE INTO HeavyHitterSketches(Day, Dimension, Sketch) VALUES(?,?,?)",
+                                 [(day_str, name, SpaceSaving.from_json(stored[name]).merge(
+                                     build_sketch(conn, dimension, start_time, end_time, source=batch)).to_json())
+                                  for name, dimension in dimensions.items()])
+                for name, dimension in distinct_dimensions.items():
+                    sketches = build_distinct_sketches(conn, dimension, start_time, end_time, source=batch)
+                    day_sketches = {key: HyperLogLog.from_bytes(registers) for key, registers in iter_query(conn, f"""
+                        SELECT Key, Registers FROM DistinctCountSketches
+                        WHERE Dimension = ? AND Day = ? AND (Key = ? OR Key IN (SELECT {dimension.key_column} FROM {batch}))""",
+                        (name, day_str, DAY_MARKER_KEY))}
+                    union = day_sketches.pop(DAY_MARKER_KEY)
+                    for key, sketch in sketches.items():
+                        day_sketches[key] = day_sketches[key].merge(sketch) if key in day_sketches else sketch
+                        union.merge(sketch)
+                    day_sketches[DAY_MARKER_KEY] = union
+                    conn.executemany("INSERT OR REPLACE INTO DistinctCountSketches(Dimension, Day, Key, Registers) VALUES(?,?,?,?)",
+                                     [(name, day_str, key, sketch.to_bytes()) for key, sketch in day_sketches.items()])
+                conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Error merging a batch into the day sketches for {table_name}: {e}")
+        return
+    for day_str in unbuilt:
+        refresh_day_sketches(conn, table_name, f"{day_str} 00:00:00", f"{day_str} 23:59:59")
+
+def delete_day_sketches(conn: sqlite3.Connection, before_day: str) -> None:
+    try:
+        conn.execute(sql_create_heavy_hitter_sketches)
+        conn.execute(sql_create_distinct_count_sketches)
+        conn.execute("DELETE FROM HeavyHitterSketches WHERE Day < ?", (before_day,))
+        conn.execute("DELETE FROM DistinctCountSketches WHERE Day < ?", (before_day,))
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Error deleting heavy-hitter sketches: {e}")
+
+def load_day_sketches(conn: sqlite3.Connection, name: str, first_day: str, last_day: str) -> Dict[str, SpaceSaving]:
+    if not table_exists(conn, 'HeavyHitterSketches'):
+        return {}
+    rows = execute_query(conn, "SELECT Day, Sketch FROM HeavyHitterSketches WHERE Dimension = ? AND Day >= ? AND Day <= ?",
+                         (name, first_day, last_day))
+    return {day: SpaceSaving.from_json(sketch) for day, sketch in rows}
+
+def range_sketch(conn: sqlite3.Connection, name: str, start_datetime: datetime, end_datetime: datetime,
+                 capacity: int = SKETCH_CAPACITY) -> SpaceSaving:
+    """Sketch of one dimension over [start, end]: stored sketches for the whole days
+    inside the range, exact counts for partial days at either end and for any day
+    that has no stored sketch yet."""
+    dimension = SKETCH_DIMENSIONS[name]
+    first_full, last_full = full_days(start_datetime, end_datetime)
+    stored = load_day_sketches(conn, name, first_full.strftime("%Y/%m/%d"), last_full.strftime("%Y/%m/%d")) if first_full <= last_full else {}
+    gaps = uncovered_ranges(start_datetime, end_datetime, set(stored))
+
+    sketch = SpaceSaving(capacity)
+    for day_sketch in stored.values():
+        sketch = sketch.merge(day_sketch)
+    for gap_start, gap_end in gaps:
+        sketch = sketch.merge(build_sketch(conn, dimension, gap_start, gap_end, capacity))
+    logger.info(f"Merged {len(stored)} stored day sketches and {len(gaps)} exact range(s) for {name}.")
+    return sketch
+
+def top_heavy_hitters(conn: sqlite3.Connection, name: str, start_datetime: datetime, end_datetime: datetime, n: int = 10,
+                      key_filter: Optional[Callable[[Hashable], bool]] = None) -> Tuple[List[Tuple[Hashable, int, int, Any]], int]:
+    """Top n (key, count, error, label) rows of a dimension and the largest error among them."""
+    rows = range_sketch(conn, name, start_datetime, end_datetime).top(n, key_filter)
+    return rows, max((row[2] for row in rows), default=0)
+
+def build_distinct_sketches(conn: sqlite3.Connection, dimension: DistinctDimension, start_time: str, end_time: str,
+                            sketches: Optional[Dict[str, HyperLogLog]] = None, source: Optional[str] = None) -> Dict[str, HyperLogLog]:
+    sketches = {} if sketches is None else sketches
+    condition = f"AND {dimension.condition}" if dimension.condition else ""
+    for key, value in iter_query(conn, f"""
+        SELECT {dimension.key_column}, {dimension.value_column}
+        FROM {source or dimension.table}
+        WHERE Time_Generated >= ? AND Time_Generated <= ? {condition}
+          AND {dimension.key_column} IS NOT NULL AND {dimension.key_column} <> '' AND {dimension.value_column} IS NOT NULL
+        GROUP BY {dimension.key_column}, {dimension.value_column};""", (start_time, end_time)):
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = HyperLogLog()
+        sketch.add(value)
+    return sketches
+
+def range_distinct_sketches(conn: sqlite3.Connection, name: str, start_datetime: datetime, end_datetime: datetime) -> Dict[str, HyperLogLog]:
+    """Per-key HyperLogLogs of one dimension over [start, end], merged from the stored
+    whole days plus exact rows for partial days and days not built yet."""
+    dimension = DISTINCT_DIMENSIONS[name]
+    first_full, last_full = full_days(start_datetime, end_datetime)
+    first_day, last_day = first_full.strftime("%Y/%m/%d"), last_full.strftime("%Y/%m/%d")
+    stored_days = set()
+    if first_full <= last_full and table_exists(conn, 'DistinctCountSketches'):
+        stored_days = {row[0] for row in execute_query(
+            conn, "SELECT Day FROM DistinctCountSketches WHERE Dimension = ? AND Day >= ? AND Day <= ? AND Key = ?",
+            (name, first_day, last_day, DAY_MARKER_KEY))}
+
+    sketches: Dict[str, HyperLogLog] = {}
+    if stored_days:
+        for key, registers in iter_query(conn, """
+            SELECT Key, Registers FROM DistinctCountSketches
+            WHERE Dimension = ? AND Day >= ? AND Day <= ? AND Key <> ?;""", (name, first_day, last_day, DAY_MARKER_KEY)):
+            day_sketch = HyperLogLog.from_bytes(registers)
+            if key in sketches:
+                sketches[key].merge(day_sketch)
+            else:
+                sketches[key] = day_sketch
+    gaps = uncovered_ranges(start_datetime, end_datetime, stored_days)
+    for gap_start, gap_end in gaps:
+        build_distinct_sketches(conn, dimension, gap_start, gap_end, sketches)
+    logger.info(f"Merged {len(stored_days)} stored days and {len(gaps)} exact range(s) for {name} ({len(sketches)} keys).")
+    return sketches
+
+def top_distinct_counts(conn: sqlite3.Connection, name: str, start_datetime: datetime, end_datetime: datetime,
+                        n: int = 10) -> List[Tuple[str, int]]:
+    """Top n (key, estimated distinct count) rows of a distinct-count dimension."""
+    estimates = [(key, sketch.estimate()) for key, sketch in range_distinct_sketches(conn, name, start_datetime, end_datetime).items()]
+    return heapq.nsmallest(n, estimates, key=lambda row: (-row[1], row[0]))
+
+def fetch_latest_labels(conn: sqlite3.Connection, table: str, key_column: str, label_column: str, keys: Sequence[str],
+                        start_time: str, end_time: str) -> Dict[str, Any]:
+    """Most recent label_column value for each of a handful of keys (e.g. the region of the top IPs)."""
+    labels = {}
+    for key in keys:
+        rows = execute_query(conn, f"""
+            SELECT {label_column} FROM {table}
+            WHERE {key_column} = ? AND Time_Generated >= ? AND Time_Generated <= ?
+            ORDER BY Time_Generated DESC LIMIT 1;""", (key, start_time, end_time))
+        labels[key] = rows[0][0] if rows else None
+    return labels
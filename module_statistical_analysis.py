@@ -1,43 +1,79 @@
 import pandas as pd
+import numpy as np
 from module_database import execute_query
 from module_utility import build_conditions
+from module_report_cache import day_results
 import logging
 import sqlite3
 from datetime import datetime
-from typing import List, Tuple
+from typing import Dict, List, Tuple, Optional
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def fetch_failed_logins(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> List[Tuple]:
+# Score above which an IP is reported: plain z-score, or the Iglewicz-Hoaglin
+# modified z-score (median/MAD) for the robust method
+OUTLIER_THRESHOLDS = {'zscore': 3.0, 'mad': 3.5}
+OUTLIER_SCORE_LABELS = {'zscore': 'Z-score', 'mad': 'robust (MAD) score'}
+
+# Bump when fetch_failed_login_days changes, so stored days are recomputed
+FAILED_LOGIN_DAYS_VERSION = 1
+
+def fetch_failed_login_days(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> List[Tuple]:
     conditions, params = build_conditions(start_datetime, end_datetime)
     query = f"""
-    SELECT IP_Address, Source_Region, Status
+    SELECT IP_Address, Source_Region, substr(Time_Generated, 1, 10) as date, COUNT(*) as attempts
     FROM GlobalProtectLogs
-    WHERE {conditions} AND Status = 'failure';
+    WHERE {conditions} AND Status = 'failure' AND IP_Address IS NOT NULL
+    GROUP BY IP_Address, Source_Region, date;
     """
     return execute_query(conn, query, params)
 
-def perform_statistical_analysis(data: List[Tuple]) -> pd.DataFrame:
-    df = pd.DataFrame(data, columns=['IP_Address', 'Source_Region', 'Status'])
-    failed_logins_df = df[df['Status'] == 'failure'].copy()
+def merge_failed_login_days(rows: List[Tuple]) -> List[Tuple]:
+    """(IP, region, total failures, IP's busiest day) rows from per-(IP, region, day) failure counts."""
+    totals: Dict[Tuple, int] = {}
+    daily: Dict[Tuple, int] = {}
+    for ip, region, day, attempts in rows:
+        totals[(ip, region)] = totals.get((ip, region), 0) + attempts
+        daily[(ip, day)] = daily.get((ip, day), 0) + attempts
+    peaks: Dict[str, int] = {}
+    for (ip, _), attempts in daily.items():
+        peaks[ip] = max(peaks.get(ip, 0), attempts)
+    # Same order as the GROUP BY: by IP, then region with NULL first
+    keys = sorted(totals, key=lambda key: (key[0], key[1] is not None, key[1] or ''))
+    return [(ip, region, totals[(ip, region)], peaks[ip]) for ip, region in keys]
+
+def failed_logins(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> List[Tuple]:
+    # Totals and peaks are re-derived from the per-day counts, so closed days come from the results store
+    days = day_results(conn, 'failed_login_days', FAILED_LOGIN_DAYS_VERSION, ['GlobalProtectLogs'], start_datetime, end_datetime,
+                       fetch_failed_login_days)
+    return merge_failed_login_days([row for rows in days for row in rows])
 
-    failed_login_counts = failed_logins_df.groupby('IP_Address').size()
-    mean_attempts = failed_login_counts.mean()
-    std_attempts = failed_login_counts.std()
+def outlier_scores(values: pd.Series, method: str = 'zscore', baseline: Optional[Tuple[float, float]] = None) -> pd.Series:
+    if method == 'mad':
+        median = values.median()
+        mad = (values - median).abs().median()
+        return 0.6745 * (values - median) / mad if mad else pd.Series(np.nan, index=values.index)
+    mean, std = baseline if baseline is not None else (values.mean(), values.std())
+    return (values - mean) / std
 
-    z_scores = (failed_login_counts - mean_attempts) / std_attempts
-    failed_logins_df['z_score'] = failed_logins_df['IP_Address'].map(z_scores)
+def perform_statistical_analysis(data: List[Tuple], baseline: Optional[Tuple[float, float]] = None, method: str = 'zscore') -> pd.DataFrame:
+    if method not in OUTLIER_THRESHOLDS:
+        raise ValueError(f"Unknown outlier method '{method}', expected one of {', '.join(OUTLIER_THRESHOLDS)}")
+    counts_df = pd.DataFrame(data, columns=['IP_Address', 'Source_Region', 'Total Attempts', 'peak_daily'])
 
-    outliers = failed_logins_df[failed_logins_df['z_score'] > 3]
+    if baseline is None or method == 'mad':
+        # Score each IP's failures over the whole window against the other IPs
+        per_ip = counts_df.groupby('IP_Address', sort=False)['Total Attempts'].sum()
+    else:
+        # The baseline holds per-IP daily counts, so score each IP's worst day in the window
+        per_ip = counts_df.groupby('IP_Address', sort=False)['peak_daily'].first()
+    scores = outlier_scores(per_ip.astype('float64'), method, baseline)
 
-    max_z_scores = outliers.groupby(['IP_Address', 'Source_Region'])['z_score'].max().reset_index()
+    counts_df['outlier_score'] = counts_df['IP_Address'].map(scores)
+    outliers = counts_df[(counts_df['outlier_score'] > OUTLIER_THRESHOLDS[method]) & counts_df['Source_Region'].notna()]
 
-    outlier_summary = max_z_scores.merge(
-        outliers.groupby(['IP_Address', 'Source_Region']).size().reset_index(name='Total Attempts'),
-        on=['IP_Address', 'Source_Region'],
-        how='left'
-    ).sort_values(by='Total Attempts', ascending=False)
+    outlier_summary = outliers[['IP_Address', 'Source_Region', 'outlier_score', 'Total Attempts']] \
+        .sort_values(by='Total Attempts', ascending=False, kind='stable').reset_index(drop=True)
 
     logger.info(f"Identified {len(outlier_summary)} outliers in failed login attempts.")
-    return outlier_summary
\ No newline at end of file
+    return outlier_summary
@@ -1,14 +1,16 @@
 from datetime import datetime, timedelta
 import os
 import pandas as pd
+import numpy as np
 from dotenv import load_dotenv
-from module_database import execute_query
+from module_database import execute_query, query_to_arrays
 from module_utility import print_query_results
+from module_sketch import top_heavy_hitters
+from module_report_cache import day_results
 import sqlite3
 import logging
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Dict
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 load_dotenv()
@@ -43,92 +45,122 @@ def get_user_confirmation(prompt: str) -> bool:
     user_input = input(prompt).lower()
     return user_input in ['yes', 'y']
 
-def threat_analysis(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime, exclude_own_ips: bool) -> str:
-    ip_exclusion_condition = "AND IP_Address NOT LIKE '" + os.getenv('ORG_IP_PREFIX') + ".%' " if exclude_own_ips else ""
+# Columns pulled once per threat_analysis run; every summary table is an aggregate over them
+THREAT_AGGREGATE_COLUMNS = ['Threat_ID', 'Severity', 'Source_Region', 'IP_Address', 'Action', 'Date']
+SEVERITY_ORDER = {'critical': 1, 'high': 2, 'medium': 3, 'low': 4, 'informational': 5}
 
-    params = [start_datetime.strftime("%Y/%m/%d %H:%M:%S"), end_datetime.strftime("%Y/%m/%d %H:%M:%S")]
+def count_groups(arrays: Dict[str, np.ndarray], columns: List[str], mask: Optional[np.ndarray] = None) -> List[Tuple]:
+    # Shift codes by one so NULL (-1) gets its own group, like GROUP BY does
+    codes = [arrays[column] + 1 for column in columns]
+    categories = [np.concatenate([np.array([None], dtype=object), arrays[f"{column}__categories"]]) for column in columns]
+    flat = np.ravel_multi_index(codes, [len(values) for values in categories]) if len(columns) > 1 else codes[0]
+    if mask is not None:
+        flat = flat[mask]
+    keys, counts = np.unique(flat, return_counts=True)
+    key_codes = np.unravel_index(keys, [len(values) for values in categories]) if len(columns) > 1 else (keys,)
+    values = [category[code] for category, code in zip(categories, key_codes)]
+    return [(*row[:-1], int(row[-1])) for row in zip(*values, counts)]
 
-    summary = ""
+def is_country_region(region: Optional[str]) -> bool:
+    return region is not None and not ('.' in region or any(ch.isdigit() for ch in region))
 
-    query_threat_ids = f"""
-    SELECT Threat_ID, Severity, COUNT(*) AS Count
+# Bump when fetch_threat_group_counts changes, so stored days are recomputed
+THREAT_GROUPS_VERSION = 1
+
+def fetch_threat_group_counts(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime, exclude_own_ips: bool,
+                              exact: bool = False) -> Dict[str, List[Tuple]]:
+    """Every (group, count) behind the threat summary tables, untruncated so ranges can be summed."""
+    org_prefix = os.getenv('ORG_IP_PREFIX')
+    ip_exclusion_condition = "AND IP_Address NOT LIKE '" + org_prefix + ".%' " if exclude_own_ips else ""
+    params = [start_datetime.strftime("%Y/%m/%d %H:%M:%S"), end_datetime.strftime("%Y/%m/%d %H:%M:%S")]
+    # Unless exact, the top IP table comes from the per-day sketches, so the
+    # scan skips IP_Address and never builds one group per distinct IP
+    columns = THREAT_AGGREGATE_COLUMNS if exact else [column for column in THREAT_AGGREGATE_COLUMNS if column != 'IP_Address']
+    query = f"""
+    SELECT {", ".join(columns[:-1])},
+           strftime('%Y-%m-%d', replace(Time_Generated, '/', '-')) AS Date
     FROM ThreatLogs
     WHERE Time_Generated >= ? AND Time_Generated <= ? {ip_exclusion_condition}
-    GROUP BY Threat_ID, Severity
-    ORDER BY Count DESC
-    LIMIT 10;
     """
-    summary += "\nTop 10 Threat IDs by count with severity:\n"
-    results = execute_query(conn, query_threat_ids, params)
-    summary += print_query_results(results, ["Threat ID", "Severity", "Count"])
+    arrays = query_to_arrays(conn, query, params, columns=columns, categoricals=columns)
 
-    query_country = f"""
-    SELECT Source_Region AS Country, COUNT(*) AS Threats
-    FROM ThreatLogs
-    WHERE Time_Generated >= ? AND Time_Generated <= ? 
-        AND Source_Region NOT LIKE '%.%'
-        AND Source_Region NOT GLOB '*[0-9]*' {ip_exclusion_condition}
-    GROUP BY Source_Region
-    ORDER BY Threats DESC
-    LIMIT 10;
-    """
-    summary += "\nThreat count by country:\n"
-    results = execute_query(conn, query_country, params)
-    summary += print_query_results(results, ["Country", "Threats"])
+    # Country and IP tables skip range-style regions ("10.0.0.0-10.255.255.255") and NULLs
+    regions = arrays['Source_Region__categories']
+    valid_region = np.array([False] + [is_country_region(region) for region in regions], dtype=bool)
+    country_mask = valid_region[arrays['Source_Region'] + 1]
 
-    query_top_ips = f"""
-    SELECT IP_Address, Source_Region, COUNT(*) AS Threat_Count
-    FROM ThreatLogs
-    WHERE Time_Generated >= ? AND Time_Generated <= ? 
-        AND Source_Region NOT LIKE '%.%'
-        AND Source_Region NOT GLOB '*[0-9]*' {ip_exclusion_condition}
-    GROUP BY IP_Address, Source_Region
-    ORDER BY Threat_Count DESC 
-    LIMIT 10; 
-    """
-    summary += "\nTop 10 IP addresses by threat count:\n"
-    results = execute_query(conn, query_top_ips, params)
-    summary += print_query_results(results, ["IP Address", "Source Region", "Threat Count"])
+    groups = {
+        'threat_ids': count_groups(arrays, ['Threat_ID', 'Severity']),
+        'countries': count_groups(arrays, ['Source_Region'], country_mask),
+        'severity': count_groups(arrays, ['Severity']),
+        'actions': count_groups(arrays, ['Action']),
+        'daily': count_groups(arrays, ['Date']),
+    }
+    if exact:
+        groups['top_ips'] = count_groups(arrays, ['IP_Address', 'Source_Region'], country_mask)
+    return groups
 
-    query_severity = f"""
-    SELECT Severity, COUNT(*) AS Count
-    FROM ThreatLogs
-    WHERE Time_Generated >= ? AND Time_Generated <= ? {ip_exclusion_condition}
-    GROUP BY Severity
-    ORDER BY CASE Severity
-        WHEN 'critical' THEN 1
-        WHEN 'high' THEN 2
-        WHEN 'medium' THEN 3
-        WHEN 'low' THEN 4
-        WHEN 'informational' THEN 5
-        ELSE 6
-    END;
-    """
-    summary += "\nBreakdown of threats by severity:\n"
-    results = execute_query(conn, query_severity, params)
-    summary += print_query_results(results, ["Severity", "Count"])
+def merge_group_counts(parts: List[Dict[str, List[Tuple]]]) -> Dict[str, List[Tuple]]:
+    """Sum (*key, count) rows of the same table across parts, in group-key order with NULL first."""
+    totals: Dict[str, Dict[Tuple, int]] = {}
+    for part in parts:
+        for name, rows in part.items():
+            table = totals.setdefault(name, {})
+            for row in rows:
+                table[row[:-1]] = table.get(row[:-1], 0) + row[-1]
+    key_order = lambda key: tuple((value is not None, '' if value is None else value) for value in key)
+    return {name: [(*key, table[key]) for key in sorted(table, key=key_order)] for name, table in totals.items()}
 
-    query_actions = f"""
-    SELECT Action, COUNT(*) AS Count
-    FROM ThreatLogs
-    WHERE Time_Generated >= ? AND Time_Generated <= ? {ip_exclusion_condition}
-    GROUP BY Action
-    ORDER BY Count DESC;
-    """
-    summary += "\nCount of each type of Action:\n"
-    results = execute_query(conn, query_actions, params)
-    summary += print_query_results(results, ["Action", "Count"])
+def fetch_threat_aggregates(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime, exclude_own_ips: bool,
+                            exact: bool = False) -> Dict[str, List[Tuple]]:
+    # Group counts add up across days, so closed days come from the results store
+    org_prefix = os.getenv('ORG_IP_PREFIX')
+    compute = lambda conn, start, end: fetch_threat_group_counts(conn, start, end, exclude_own_ips, exact)
+    days = day_results(conn, 'threat_groups', THREAT_GROUPS_VERSION, ['ThreatLogs'], start_datetime, end_datetime, compute,
+                       variant=(exclude_own_ips and org_prefix, exact))
+    groups = merge_group_counts(days)
 
-    query_daily = f"""
-    SELECT strftime('%Y-%m-%d', replace(Time_Generated, '/', '-')) AS Date, COUNT(*) AS Daily_Count
-    FROM ThreatLogs
-    WHERE Time_Generated >= ? AND Time_Generated <= ? {ip_exclusion_condition}
-    GROUP BY strftime('%Y-%m-%d', replace(Time_Generated, '/', '-'))
-    ORDER BY Date DESC;
-    """
+    # Highest count first; ties in group-key order, as SQLite's GROUP BY emits them
+    by_count = lambda row: (-row[-1], tuple('' if value is None else value for value in row[:-1]))
+    aggregates = {
+        'threat_ids': sorted(groups.get('threat_ids', []), key=by_count)[:10],
+        'countries': sorted(groups.get('countries', []), key=by_count)[:10],
+        'severity': sorted(groups.get('severity', []), key=lambda row: SEVERITY_ORDER.get(row[0], 6)),
+        'actions': sorted(groups.get('actions', []), key=by_count),
+        'daily': sorted(groups.get('daily', []), key=lambda row: (row[0] is not None, row[0] or ''), reverse=True),
+    }
+    if exact:
+        aggregates['top_ips'] = sorted(groups.get('top_ips', []), key=by_count)[:10]
+        aggregates['top_ips_error'] = 0
+    else:
+        own_ip = lambda ip: ip is None or ip.startswith(org_prefix + '.')
+        key_filter = lambda key: is_country_region(key[1]) and not (exclude_own_ips and own_ip(key[0]))
+        rows, max_error = top_heavy_hitters(conn, 'threat_ip', start_datetime, end_datetime, 10, key_filter)
+        aggregates['top_ips'] = [(*key, count, error) if max_error else (*key, count) for key, count, error, _ in rows]
+        aggregates['top_ips_error'] = max_error
+    return aggregates
+
+def threat_analysis(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime, exclude_own_ips: bool,
+                    exact: bool = False) -> str:
+    aggregates = fetch_threat_aggregates(conn, start_datetime, end_datetime, exclude_own_ips, exact)
+
+    summary = ""
+    summary += "\nTop 10 Threat IDs by count with severity:\n"
+    summary += print_query_results(aggregates['threat_ids'], ["Threat ID", "Severity", "Count"])
+    summary += "\nThreat count by country:\n"
+    summary += print_query_results(aggregates['countries'], ["Country", "Threats"])
+    summary += "\nTop 10 IP addresses by threat count:\n"
+    if aggregates['top_ips_error']:
+        summary += print_query_results(aggregates['top_ips'], ["IP Address", "Source Region", "Threat Count", "Max Overcount"])
+        summary += "Approximate counts: each may overstate the true count by at most its Max Overcount.\n"
+    else:
+        summary += print_query_results(aggregates['top_ips'], ["IP Address", "Source Region", "Threat Count"])
+    summary += "\nBreakdown of threats by severity:\n"
+    summary += print_query_results(aggregates['severity'], ["Severity", "Count"])
+    summary += "\nCount of each type of Action:\n"
+    summary += print_query_results(aggregates['actions'], ["Action", "Count"])
     summary += "\nDaily count of threats:\n"
-    results = execute_query(conn, query_daily, params)
-    summary += print_query_results(results, ["Date", "Daily Count"])
+    summary += print_query_results(aggregates['daily'], ["Date", "Daily Count"])
 
     return summary
 
@@ -142,4 +174,12 @@ def fetch_threat_counts_by_day(conn: sqlite3.Connection, start_datetime: datetim
     """
     params = [start_datetime.strftime("%Y/%m/%d %H:%M:%S"), end_datetime.strftime("%Y/%m/%d %H:%M:%S")]
     results = execute_query(conn, query, params)
-    return pd.DataFrame(results, columns=["Date", "Count"]).set_index("Date")
\ No newline at end of file
+    return pd.DataFrame(results, columns=["Date", "Count"]).set_index("Date")
+
+# Bump when fetch_threat_counts_by_day changes, so stored days are recomputed
+THREAT_COUNTS_VERSION = 1
+
+def threat_counts_by_day(conn: sqlite3.Connection, start_datetime: datetime, end_datetime: datetime) -> pd.DataFrame:
+    days = day_results(conn, 'threat_counts', THREAT_COUNTS_VERSION, ['ThreatLogs'], start_datetime, end_datetime,
+                       fetch_threat_counts_by_day)
+    return pd.concat(days) if days else fetch_threat_counts_by_day(conn, start_datetime, end_datetime)
\ No newline at end of file
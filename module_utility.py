@@ -2,9 +2,18 @@ from datetime import datetime, timedelta
 import logging
 from typing import List, Tuple, Optional, Callable, Any
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+def configure_logging(level: int = logging.INFO) -> None:
+    # Modules only create loggers; each entry point (and each worker process it
+    # spawns) configures the root logger once, so importing a module stays side-effect free
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+
+def day_range(day: str) -> List[str]:
+    return [f"{day} 00:00:00", f"{day} 23:59:59"]
+
 def validate_datetime(input_str: str) -> bool:
     formats = ["%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d %H", "%Y/%m/%d", "%Y/%m", "%Y"]
     for fmt in formats:
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from module_database import execute_query, record_ingest_batch, temp_table
+from module_indicators import IndicatorSet
+
+logger = logging.getLogger(__name__)
+
+# Watchlist name -> (indicator file, Suspicion_Level given to rows that match it)
+WATCHLISTS = {
+    'bad_ips': (os.getenv('BAD_IPS_FILE', 'bad_ips.txt'), 8),
+    'tor': (os.getenv('TOR_IPS_FILE', 'tor_ips.txt'), 5),
+}
+
+# Suspicion_Level at and above which a row is an alert. The flagged partial
+# indexes in make_database cover exactly these rows and the scorer reports
+# against the same threshold; by default it is the lowest watchlist level, so
+# every watchlist hit is an alert while a row with only weak signals is not
+ALERT_LEVEL = int(os.getenv('ALERT_LEVEL', str(min(level for _, level in WATCHLISTS.values()))))
+
+def tagged_condition(alias: str = '') -> str:
+    """SQL condition true for rows carrying watchlist tags in Additional_Data.
+
+    json_type raises on malformed JSON (an untagged row holds ''), hence the
+    json_valid guard. The idx_*_tagged partial indexes use this exact
+    expression, so queries must use it verbatim for SQLite to pick them.
+    """
+    column = f"{alias}.Additional_Data" if alias else 'Additional_Data'
+    return f"CASE WHEN json_valid({column}) THEN json_type({column}, '$.watchlists') END IS NOT NULL"
+
+# Columns of each log table in the order of the entry tuples built by
+# prepare_*_log_entry and inserted by the ingesters
+ENTRY_COLUMNS = {
+    'TrafficLogs': ('Time_Generated', 'IP_Address', 'Destination_IP', 'Source_Region', 'Destination_Region',
+                    'Application', 'Action', 'Proto', 'Bytes', 'Packets', 'Session_End_Reason', 'Rule',
+                    'Suspicion_Level', 'Additional_Data'),
+    'ThreatLogs': ('Time_Generated', 'IP_Address', 'Destination_IP', 'Source_Region', 'Destination_Region',
+                   'Application', 'Action', 'Threat_ID', 'Threat_Name', 'Severity', 'Category',
+                   'Suspicion_Level', 'Additional_Data'),
+    'GlobalProtectLogs': ('Time_Generated', 'IP_Address', 'Source_Region', 'Source_User', 'Portal',
+                          'Event_ID', 'Status', 'Suspicion_Level', 'Additional_Data'),
+}
+
+# Columns checked against the watchlists, with their position in the entry
+# tuples built by prepare_*_log_entry; Suspicion_Level and Additional_Data are
+# always the last two fields
+WATCH_COLUMNS = {
+    'TrafficLogs': {'IP_Address': 1, 'Destination_IP': 2},
+    'ThreatLogs': {'IP_Address': 1, 'Destination_IP': 2},
+    'GlobalProtectLogs': {'IP_Address': 1, 'Source_User': 3},
+}
+
+# Conflict key of each log table, used to update rows in place when retagging
+TABLE_KEYS = {
+    'TrafficLogs': ('Time_Generated', 'IP_Address', 'Destination_IP'),
+    'ThreatLogs': ('Time_Generated', 'IP_Address', 'Threat_ID'),
+    'GlobalProtectLogs': ('Time_Generated', 'IP_Address', 'Event_ID'),
+}
+
+# Digest of each watchlist file a table's history was last fully retagged with;
+# tags can only stand in for a scan while the file still has that digest
+sql_create_watchlist_state = """CREATE TABLE IF NOT EXISTS WatchlistState (
+                                  Table_Name TEXT NOT NULL,
+                                  Watchlist TEXT NOT NULL,
+                                  Digest TEXT NOT NULL,
+                                  Tagged_At TEXT DEFAULT CURRENT_TIMESTAMP,
+                                  PRIMARY KEY(Table_Name, Watchlist)
+                                ) WITHOUT ROWID;"""
+
+class Watchlist:
+    """One indicator file held in memory and reloaded whenever the file changes."""
+
+    def __init__(self, name: str, path: str, level: int):
+        self.name = name
+        self.path = path
+        self.level = level
+        self.signature: Optional[Tuple[int, int]] = None
+        self.digest = hashlib.sha256(b'').hexdigest()
+        self.indicators = IndicatorSet([])
+        self.exact: frozenset = frozenset()
+
+    def refresh(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+        if signature == self.signature:
+            return False
+
+        content = b''
+        if signature is not None:
+            with open(self.path, 'rb') as file:
+                content = file.read()
+        self.signature = signature
+        self.digest = hashlib.sha256(content).hexdigest()
+        self.indicators = IndicatorSet(content.decode('utf-8', errors='replace').splitlines())
+        self.exact = frozenset(item for item in self.indicators.exact if item.strip())
+        logger.info(f"Loaded {len(self.indicators)} indicators for watchlist '{self.name}' from {self.path}.")
+        return True
+
+    def match(self, values: Set[str]) -> Dict[str, List[str]]:
+        """value -> the indicators of this list it matches: itself if listed, and every listed network containing it."""
+        hits = {value: [value] for value in values & self.exact}
+        for network, value in self.indicators.match_networks(list(values)):
+            hits.setdefault(value, []).append(network)
+        return hits
+
+_watchlists: Optional[Dict[str, Watchlist]] = None
+
+def get_watchlists() -> Dict[str, Watchlist]:
+    global _watchlists
+    if _watchlists is None:
+        _watchlists = {name: Watchlist(name, path, level) for name, (path, level) in WATCHLISTS.items()}
+    for watchlist in _watchlists.values():
+        watchlist.refresh()
+    return _watchlists
+
+def watchlist_hits(values: Iterable[Optional[str]]) -> Dict[str, Dict[str, List[str]]]:
+    """value -> {watchlist: matching indicators} for the values that are on any watchlist."""
+    values = {value for value in values if value}
+    hits: Dict[str, Dict[str, List[str]]] = {}
+    for watchlist in get_watchlists().values():
+        for value, indicators in watchlist.match(values).items():
+            hits.setdefault(value, {})[watchlist.name] = indicators
+    return hits
+
+def row_tags(hits: Dict[str, Dict[str, List[str]]], values: Iterable[Optional[str]]) -> Optional[Tuple[int, str]]:
+    """(Suspicion_Level, Additional_Data) for a row with these watched values, or None if nothing matched."""
+    matched: Dict[str, Set[str]] = {}
+    for value in values:
+        for name, indicators in hits.get(value, {}).items():
+            matched.setdefault(name, set()).update(indicators)
+    if not matched:
+        return None
+    level = max(WATCHLISTS[name][1] for name in matched)
+    return level, json.dumps({'watchlists': {name: sorted(items) for name, items in sorted(matched.items())}})
+
+def tag_log_entries(table_name: str, entries: List[Tuple]) -> List[Tuple]:
+    """Raise Suspicion_Level and record the matching lists in Additional_Data for entries about to be written."""
+    positions = list(WATCH_COLUMNS[table_name].values())
+    hits = watchlist_hits(entry[position] for entry in entries for position in positions)
+    if not hits:
+        return entries
+    tagged = []
+    for entry in entries:
+        tags = row_tags(hits, (entry[position] for position in positions))
+        if tags is not None:
+            entry = entry[:-2] + (max(entry[-2], tags[0]), tags[1])
+        tagged.append(entry)
+    return tagged
+
+def clear_watchlist_tags(conn: sqlite3.Connection, table_name: str) -> None:
+    conn.execute(f"""UPDATE {table_name} SET Suspicion_Level = 1, Additional_Data = ''
+                     WHERE {tagged_condition()}""")
+
+def tag_existing_rows(conn: sqlite3.Connection, table_name: str) -> int:
+    """Retag a whole table against the current watchlists and record their digests.
+
+    Only the distinct watched values are matched in Python; the rows that
+    carry a matching value are then fetched through indexed joins and updated
+    in place by their conflict key.
+    """
+    columns = list(WATCH_COLUMNS[table_name])
+    keys = TABLE_KEYS[table_name]
+    values = set()
+    for column in columns:
+        values.update(row[0] for row in execute_query(conn, f"SELECT DISTINCT {column} FROM {table_name} WHERE {column} IS NOT NULL;"))
+    hits = watchlist_hits(values)
+
+    selected = ", ".join(f"t.{column}" for column in dict.fromkeys(keys + tuple(columns)))
+    with temp_table(conn, 'watchlist_values', 'value TEXT PRIMARY KEY', [(value,) for value in hits]) as values_table:
+        rows = execute_query(conn, "\nUNION\n".join(
+            f"SELECT {selected} FROM {values_table} v CROSS JOIN {table_name} t ON t.{column} = v.value"
+            for column in columns))
+    offsets = {column: index for index, column in enumerate(dict.fromkeys(keys + tuple(columns)))}
+
+    updates = []
+    for row in rows:
+        level, additional_data = row_tags(hits, (row[offsets[column]] for column in columns))
+        updates.append((level, additional_data) + tuple(row[offsets[key]] for key in keys))
+
+    conn.execute(sql_create_watchlist_state)
+    with conn:
+        clear_watchlist_tags(conn, table_name)
+        conn.executemany(f"""UPDATE {table_name} SET Suspicion_Level = ?, Additional_Data = ?
+                             WHERE {" AND ".join(f"{key} IS ?" for key in keys)}""", updates)
+        conn.executemany("INSERT OR REPLACE INTO WatchlistState(Table_Name, Watchlist, Digest) VALUES(?,?,?)",
+                         [(table_name, watchlist.name, watchlist.digest) for watchlist in get_watchlists().values()])
+    if updates:
+        times = [update[2] for update in updates]
+        record_ingest_batch(conn, table_name, min(times), max(times))
+    logger.info(f"Tagged {len(updates)} {table_name} rows from watchlists.")
+    return len(updates)
+
+def tags_current(conn: sqlite3.Connection, table_name: str, watchlist: str) -> bool:
+    """True if the table was retagged with the watchlist's current contents, so its tags can replace a scan."""
+    try:
+        row = conn.execute("SELECT Digest FROM WatchlistState WHERE Table_Name = ? AND Watchlist = ?",
+                           (table_name, watchlist)).fetchone()
+    except sqlite3.Error:
+        return False
+    return row is not None and row[0] == get_watchlists()[watchlist].digest
+
+def watchlist_for_file(filename: str) -> Optional[str]:
+    for name, (path, _) in WATCHLISTS.items():
+        if os.path.abspath(path) == os.path.abspath(filename):
+            return name
+    return None
@@ -1,13 +1,15 @@
-import requests
 import sqlite3
 from urllib.parse import quote
 from datetime import datetime, timedelta
 import xml.etree.ElementTree as ET
-from dotenv import load_dotenv
 import os
 import time
+from module_database import record_ingest_batch
+from module_sketch import merge_batch_sketches, new_batch_entries
+from module_watchlist import tag_log_entries
+from module_utility import configure_logging
 
-load_dotenv()
+LOG_TABLE_NAMES = {'traffic': 'TrafficLogs', 'threat': 'ThreatLogs', 'globalprotect': 'GlobalProtectLogs'}
 
 # Database interaction functions
 def create_connection(db_file):
@@ -75,6 +77,7 @@ def insert_globalprotect_log(conn, log_entry):
 
 # Panorama API interaction functions
 def initiate_log_query(conn, log_type, start_time, end_time):
+    import requests
     PANORAMA_HOST = os.getenv('PANORAMA_ENDPOINT')
     API_KEY = os.getenv('PANORAMA_API_KEY')
     query_url = f"https://{PANORAMA_HOST}/api/?type=log&log-type={log_type}&key={quote(API_KEY)}&query=(time_generated geq '{start_time}') and (time_generated leq '{end_time}')&nlogs=5000"
@@ -88,6 +91,7 @@ def initiate_log_query(conn, log_type, start_time, end_time):
         return None
 
 def check_job_status(conn, job_id):
+    import requests
     PANORAMA_HOST = os.getenv('PANORAMA_ENDPOINT')
     API_KEY = os.getenv('PANORAMA_API_KEY')
     status_url = f"https://{PANORAMA_HOST}/api/?type=log&action=get&job-id={job_id}&key={quote(API_KEY)}"
@@ -105,21 +109,32 @@ def check_job_status(conn, job_id):
             return False
 
 def fetch_and_process_logs(conn, log_type, job_id):
+    import requests
     logs_url = f"https://{os.getenv('PANORAMA_ENDPOINT')}/api/?type=log&action=get&job-id={job_id}&key={quote(os.getenv('PANORAMA_API_KEY'))}"
     response = requests.get(logs_url, verify=True)
     if response.status_code == 200:
         root = ET.fromstring(response.text)
         entries = root.findall('.//entry')
-        for entry in entries:
+        prepare = {
+            'traffic': prepare_traffic_log_entry,
+            'threat': prepare_threat_log_entry,
+            'globalprotect': prepare_globalprotect_log_entry,
+        }[log_type]
+        # Tag watchlist hits while the rows are still in memory
+        log_entries = tag_log_entries(LOG_TABLE_NAMES[log_type], [prepare(entry) for entry in entries])
+        fresh_entries = new_batch_entries(conn, LOG_TABLE_NAMES[log_type], log_entries)
+        times = []
+        for log_entry in log_entries:
             if log_type == "traffic":
-                log_entry = prepare_traffic_log_entry(entry)
                 insert_traffic_log(conn, log_entry)
             elif log_type == "threat":
-                log_entry = prepare_threat_log_entry(entry)
                 insert_threat_log(conn, log_entry)
             elif log_type == "globalprotect":
-                log_entry = prepare_globalprotect_log_entry(entry)
                 insert_globalprotect_log(conn, log_entry)
+            times.append(log_entry[0])
+        if times:
+            record_ingest_batch(conn, LOG_TABLE_NAMES[log_type], min(times), max(times))
+            merge_batch_sketches(conn, LOG_TABLE_NAMES[log_type], fresh_entries)
 
 def prepare_traffic_log_entry(entry):
     return (
@@ -170,6 +185,10 @@ def prepare_globalprotect_log_entry(entry):
     )
 
 if __name__ == '__main__':
+    configure_logging()
+    from dotenv import load_dotenv
+    load_dotenv()
+    from module_scoring import score_ingest_run
     conn = create_connection("panorama_logs.db")
 
     # Define log types to be processed automatically
@@ -203,6 +222,11 @@ if __name__ == '__main__':
 
             start_datetime = next_hour  # Move to the next hour
 
+        # Scored once for the whole run rather than after every hour
+        if last_log_time < end_datetime:
+            score_ingest_run(conn, "panorama_logs.db", LOG_TABLE_NAMES[log_type],
+                             last_log_time.strftime('%Y/%m/%d %H:%M:%S'), end_datetime.strftime('%Y/%m/%d %H:%M:%S'))
+
         print(f"Completed fetching and processing {log_type.capitalize()} logs.")
 
     print("All log types have been processed.")
\ No newline at end of file
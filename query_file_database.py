@@ -1,7 +1,9 @@
 import sqlite3
 from datetime import datetime
-import ipaddress
 import csv
+from module_database import temp_table
+from module_indicators import IndicatorSet, parse_indicator
+from module_utility import configure_logging
 
 def create_connection(db_file):
     """Create a database connection to the specified SQLite database."""
@@ -12,30 +14,41 @@ def create_connection(db_file):
         print(e)
     return conn
 
-def query_database(conn, item, start_date, end_date):
-    """Query the database to find occurrences of the IP address or username within a date range."""
-    base_query = """
-    SELECT '{}', Time_Generated, COUNT(*)
-    FROM {} WHERE IP_Address = ? AND Time_Generated BETWEEN ? AND ?
-    """
-    params = [item, start_date + " 00:00:00", end_date + " 23:59:59"]
+def query_database_bulk(conn, items, start_date, end_date):
+    """Match every item against IP_Address in one indexed join per table.
 
-    query = (base_query.format('ThreatLogs', 'ThreatLogs') +
-             " UNION ALL " +
-             base_query.format('GlobalProtectLogs', 'GlobalProtectLogs'))
+    Items may be IPs, usernames, CIDRs or 'first-last' ranges; a network item
+    counts every logged address inside it. Returns
+    {item: [(table_name, time_generated, count), ...]} for the items that
+    occur, with ThreatLogs before GlobalProtectLogs.
+    """
+    params = [(start_date or "0000/00/00") + " 00:00:00", end_date + " 23:59:59"]
+    table_names = ('ThreatLogs', 'GlobalProtectLogs')
+    indicators = IndicatorSet(items)
+    pairs = [(item, item) for item in indicators.exact]
+    if indicators.networks:
+        values = set()
+        for table_name in table_names:
+            cursor = conn.execute(f"SELECT DISTINCT IP_Address FROM {table_name} WHERE Time_Generated BETWEEN ? AND ? AND IP_Address IS NOT NULL", params)
+            values.update(row[0] for row in cursor)
+        pairs.extend(indicators.match_networks(list(values)))
 
-    cursor = conn.cursor()
-    cursor.execute(query, params * 2)
-    results = cursor.fetchall()
-    return results
+    occurrences = {}
+    with temp_table(conn, 'search_items', 'item TEXT, value TEXT, PRIMARY KEY(value, item)', pairs) as items_table:
+        for table_name in table_names:
+            cursor = conn.execute(f"""
+            SELECT i.item, MAX(t.Time_Generated), COUNT(*)
+            FROM {items_table} i CROSS JOIN {table_name} t ON t.IP_Address = i.value
+            WHERE t.Time_Generated BETWEEN ? AND ?
+            GROUP BY i.item
+            """, params)
+            for item, time_generated, count in cursor:
+                occurrences.setdefault(item, []).append((table_name, time_generated, count))
+    return occurrences
 
 def is_ip_address(item):
-    """Check if the given item is a valid IP address."""
-    try:
-        ipaddress.ip_address(item)
-        return True
-    except ValueError:
-        return False
+    """Check if the given item is a valid IP address, network or range."""
+    return parse_indicator(item) is not None
 
 def write_to_csv(ip_occurrences, username_occurrences, start_date, end_date):
     """Write the unique IPs and usernames found in the database to a CSV file with their counts and log type."""
@@ -63,9 +76,9 @@ def read_and_search(filename, db_path, start_date=None, end_date=None):
         ip_occurrences = {}  # To track occurrences of each IP and log type
         username_occurrences = {}  # To track occurrences of each username and log type
 
+        found = query_database_bulk(conn, items, start_date, end_date)
         for item in items:
-            results = query_database(conn, item, start_date, end_date)
-            for result in results:
+            for result in found.get(item, []):
                 table_name, time_generated, count = result
                 if count > 0:
                     if is_ip_address(item):
@@ -90,6 +103,7 @@ def read_and_search(filename, db_path, start_date=None, end_date=None):
         print("Failed to create database connection.")
 
 if __name__ == '__main__':
+    configure_logging()
     filename = input("Enter the name of the file containing IPs/usernames: ")
     start_date = input("Enter start date (YYYY, YYYY/MM, YYYY/MM/DD), leave blank for entire database: ")
     end_date = input("Enter end date (YYYY/MM/DD), leave blank to use today's date: ")
@@ -0,0 +1,61 @@
+import math
+
+import pandas as pd
+import pytest
+
+from module_entropy_analysis import calculate_bucketed_entropy
+
+def logins(rows):
+    return pd.DataFrame(rows, columns=['Time_Generated', 'IP_Address', 'Source_Region', 'Source_User'])
+
+def test_bucketed_entropy_per_hour():
+    df = logins([
+        ('2024/03/01 10:05:00', '1.1.1.1', 'US', 'alice'),
+        ('2024/03/01 10:20:00', '1.1.1.1', 'US', 'bob'),
+        ('2024/03/01 10:40:00', '2.2.2.2', 'US', 'carol'),
+        ('2024/03/01 10:59:59', '2.2.2.2', 'US', 'dave'),
+        ('2024/03/01 12:00:00', '3.3.3.3', 'CA', 'alice'),
+        ('2024/03/01 12:30:00', '3.3.3.3', 'CA', 'alice'),
+    ])
+    entropy = calculate_bucketed_entropy(df)
+    assert list(entropy.index) == [pd.Timestamp('2024-03-01 10:00'), pd.Timestamp('2024-03-01 12:00')]
+    assert list(entropy.columns) == ['IP_Address', 'Source_Region', 'Source_User']
+    # Natural-log Shannon entropy of the values within each bucket
+    assert entropy.loc['2024-03-01 10:00'].tolist() == pytest.approx([math.log(2), 0.0, math.log(4)])
+    assert entropy.loc['2024-03-01 12:00'].tolist() == pytest.approx([0.0, 0.0, 0.0])
+
+def test_bucketed_entropy_bucket_width_and_invalid_times():
+    df = logins([
+        ('2024/03/01 10:05:00', '1.1.1.1', 'US', 'alice'),
+        ('2024/03/01 10:35:00', '1.1.1.1', 'US', 'bob'),
+        ('2024/03/01 10:40:00', '2.2.2.2', 'US', 'bob'),
+        ('not a time', '9.9.9.9', 'RU', 'mallory'),
+    ])
+    entropy = calculate_bucketed_entropy(df, ['IP_Address'], '30min')
+    assert list(entropy.index) == [pd.Timestamp('2024-03-01 10:00'), pd.Timestamp('2024-03-01 10:30')]
+    assert entropy['IP_Address'].tolist() == pytest.approx([0.0, math.log(2)])
+
+def test_bucketed_entropy_ignores_missing_values():
+    df = logins([
+        ('2024/03/01 10:05:00', '1.1.1.1', None, 'alice'),
+        ('2024/03/01 10:06:00', '2.2.2.2', 'US', 'alice'),
+    ])
+    entropy = calculate_bucketed_entropy(df)
+    assert entropy.iloc[0].tolist() == pytest.approx([math.log(2), 0.0, 0.0])
+
+def test_bucketed_entropy_matches_for_categorical_columns():
+    # query_to_dataframe returns categoricals; unused categories must not count
+    df = logins([
+        ('2024/03/01 10:05:00', '1.1.1.1', 'US', 'alice'),
+        ('2024/03/01 10:06:00', '2.2.2.2', 'US', 'bob'),
+        ('2024/03/01 11:06:00', '2.2.2.2', 'CA', 'bob'),
+    ])
+    categorical = df.copy()
+    for column in ['IP_Address', 'Source_Region', 'Source_User']:
+        categorical[column] = pd.Categorical(df[column], categories=sorted(set(df[column])) + ['unused'])
+    pd.testing.assert_frame_equal(calculate_bucketed_entropy(categorical), calculate_bucketed_entropy(df))
+
+@pytest.mark.parametrize('bucket', ['1min', '2D'])
+def test_bucketed_entropy_rejects_bucket_out_of_range(bucket):
+    with pytest.raises(ValueError):
+        calculate_bucketed_entropy(logins([]), bucket=bucket)
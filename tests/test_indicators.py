@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+from module_indicators import IndicatorSet, flatten_intervals
+
+def segments(intervals):
+    starts, ends, labels = flatten_intervals(intervals)
+    return list(zip(starts, ends, labels))
+
+def test_flatten_intervals_splits_nested_and_overlapping():
+    assert segments([(0, 99, 0), (10, 19, 1), (50, 149, 2)]) == [
+        (0, 9, (0,)),
+        (10, 19, (0, 1)),
+        (20, 49, (0,)),
+        (50, 99, (0, 2)),
+        (100, 149, (2,)),
+    ]
+
+def test_flatten_intervals_joins_adjacent_and_keeps_gaps():
+    assert segments([(0, 9, 0), (10, 19, 0)]) == [(0, 19, (0,))]
+    assert segments([(0, 9, 0), (20, 29, 1)]) == [(0, 9, (0,)), (20, 29, (1,))]
+
+def test_flatten_intervals_single_addresses_and_duplicates():
+    assert segments([(5, 5, 0), (5, 5, 1), (0, 10, 2)]) == [
+        (0, 4, (2,)),
+        (5, 5, (0, 1, 2)),
+        (6, 10, (2,)),
+    ]
+    assert segments([]) == []
+
+def test_indicator_set_keeps_single_addresses_exact():
+    indicators = IndicatorSet(['192.168.1.5', 'baduser', '10.0.0.0/8', '192.168.1.10-192.168.1.20'])
+    assert indicators.exact == ['192.168.1.5', 'baduser']
+    assert indicators.networks == ['10.0.0.0/8', '192.168.1.10-192.168.1.20']
+    assert len(indicators) == 4
+
+def test_match_networks_reports_every_containing_network():
+    indicators = IndicatorSet(['10.0.0.0/8', '10.1.0.0/16', '192.168.1.10-192.168.1.20', '2001:db8::/32'])
+    values = ['10.1.2.3', '10.2.0.1', '192.168.1.15', '192.168.1.21', '8.8.8.8', None, 'not-an-ip', '2001:db8::1', '2001:db9::1']
+    assert sorted(indicators.match_networks(values)) == sorted([
+        ('10.0.0.0/8', '10.1.2.3'),
+        ('10.1.0.0/16', '10.1.2.3'),
+        ('10.0.0.0/8', '10.2.0.1'),
+        ('192.168.1.10-192.168.1.20', '192.168.1.15'),
+        ('2001:db8::/32', '2001:db8::1'),
+    ])
+
+def test_match_networks_rejects_loose_ipv4_forms():
+    indicators = IndicatorSet(['10.0.0.0/8'])
+    # inet_aton would read these as 10.0.0.1; only strict dotted quads match
+    assert indicators.match_networks(['10.1', '10.0.0.1 ', '10.0.0.1']) == [('10.0.0.0/8', '10.0.0.1')]
+
+def test_match_networks_without_ipv4_networks():
+    indicators = IndicatorSet(['2001:db8::/32'])
+    assert indicators.match_networks(['10.0.0.1', '2001:db8::5']) == [('2001:db8::/32', '2001:db8::5')]
+    assert indicators.match_networks([]) == []
+    assert IndicatorSet(['1.2.3.4']).match_networks(['1.2.3.4']) == []
+
+def test_plain_indicators_do_not_import_numpy():
+    # Checked in a fresh interpreter, since other tests may already have imported NumPy
+    script = "import sys; from module_indicators import IndicatorSet; IndicatorSet(['1.2.3.4', 'user']); print('numpy' in sys.modules)"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, cwd=root)
+    assert result.stdout.strip() == 'False'
@@ -0,0 +1,78 @@
+import sqlite3
+
+import pytest
+
+from module_database import QueryCache, cached_query, execute_query, record_ingest_batch
+
+QUERY = "SELECT IP_Address FROM GlobalProtectLogs WHERE Time_Generated >= ? AND Time_Generated <= ? ORDER BY IP_Address"
+RANGE = ('2024/03/01 00:00:00', '2024/03/01 23:59:59')
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE GlobalProtectLogs (Time_Generated TEXT, IP_Address TEXT)")
+    conn.executemany("INSERT INTO GlobalProtectLogs VALUES(?,?)",
+                     [('2024/03/01 10:00:00', '1.1.1.1'), ('2024/03/02 10:00:00', '2.2.2.2')])
+    record_ingest_batch(conn, 'GlobalProtectLogs', '2024/03/01 10:00:00', '2024/03/02 10:00:00')
+    return conn
+
+def counting_loader(calls):
+    def loader(conn, query, params):
+        calls.append(params)
+        return execute_query(conn, query, params)
+    return loader
+
+def insert_batch(conn, time_generated, ip):
+    conn.execute("INSERT INTO GlobalProtectLogs VALUES(?,?)", (time_generated, ip))
+    record_ingest_batch(conn, 'GlobalProtectLogs', time_generated, time_generated)
+
+def test_query_cache_matches_on_watermark(tmp_path):
+    path = str(tmp_path / 'query_cache.db')
+    cache = QueryCache(path)
+    cache.put('key', (('GlobalProtectLogs', ('batch', 1)),), [(1,)])
+    assert cache.get('key', (('GlobalProtectLogs', ('batch', 1)),)) == (True, [(1,)])
+    assert cache.get('key', (('GlobalProtectLogs', ('batch', 2)),)) == (False, None)
+    assert cache.get('other', (('GlobalProtectLogs', ('batch', 1)),)) == (False, None)
+    assert QueryCache(path).get('key', (('GlobalProtectLogs', ('batch', 1)),)) == (True, [(1,)])
+
+def test_cached_query_reuses_result_until_an_overlapping_batch(conn):
+    cache, calls = QueryCache(), []
+    run = lambda: cached_query(conn, QUERY, RANGE, time_range=RANGE, loader=counting_loader(calls), cache=cache)
+    assert run() == [('1.1.1.1',)]
+    assert run() == [('1.1.1.1',)]
+    assert len(calls) == 1
+
+    # A batch outside the queried range leaves the result valid
+    insert_batch(conn, '2024/03/03 09:00:00', '3.3.3.3')
+    assert run() == [('1.1.1.1',)]
+    assert len(calls) == 1
+
+    insert_batch(conn, '2024/03/01 12:00:00', '4.4.4.4')
+    assert run() == [('1.1.1.1',), ('4.4.4.4',)]
+    assert len(calls) == 2
+
+def test_cached_query_without_time_range_sees_every_batch(conn):
+    cache, calls = QueryCache(), []
+    run = lambda: cached_query(conn, QUERY, RANGE, loader=counting_loader(calls), cache=cache)
+    run()
+    insert_batch(conn, '2024/03/03 09:00:00', '3.3.3.3')
+    run()
+    assert len(calls) == 2
+
+def test_cached_query_does_not_cache_failed_queries(conn):
+    cache = QueryCache()
+    query = "SELECT Source_User FROM GlobalProtectLogs WHERE Time_Generated >= ? AND Time_Generated <= ?"
+    assert cached_query(conn, query, RANGE, time_range=RANGE, cache=cache) == []
+
+    # Fixing the schema needs no new ingest batch for the query to run again
+    conn.execute("ALTER TABLE GlobalProtectLogs ADD COLUMN Source_User TEXT")
+    conn.execute("UPDATE GlobalProtectLogs SET Source_User = 'alice'")
+    assert cached_query(conn, query, RANGE, time_range=RANGE, cache=cache) == [('alice',)]
+
+def test_cached_query_runs_uncached_when_a_table_is_missing():
+    conn, cache = sqlite3.connect(':memory:'), QueryCache()
+    query = "SELECT x FROM Missing WHERE x >= ?"
+    assert cached_query(conn, query, (0,), cache=cache) == []
+    conn.execute("CREATE TABLE Missing (x INTEGER)")
+    conn.execute("INSERT INTO Missing VALUES(1)")
+    assert cached_query(conn, query, (0,), cache=cache) == [(1,)]
@@ -0,0 +1,75 @@
+import sqlite3
+from datetime import datetime
+
+from module_database import record_ingest_batch
+from module_report_cache import DayPiece, DayResultStore, day_results, split_days
+
+def test_split_days_marks_only_whole_days():
+    assert split_days(datetime(2024, 3, 1, 12), datetime(2024, 3, 3, 6)) == [
+        DayPiece(datetime(2024, 3, 1, 12), datetime(2024, 3, 1, 23, 59, 59), None),
+        DayPiece(datetime(2024, 3, 2), datetime(2024, 3, 2, 23, 59, 59), '2024/03/02'),
+        DayPiece(datetime(2024, 3, 3), datetime(2024, 3, 3, 6), None),
+    ]
+
+def test_split_days_edges():
+    whole = split_days(datetime(2024, 2, 28), datetime(2024, 3, 1, 23, 59, 59))
+    assert [piece.day for piece in whole] == ['2024/02/28', '2024/02/29', '2024/03/01']
+    assert split_days(datetime(2024, 3, 1, 8), datetime(2024, 3, 1, 9)) == [
+        DayPiece(datetime(2024, 3, 1, 8), datetime(2024, 3, 1, 9), None)]
+    # An end at midnight opens a one-second piece of the next day
+    assert split_days(datetime(2024, 3, 1), datetime(2024, 3, 2))[-1] == DayPiece(datetime(2024, 3, 2), datetime(2024, 3, 2), None)
+    assert split_days(datetime(2024, 3, 2), datetime(2024, 3, 1)) == []
+
+def test_day_result_store_matches_on_watermark_and_version(tmp_path):
+    path = str(tmp_path / 'report_cache.db')
+    store = DayResultStore(path)
+    store.put('section', 1, '2024/03/01', '()', (('batch', 3),), {'rows': [1, 2]})
+    assert store.get('section', 1, '2024/03/01', '()', (('batch', 3),)) == (True, {'rows': [1, 2]})
+    assert store.get('section', 1, '2024/03/01', '()', (('batch', 4),)) == (False, None)
+    assert store.get('section', 2, '2024/03/01', '()', (('batch', 3),)) == (False, None)
+    assert store.get('section', 1, '2024/03/01', "('other',)", (('batch', 3),)) == (False, None)
+
+    # A new store over the same file reads the persisted result
+    assert DayResultStore(path).get('section', 1, '2024/03/01', '()', (('batch', 3),)) == (True, {'rows': [1, 2]})
+
+    # Storing a new version drops the old one from the file
+    store.put('section', 2, '2024/03/01', '()', (('batch', 3),), 'v2')
+    assert DayResultStore(path).get('section', 1, '2024/03/01', '()', (('batch', 3),)) == (False, None)
+
+def test_day_results_recomputes_only_days_touched_by_new_batches():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE GlobalProtectLogs (Time_Generated TEXT)")
+    record_ingest_batch(conn, 'GlobalProtectLogs', '2024/03/01 00:00:00', '2024/03/04 23:59:59')
+    store = DayResultStore()
+    computed = []
+
+    def compute(conn, start, end):
+        computed.append((start, end))
+        return start.strftime('%Y/%m/%d %H:%M:%S')
+
+    start, end = datetime(2024, 3, 1), datetime(2024, 3, 4, 12)
+    run = lambda: day_results(conn, 'test', 1, ['GlobalProtectLogs'], start, end, compute, store=store)
+
+    first = run()
+    assert len(computed) == 4
+
+    computed.clear()
+    assert run() == first
+    # Only the partial last day is computed again
+    assert computed == [(datetime(2024, 3, 4), end)]
+
+    computed.clear()
+    record_ingest_batch(conn, 'GlobalProtectLogs', '2024/03/02 10:00:00', '2024/03/02 11:00:00')
+    record_ingest_batch(conn, 'ThreatLogs', '2024/03/03 10:00:00', '2024/03/03 11:00:00')
+    assert run() == first
+    assert computed == [(datetime(2024, 3, 2), datetime(2024, 3, 2, 23, 59, 59)), (datetime(2024, 3, 4), end)]
+
+def test_day_results_keeps_variants_apart():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE GlobalProtectLogs (Time_Generated TEXT)")
+    record_ingest_batch(conn, 'GlobalProtectLogs', '2024/03/01 00:00:00', '2024/03/01 23:59:59')
+    store = DayResultStore()
+    start, end = datetime(2024, 3, 1), datetime(2024, 3, 1, 23, 59, 59)
+    for variant in ('a', 'b'):
+        compute = lambda conn, start, end, variant=variant: variant
+        assert day_results(conn, 'test', 1, ['GlobalProtectLogs'], start, end, compute, variant=(variant,), store=store) == [variant]
@@ -0,0 +1,123 @@
+import random
+from collections import Counter
+
+from module_sketch import HyperLogLog, SpaceSaving
+
+def zipf_stream(seed, length, keys):
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, keys + 1)]
+    return [(f"10.0.0.{index}",) for index in rng.choices(range(keys), weights=weights, k=length)]
+
+def assert_bounds(sketch, exact):
+    for key, true_count in exact.items():
+        if key in sketch.counters:
+            count, error, _ = sketch.counters[key]
+            assert count - error <= true_count <= count
+        else:
+            assert true_count <= sketch.floor
+
+def test_space_saving_is_exact_below_capacity():
+    sketch = SpaceSaving(10)
+    for key, weight in [(('a',), 3), (('b',), 1), (('a',), 2), (('c',), 4)]:
+        sketch.update(key, weight)
+    assert sketch.top(3) == [(('a',), 5, 0, None), (('c',), 4, 0, None), (('b',), 1, 0, None)]
+    assert sketch.floor == 0
+    assert sketch.total == 10
+
+def test_space_saving_bounds_hold_past_capacity():
+    stream = zipf_stream(1, 5000, 200)
+    sketch = SpaceSaving(20)
+    for key in stream:
+        sketch.update(key)
+    assert len(sketch.counters) == 20
+    assert sketch.total == len(stream)
+    assert sketch.floor <= len(stream) / 20
+    assert_bounds(sketch, Counter(stream))
+
+def test_space_saving_keeps_latest_label():
+    sketch = SpaceSaving(10)
+    sketch.update(('1.2.3.4',), label='US')
+    sketch.update(('1.2.3.4',))
+    sketch.update(('1.2.3.4',), label='CA')
+    assert sketch.top(1) == [(('1.2.3.4',), 3, 0, 'CA')]
+
+def test_from_counts_keeps_largest_and_sets_floor():
+    counts = [(('a',), 5, 'x'), (('b',), 9, 'y'), (('c',), 2, None), (('d',), 7, None)]
+    sketch = SpaceSaving.from_counts(counts, capacity=2)
+    assert sketch.top(10) == [(('b',), 9, 0, 'y'), (('d',), 7, 0, None)]
+    assert sketch.floor == 5
+    assert sketch.total == 23
+
+def test_merge_bounds_hold_for_combined_stream():
+    first, second = zipf_stream(2, 3000, 150), zipf_stream(3, 3000, 150)
+    left, right = SpaceSaving(25), SpaceSaving(25)
+    for key in first:
+        left.update(key)
+    for key in second:
+        right.update(key)
+
+    merged = left.merge(right)
+    assert merged.total == len(first) + len(second)
+    assert len(merged.counters) <= 25
+    assert merged.floor >= left.floor + right.floor
+    assert_bounds(merged, Counter(first) + Counter(second))
+    # merge returns a new sketch and leaves both inputs untouched
+    assert left.total == len(first) and right.total == len(second)
+
+def test_merge_of_exact_sketches_adds_counts():
+    left = SpaceSaving.from_counts([(('a',), 4, 'US'), (('b',), 1, None)], capacity=10)
+    right = SpaceSaving.from_counts([(('a',), 6, 'CA'), (('c',), 2, None)], capacity=10)
+    merged = left.merge(right)
+    assert merged.top(10) == [(('a',), 10, 0, 'CA'), (('c',), 2, 0, None), (('b',), 1, 0, None)]
+
+def test_space_saving_json_round_trip():
+    sketch = SpaceSaving(5)
+    for key in zipf_stream(4, 500, 30):
+        sketch.update(key, label='US')
+    restored = SpaceSaving.from_json(sketch.to_json())
+    assert restored.capacity == sketch.capacity
+    assert restored.floor == sketch.floor
+    assert restored.total == sketch.total
+    assert restored.counters == sketch.counters
+
+    # The restored heap must still evict the smallest counter
+    smallest = min(count for count, _, _ in restored.counters.values())
+    restored.update(('new',))
+    assert len(restored.counters) == 5
+    assert restored.counters[('new',)] == [smallest + 1, smallest, None]
+
+def hll_of(values):
+    sketch = HyperLogLog()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+def test_hyperloglog_estimates_within_error():
+    for distinct in (10, 1000, 20000):
+        sketch = hll_of(f"user{index}" for index in range(distinct))
+        assert abs(sketch.estimate() - distinct) <= 3 * sketch.relative_error * distinct + 1
+
+def test_hyperloglog_ignores_repeats():
+    once = hll_of(f"user{index}" for index in range(500))
+    repeated = hll_of(f"user{index % 500}" for index in range(5000))
+    assert repeated.registers == once.registers
+
+def test_hyperloglog_merge_equals_union():
+    left = hll_of(f"user{index}" for index in range(0, 3000))
+    right = hll_of(f"user{index}" for index in range(2000, 6000))
+    union = hll_of(f"user{index}" for index in range(0, 6000))
+    # merge is in place and returns the sketch itself
+    assert left.merge(right) is left
+    assert left.registers == union.registers
+    assert left.merge(right).registers == union.registers
+
+def test_hyperloglog_bytes_round_trip_sparse_and_dense():
+    sparse = hll_of(['alice', 'bob', 'carol'])
+    dense = hll_of(f"user{index}" for index in range(5000))
+    for sketch, layout in ((sparse, 1), (dense, 0)):
+        payload = sketch.to_bytes()
+        assert payload[0] == layout
+        restored = HyperLogLog.from_bytes(payload)
+        assert restored.precision == sketch.precision
+        assert restored.registers == sketch.registers
+    assert len(sparse.to_bytes()) < len(dense.to_bytes())
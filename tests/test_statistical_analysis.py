@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+from module_statistical_analysis import OUTLIER_THRESHOLDS, outlier_scores, perform_statistical_analysis
+
+VALUES = pd.Series([4.0, 5.0, 5.0, 6.0, 7.0, 60.0], index=list('abcdef'))
+
+def test_zscore_uses_sample_mean_and_std():
+    expected = (VALUES - VALUES.mean()) / VALUES.std(ddof=1)
+    pd.testing.assert_series_equal(outlier_scores(VALUES, 'zscore'), expected)
+
+def test_zscore_uses_baseline_when_given():
+    pd.testing.assert_series_equal(outlier_scores(VALUES, 'zscore', (5.0, 2.0)), (VALUES - 5.0) / 2.0)
+
+def test_mad_score_is_modified_zscore():
+    # median 5.5; absolute deviations 1.5, 0.5, 0.5, 0.5, 1.5, 54.5 -> MAD 1.0
+    scores = outlier_scores(VALUES, 'mad')
+    assert scores['f'] == pytest.approx(0.6745 * 54.5)
+    assert scores['b'] == pytest.approx(-0.6745 * 0.5)
+    # A baseline does not change the robust score
+    pd.testing.assert_series_equal(outlier_scores(VALUES, 'mad', (5.0, 2.0)), scores)
+
+def test_mad_score_is_nan_when_mad_is_zero():
+    scores = outlier_scores(pd.Series([3.0, 3.0, 3.0, 9.0]), 'mad')
+    assert scores.isna().all()
+
+def failed_login_rows():
+    rows = [(f"10.0.0.{index}", 'US', 5 + index % 3, 5 + index % 3) for index in range(20)]
+    # The outlier fails from several regions; every row carries the IP's score
+    rows += [('6.6.6.6', 'CN', 400, 300), ('6.6.6.6', 'RU', 200, 300), ('6.6.6.6', None, 50, 300)]
+    return rows
+
+@pytest.mark.parametrize('method', sorted(OUTLIER_THRESHOLDS))
+def test_perform_statistical_analysis_reports_outliers(method):
+    summary = perform_statistical_analysis(failed_login_rows(), method=method)
+    assert list(summary.columns) == ['IP_Address', 'Source_Region', 'outlier_score', 'Total Attempts']
+    # The row without a region counts toward the IP's score but is not reported
+    assert summary[['IP_Address', 'Source_Region', 'Total Attempts']].values.tolist() == [
+        ['6.6.6.6', 'CN', 400], ['6.6.6.6', 'RU', 200]]
+    assert (summary['outlier_score'] > OUTLIER_THRESHOLDS[method]).all()
+    assert summary['outlier_score'].nunique() == 1
+
+def test_perform_statistical_analysis_scores_peak_day_against_baseline():
+    # With a baseline, the IP's busiest day (300) is scored, not its total
+    summary = perform_statistical_analysis(failed_login_rows(), baseline=(6.0, 2.0))
+    assert summary['outlier_score'].iloc[0] == pytest.approx((300 - 6.0) / 2.0)
+    assert set(summary['IP_Address']) == {'6.6.6.6'}
+
+def test_perform_statistical_analysis_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        perform_statistical_analysis(failed_login_rows(), method='iqr')